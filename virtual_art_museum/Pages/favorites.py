@@ -2,20 +2,34 @@
 MoVA Favorites - allows users to view, download, and remove favorite images chosen from the homepage.
 """
 
+import functools
+import hashlib
 import json
-import os
+import zipfile
 from io import BytesIO
 
-import requests
 import streamlit as st
 from PIL import Image, ImageDraw, ImageFont
 
-FAVORITES_CACHE_FILE = "favorites_cache.json"
+from favorites_store import FavoritesStore, session_user # pylint: disable=import-error
+from thumbnails import ThumbnailCache # pylint: disable=import-error
+
 TARGET_WIDTH = 300
 MAX_IMAGES_PER_ROW = 3
 SPACING = 20
 CAPTION_HEIGHT = 40
 BACKGROUND_COLOR = (240, 240, 240)
+# Download formats: file extension and mime type, JPEG / WebP are far smaller than PNG
+COLLAGE_FORMATS = {
+    "PNG": ("png", "image/png"),
+    "JPEG": ("jpg", "image/jpeg"),
+    "WEBP": ("webp", "image/webp"),
+    "PDF": ("pdf", "application/pdf"),  # a page per row of images
+    "ZIP": ("zip", "application/zip"),  # a PNG tile per row of images
+}
+COLLAGE_QUALITY = 85
+# Larger favorites lists are rendered a row at a time, so memory does not grow with them
+STREAMING_THRESHOLD = 30
 
 # st.set_page_config(page_title="MoVA - Favorites", layout="wide")
 
@@ -34,26 +48,78 @@ st.markdown(
 
 st.markdown("<p class='title-font'>❤️ Favorites</p>", unsafe_allow_html=True)
 
-def load_favorites() -> list:
-    """Load favorites from the cache file."""
-    if os.path.exists(FAVORITES_CACHE_FILE):
-        with open(FAVORITES_CACHE_FILE, "r", encoding="utf-8") as file:
-            return json.load(file)
-    return []
-    
-def save_favorites(favorites: list) -> None:
-    """Save favorites to the cache file."""
-    with open(FAVORITES_CACHE_FILE, "w", encoding="utf-8") as file:
-        json.dump(favorites, file)
-
-def create_collage(images: list, captions: list) -> BytesIO:
-    """Create a collage of images with captions."""
-    resized_images = []
-    for img in images:
-        aspect_ratio = img.height / img.width
-        new_height = int(TARGET_WIDTH * aspect_ratio)
-        resized_img = img.resize((TARGET_WIDTH, new_height), Image.Resampling.LANCZOS)
-        resized_images.append(resized_img)
+# Shares the favorites database with the homepage
+@st.cache_resource
+def load_favorites_store() -> FavoritesStore:
+    """Open the favorites database shared by every session."""
+    return FavoritesStore()
+
+def remove_favorite(favorite: dict) -> None:
+    """Remove one favorite of the session's user and rerun."""
+    load_favorites_store().remove(st.session_state.user_id, favorite["object_id"])
+    st.rerun()
+
+# Shares the on-disk thumbnails with the homepage, a favorite shown there is never fetched again
+@st.cache_resource
+def load_image_cache() -> ThumbnailCache:
+    """Create the image cache shared by every session."""
+    return ThumbnailCache()
+
+def load_image_paths(favorites: list, cache: ThumbnailCache) -> list:
+    """
+    Fetch the uncached images of favorites concurrently into the image cache.
+
+    Returns one local path per favorite, None where the image could not be fetched.
+    """
+    contents = cache.fetch_many(favorite["image_url"] for favorite in favorites)
+    width = cache.width_for(TARGET_WIDTH)
+    return [None if contents.get(favorite["image_url"]) is None
+            else cache.path(contents[favorite["image_url"]], width)
+            for favorite in favorites]
+
+# Resized once per image, and shared by every collage the image appears in
+@functools.lru_cache(maxsize=256) # about 100 MB of 300 px wide images at most
+def collage_image(path: str) -> Image.Image:
+    """Load a cached image resized to the collage width."""
+    with Image.open(path) as img:
+        img = img.convert("RGB")
+    if img.width != TARGET_WIDTH:
+        img = img.resize((TARGET_WIDTH, int(TARGET_WIDTH * img.height / img.width)),
+                         Image.Resampling.LANCZOS)
+    return img
+
+def favorites_key(favorites: list) -> str:
+    """Hash identifying a favorites list, images and captions in order."""
+    data = json.dumps([[favorite["image_url"], favorite["Title"]] for favorite in favorites])
+    return hashlib.sha256(data.encode("utf-8")).hexdigest()
+
+# Only the hash and format are hashed by Streamlit, so a cache hit costs the same for any size
+@st.cache_data(max_entries=64)
+def render_collage(key: str, image_format: str, _paths: tuple, _captions: tuple) -> bytes: # pylint: disable=unused-argument
+    """Create the collage of a favorites list, memoized by its key and the format."""
+    rows = [(path, caption) for path, caption in zip(_paths, _captions) if path is not None]
+    paths = [path for path, _ in rows]
+    captions = [caption for _, caption in rows]
+    if image_format in ("PDF", "ZIP") or len(paths) > STREAMING_THRESHOLD:
+        output = BytesIO()
+        stream_collage(paths, captions, output, image_format)
+        return output.getvalue()
+    return create_collage([collage_image(path) for path in paths], captions,
+                          image_format).getvalue()
+
+def load_font() -> ImageFont.ImageFont:
+    """Load the caption font, Pillow's default when Arial is not installed."""
+    try:
+        return ImageFont.truetype("arial.ttf", 20)
+    except OSError:
+        return ImageFont.load_default()
+
+def create_collage(images: list, captions: list, image_format: str = "PNG") -> BytesIO:
+    """Create a collage of images with captions, images already at TARGET_WIDTH are not resized."""
+    resized_images = [img if img.width == TARGET_WIDTH
+                      else img.resize((TARGET_WIDTH, int(TARGET_WIDTH * img.height / img.width)),
+                                      Image.Resampling.LANCZOS)
+                      for img in images]
 
     canvas_width = (TARGET_WIDTH + SPACING) * MAX_IMAGES_PER_ROW + SPACING
     canvas_height = 0
@@ -68,10 +134,7 @@ def create_collage(images: list, captions: list) -> BytesIO:
     canvas = Image.new("RGB", (canvas_width, canvas_height), BACKGROUND_COLOR)
     draw = ImageDraw.Draw(canvas)
 
-    try:
-        font = ImageFont.truetype("arial.ttf", 20)
-    except OSError:
-        font = ImageFont.load_default()
+    font = load_font()
 
     x_offset = SPACING
     y_offset = SPACING
@@ -94,12 +157,96 @@ def create_collage(images: list, captions: list) -> BytesIO:
         row_height = max(row_height, img.height)
 
     img_byte_arr = BytesIO()
-    canvas.save(img_byte_arr, format="PNG")
+    save_image(canvas, img_byte_arr, image_format)
     img_byte_arr.seek(0)
     return img_byte_arr
 
-def display_favorites(favorites: list) -> None:
-    """Display favorites in a 3-column layout."""
+def save_image(image: Image.Image, output, image_format: str) -> None:
+    """Save an image, lossy formats at COLLAGE_QUALITY."""
+    if image_format == "PNG":
+        image.save(output, format="PNG")
+    else:
+        image.save(output, format=image_format, quality=COLLAGE_QUALITY)
+
+def open_scaled(path: str) -> Image.Image:
+    """Open an image at the collage width, letting JPEGs decode at a reduced size."""
+    with Image.open(path) as img:
+        img.draft("RGB", (TARGET_WIDTH, max(1, TARGET_WIDTH * img.height // img.width)))
+        img = img.convert("RGB")
+    if img.width != TARGET_WIDTH:
+        img = img.resize((TARGET_WIDTH, max(1, int(TARGET_WIDTH * img.height / img.width))),
+                         Image.Resampling.LANCZOS)
+    return img
+
+def scaled_height(path: str) -> int:
+    """Height of an image at the collage width, only the image header is read."""
+    with Image.open(path) as img:
+        return max(1, int(TARGET_WIDTH * img.height / img.width))
+
+def render_row(paths: list, captions: list, font: ImageFont.ImageFont) -> Image.Image:
+    """Render one row of the collage, with its captions and the spacing above it."""
+    images = [open_scaled(path) for path in paths]
+    row_height = max(img.height for img in images)
+    row = Image.new("RGB", ((TARGET_WIDTH + SPACING) * MAX_IMAGES_PER_ROW + SPACING,
+                            SPACING + row_height + CAPTION_HEIGHT), BACKGROUND_COLOR)
+    draw = ImageDraw.Draw(row)
+    for i, (img, caption) in enumerate(zip(images, captions)):
+        x_offset = SPACING + i * (TARGET_WIDTH + SPACING)
+        row.paste(img, (x_offset, SPACING))
+        text_bbox = draw.textbbox((0, 0), caption, font=font)
+        text_x = x_offset + (TARGET_WIDTH - (text_bbox[2] - text_bbox[0])) // 2
+        draw.text((text_x, SPACING + img.height + 10), caption, fill="black", font=font)
+        img.close()
+    return row
+
+def stream_collage(paths: list, captions: list, output, image_format: str = "PNG") -> None:
+    """
+    Write a collage to a binary file object, decoding one row of images at a time.
+
+    PDF writes a page per row and ZIP a PNG tile per row, so memory is bounded by a
+    single row. Other formats are written as one image, so the canvas is held, but
+    never more than one row of source images.
+    """
+    font = load_font()
+    rows = [(paths[i:i + MAX_IMAGES_PER_ROW], captions[i:i + MAX_IMAGES_PER_ROW])
+            for i in range(0, len(paths), MAX_IMAGES_PER_ROW)]
+
+    if image_format == "PDF":
+        if not rows:
+            Image.new("RGB", (1, 1), BACKGROUND_COLOR).save(output, format="PDF")
+        for i, (row_paths, row_captions) in enumerate(rows):
+            row = render_row(row_paths, row_captions, font)
+            row.save(output, format="PDF", append=i > 0)
+            row.close()
+    elif image_format == "ZIP":
+        with zipfile.ZipFile(output, "w") as archive:
+            for i, (row_paths, row_captions) in enumerate(rows):
+                row = render_row(row_paths, row_captions, font)
+                tile = BytesIO()
+                row.save(tile, format="PNG")
+                row.close()
+                archive.writestr(f"favorites_{i + 1:04d}.png", tile.getvalue())
+    else:
+        save_image(stitch_rows(rows, font), output, image_format)
+
+def stitch_rows(rows: list, font: ImageFont.ImageFont) -> Image.Image:
+    """Render the rows of a collage one at a time onto a canvas sized from the image headers."""
+    heights = [SPACING + max(scaled_height(path) for path in row_paths) + CAPTION_HEIGHT
+               for row_paths, _ in rows]
+    canvas = Image.new("RGB", ((TARGET_WIDTH + SPACING) * MAX_IMAGES_PER_ROW + SPACING,
+                               sum(heights) + SPACING), BACKGROUND_COLOR)
+    y_offset = 0
+    for (row_paths, row_captions), height in zip(rows, heights):
+        row = render_row(row_paths, row_captions, font)
+        canvas.paste(row, (0, y_offset))
+        row.close()
+        y_offset += height
+    return canvas
+
+def display_favorites(favorites: list, sources: list = None) -> None:
+    """Display favorites in a 3-column layout, sources are the images shown (default image_url)."""
+    if sources is None:
+        sources = [favorite["image_url"] for favorite in favorites]
     n = len(favorites)
     rows = n // MAX_IMAGES_PER_ROW
     i = 0
@@ -109,11 +256,9 @@ def display_favorites(favorites: list) -> None:
         for pic in pics:
             with pic:
                 favorite = favorites[i]
-                st.image(favorite["image_url"], caption=favorite["Title"])
+                st.image(sources[i], caption=favorite["Title"])
                 if st.button(f"❌", key=f"remove_{i}"):
-                    favorites.pop(i)
-                    save_favorites(favorites)
-                    st.rerun()
+                    remove_favorite(favorite)
                 i += 1
 
     leftovers = n % MAX_IMAGES_PER_ROW
@@ -122,44 +267,46 @@ def display_favorites(favorites: list) -> None:
         for j in range(leftovers):
             with lastrow[j]:
                 favorite = favorites[i]
-                st.image(favorite["image_url"], caption=favorite["Title"])
+                st.image(sources[i], caption=favorite["Title"])
                 if st.button(f"❌", key=f"remove_{i}"):
-                    favorites.pop(i)
-                    save_favorites(favorites)
-                    st.rerun()
+                    remove_favorite(favorite)
                 i += 1
 
 def main() -> None:
     """Main function to render the favorites page."""
-    if "favorites" not in st.session_state:
-        st.session_state.favorites = load_favorites()
+    user = session_user(st.session_state, st.query_params)
+    favorites = load_favorites_store().favorites(user)
 
-    if st.session_state.favorites:
+    if favorites:
         if st.button("❌ Remove All Favorites", key="remove_all", help="Remove all favorited artworks"):
-            st.session_state.favorites = []
-            save_favorites(st.session_state.favorites)
+            load_favorites_store().clear(user)
             st.rerun()
 
-        images = []
-        captions = []
-        for favorite in st.session_state.favorites:
-            try:
-                response = requests.get(favorite["image_url"], timeout=10)
-                img = Image.open(BytesIO(response.content))
-                images.append(img)
-                captions.append(favorite["Title"])
-            except requests.RequestException as e:
-                st.error(f"Failed to load image: {e}")
-
-        img_byte_arr = create_collage(images, captions)
-        st.download_button(
-            label="Download",
-            data=img_byte_arr,
-            file_name="favorites.png",
-            mime="image/png",
-        )
-
-        display_favorites(st.session_state.favorites)
+        paths = load_image_paths(favorites, load_image_cache())
+        for favorite, path in zip(favorites, paths):
+            if path is None:
+                st.error(f"Failed to load image: {favorite['Title']}")
+
+        # The collage is only made when asked for, and again only if the favorites change
+        key = favorites_key(favorites)
+        image_format = st.radio("Collage format", list(COLLAGE_FORMATS), horizontal=True)
+        if st.session_state.get("collage_key") != key:
+            if st.button("Create collage"):
+                st.session_state.collage_key = key
+                st.rerun()
+        else:
+            extension, mime = COLLAGE_FORMATS[image_format]
+            st.download_button(
+                label="Download",
+                data=render_collage(key, image_format, tuple(paths),
+                                    tuple(favorite["Title"] for favorite in favorites)),
+                file_name=f"favorites.{extension}",
+                mime=mime,
+            )
+
+        sources = [favorite["image_url"] if path is None else path
+                   for favorite, path in zip(favorites, paths)]
+        display_favorites(favorites, sources)
     else:
         st.write("No favorites yet. Add some using the ❤️ button!")
 
@@ -0,0 +1,5 @@
+"""
+Benchmarks for the data acquisition pipeline, run from the virtual_art_museum directory:
+
+    python -m benchmarks.bench_met_process_data
+"""
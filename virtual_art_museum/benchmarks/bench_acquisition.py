@@ -0,0 +1,287 @@
+"""
+===============================================
+Acquisition pipeline - Benchmarks
+===============================================
+Runs every stage of the data acquisition pipeline on synthetic datasets of a
+few sizes and reports throughput, p50 / p99 latency and peak RSS per stage, so
+regressions show up as numbers rather than as a slower nightly run.
+
+Stages, in pipeline order:
+
+    fetch_met: async_utils.run over the MET objects API
+    process_data: MetMuseum.process_data
+    fetch_europeana: async_utils.run over the Europeana image urls
+    image_processing_europeana: common_functions.image_processing_europeana
+    filter_data: mova_home.filter_data, the homepage query over both datasets
+
+The fetch stages talk to the local stand-in in benchmarks.mock_server, with
+configurable latency, 500s and 429s. Their latency is per object (retries and
+rate limiter waits included), filter_data's is per query, and that of the
+other stages is per call over --repeat runs. Every stage runs in a fresh process
+so its peak RSS is its own.
+
+    python -m benchmarks.bench_acquisition --sizes 10000 100000 1000000
+    python -m benchmarks.bench_acquisition --output before.json
+    python -m benchmarks.bench_acquisition --baseline before.json
+
+Functions
+----------
+    prepare_datasets: Writes the synthetic raw datasets of one size
+    run_stage: Runs one stage in a fresh process and collects its metrics
+    compare: Flags stages that got slower or bigger than a baseline
+    main: Runs the benchmark
+
+Authors
+----------
+    Madison Sanchez-Forman and Mya Strayer
+"""
+import argparse
+import asyncio
+import json
+import os
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+
+from benchmarks.bench_europeana_years import unloaded_europeana
+from benchmarks.bench_met_streaming import measure
+from benchmarks.mock_server import MockServer, MockSettings
+from benchmarks.synthetic import make_europeana_objects, make_met_objects
+from data_aquisition import async_utils # pylint: disable=import-error
+from data_aquisition.common_functions import image_processing_europeana # pylint: disable=import-error
+from data_aquisition.met_museum import MetMuseum # pylint: disable=import-error
+from data_aquisition.rate_limit import RateLimiter # pylint: disable=import-error
+from data_aquisition.storage import ( # pylint: disable=import-error
+    load_dataset,
+    memory_map_dataset,
+    save_dataset
+)
+
+STAGES = ['fetch_met', 'process_data', 'fetch_europeana', 'image_processing_europeana',
+          'filter_data']
+SEARCH_TERMS = ['', '', 'portrait', 'vase', 'city', 'harbour', 'print', 'bronze']
+
+def prepare_datasets(tmp_dir: str, rows: int, server: MockServer) -> dict:
+    """
+    Writes the synthetic raw datasets of one size, as Feather.
+
+    Parameters
+    ----------
+    tmp_dir (str): Directory the datasets are written to
+    rows (int): Number of objects of each source
+    server (MockServer): The running mock server, Europeana image urls point at it
+
+    Returns
+    -------
+    dict: Paths of the raw and (once their stages ran) cleaned datasets
+    """
+    paths = {name: os.path.join(tmp_dir, f"{name}_{rows}.feather")
+             for name in ('met_raw', 'europeana_raw', 'met_clean', 'europeana_clean')}
+    make_met_objects(rows).to_feather(paths['met_raw'])
+    europeana = make_europeana_objects(rows)
+    europeana['image_url'] = [server.image_url(i) for i in range(rows)]
+    europeana.to_feather(paths['europeana_raw'])
+    return paths
+
+def _percentiles(latencies) -> dict:
+    """ p50 / p99 of latencies in seconds, as milliseconds """
+    p50, p99 = np.percentile(np.asarray(latencies) * 1000, [50, 99])
+    return {'p50_ms': float(p50), 'p99_ms': float(p99)}
+
+def _fetch(flag: str, path: str, max_rows: int, met_objects_url: str, # pylint: disable=too-many-arguments
+           rate: float, concurrency: int) -> dict:
+    """ Times async_utils.run over the mock server, per object """
+    df = memory_map_dataset(path).slice(0, max_rows).to_pandas()
+    os.environ['MET_OBJECTS_URL'] = met_objects_url
+    latencies = []
+    fetch = async_utils.fetch
+
+    async def timed_fetch(*args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return await fetch(*args, **kwargs)
+        finally:
+            latencies.append(time.perf_counter() - start)
+
+    # stream_fetch looks fetch up in the module, so every request goes through the timer
+    async_utils.fetch = timed_fetch
+    limiter = RateLimiter(host_limits={}, default_limits=(rate, concurrency))
+    start = time.perf_counter()
+    asyncio.run(async_utils.run(df, flag, limiter=limiter, workers=concurrency))
+    seconds = time.perf_counter() - start
+    return {'rows': len(df), 'seconds': seconds, 'unit': 'objects', **_percentiles(latencies)}
+
+def _timed_calls(function, repeat: int):
+    """ Calls function repeat times, returns the per-call times and the last result """
+    times, result = [], None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = function()
+        times.append(time.perf_counter() - start)
+    return times, result
+
+def _process_data(paths: dict, repeat: int) -> dict:
+    """ Times MetMuseum.process_data, saves the result for the later stages """
+    raw = pd.read_feather(paths['met_raw'])
+    times, met = _timed_calls(lambda: MetMuseum(raw).process_data(), repeat)
+    save_dataset(met, paths['met_clean'])
+    return {'rows': len(raw), 'seconds': min(times), 'unit': 'rows', **_percentiles(times)}
+
+def _image_processing(paths: dict, repeat: int) -> dict:
+    """ Times image_processing_europeana, saves the result for the later stages """
+    met = load_dataset(paths['met_clean'])
+    processed = unloaded_europeana(pd.read_feather(paths['europeana_raw'])).process_data()
+    times, (europeana, _) = _timed_calls(
+        lambda: image_processing_europeana(met, processed.copy()), repeat)
+    # Year holds the century after processing, the homepage filters on the numeric year
+    europeana['Year'] = pd.to_numeric(processed['year'], errors='coerce').fillna(-1).astype(int)
+    save_dataset(europeana, paths['europeana_clean'])
+    return {'rows': len(processed), 'seconds': min(times), 'unit': 'rows',
+            **_percentiles(times)}
+
+def _filter_data(paths: dict, queries: int) -> dict:
+    """ Times mova_home.filter_data over random homepage filters, per query """
+    from collection import Collection # pylint: disable=import-outside-toplevel
+    from mova_home import filter_data # pylint: disable=import-outside-toplevel
+
+    # results are not kept, so every query is worked out
+    collection = Collection([paths['met_clean'], paths['europeana_clean']], cache_size=0)
+    rng = np.random.default_rng(0)
+    cultures = collection.facet_data['Culture'].unique().tolist()
+    latencies = []
+    for _ in range(queries):
+        search = SEARCH_TERMS[rng.integers(len(SEARCH_TERMS))]
+        culture = list(rng.choice(cultures, size=rng.integers(0, 3), replace=False))
+        first = int(rng.integers(-3000, 2000))
+        years = (first, first + int(rng.integers(50, 1000))) if rng.random() < 0.7 else None
+        datasource = [None, 'MET', 'Europeana'][rng.integers(3)]
+        start = time.perf_counter()
+        filter_data(collection, search, culture, years, datasource)
+        latencies.append(time.perf_counter() - start)
+    return {'rows': queries, 'seconds': sum(latencies), 'unit': 'queries',
+            **_percentiles(latencies)}
+
+def run_stage(stage: str, paths: dict, server: MockServer, args) -> dict:
+    """
+    Runs one stage in a fresh process and collects its metrics.
+
+    Parameters
+    ----------
+    stage (str): One of STAGES
+    paths (dict): Dataset paths from prepare_datasets
+    server (MockServer): The running mock server
+    args (argparse.Namespace): The command line options
+
+    Returns
+    -------
+    dict: rows, seconds, unit, throughput, p50_ms, p99_ms and peak_rss_mb
+    """
+    if stage in ('fetch_met', 'fetch_europeana'):
+        flag, path = (('MET', paths['met_raw']) if stage == 'fetch_met'
+                      else ('EUROPEANA', paths['europeana_raw']))
+        call = (_fetch, flag, path, args.max_fetch_rows, server.met_objects_url,
+                args.rate, args.concurrency)
+    elif stage == 'process_data':
+        call = (_process_data, paths, args.repeat)
+    elif stage == 'image_processing_europeana':
+        call = (_image_processing, paths, args.repeat)
+    else:
+        call = (_filter_data, paths, args.queries)
+    _, peak_rss, metrics = measure(*call)
+    metrics['throughput'] = metrics['rows'] / metrics['seconds']
+    metrics['peak_rss_mb'] = peak_rss
+    return metrics
+
+def compare(results: dict, baseline: dict, tolerance: float) -> list:
+    """
+    Flags stages that got slower or bigger than a baseline.
+
+    Parameters
+    ----------
+    results (dict): size -> stage -> metrics of this run
+    baseline (dict): The same for an earlier run, e.g. loaded from --output
+    tolerance (float): Relative change that is still noise, e.g. 0.1
+
+    Returns
+    -------
+    list of str: One line per regression
+    """
+    regressions = []
+    for size, stages in results.items():
+        for stage, metrics in stages.items():
+            before = baseline.get(size, {}).get(stage)
+            if before is None:
+                continue
+            if metrics['throughput'] < before['throughput'] * (1 - tolerance):
+                regressions.append(f"{stage} at {size} rows: throughput "
+                                   f"{before['throughput']:.0f} -> {metrics['throughput']:.0f} "
+                                   f"{metrics['unit']}/s")
+            if metrics['p99_ms'] > before['p99_ms'] * (1 + tolerance):
+                regressions.append(f"{stage} at {size} rows: p99 "
+                                   f"{before['p99_ms']:.1f} -> {metrics['p99_ms']:.1f}ms")
+            if metrics['peak_rss_mb'] > before['peak_rss_mb'] * (1 + tolerance):
+                regressions.append(f"{stage} at {size} rows: peak RSS "
+                                   f"{before['peak_rss_mb']:.0f} -> {metrics['peak_rss_mb']:.0f}MB")
+    return regressions
+
+def _print_row(stage: str, metrics: dict) -> None:
+    """ Prints the metrics of one stage """
+    throughput = f"{metrics['throughput']:.0f} {metrics['unit']}/s"
+    print(f"{stage:<28}{metrics['rows']:>9}{metrics['seconds']:>10.2f}{throughput:>22}"
+          f"{metrics['p50_ms']:>10.1f}{metrics['p99_ms']:>10.1f}{metrics['peak_rss_mb']:>9.0f}MB")
+
+def main():
+    """ Runs the benchmark """
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[2])
+    parser.add_argument('--sizes', type=int, nargs='+', default=[10000, 100000, 1000000],
+                        help="rows of each synthetic dataset")
+    parser.add_argument('--stages', nargs='+', default=STAGES, choices=STAGES,
+                        help="stages to run, later stages need the output of earlier ones")
+    parser.add_argument('--max-fetch-rows', type=int, default=100000,
+                        help="objects sent through the fetch stages at most")
+    parser.add_argument('--repeat', type=int, default=3, help="runs of the batch stages")
+    parser.add_argument('--queries', type=int, default=200, help="filter_data queries")
+    parser.add_argument('--latency', type=float, default=0.02, help="mock response seconds")
+    parser.add_argument('--jitter', type=float, default=0.01, help="mock latency +/- seconds")
+    parser.add_argument('--error-rate', type=float, default=0.005, help="share of 500s")
+    parser.add_argument('--throttle-rate', type=float, default=0.001, help="share of 429s")
+    parser.add_argument('--retry-after', type=float, default=0.1, help="Retry-After of a 429")
+    parser.add_argument('--image-hosts', type=int, default=4,
+                        help="loopback addresses the Europeana images are spread over")
+    parser.add_argument('--rate', type=float, default=2000, help="requests per second per host")
+    parser.add_argument('--concurrency', type=int, default=100, help="concurrent requests")
+    parser.add_argument('--output', help="json file to save the results to")
+    parser.add_argument('--baseline', help="json file of earlier results to compare with")
+    parser.add_argument('--tolerance', type=float, default=0.1,
+                        help="relative change reported as a regression")
+    args = parser.parse_args()
+
+    settings = MockSettings(latency=args.latency, jitter=args.jitter, error_rate=args.error_rate,
+                            throttle_rate=args.throttle_rate, retry_after=args.retry_after)
+    results = {}
+    with MockServer(settings, image_hosts=args.image_hosts) as server, \
+            tempfile.TemporaryDirectory() as tmp_dir:
+        for size in args.sizes:
+            paths = prepare_datasets(tmp_dir, size, server)
+            results[str(size)] = {stage: run_stage(stage, paths, server, args)
+                                  for stage in STAGES if stage in args.stages}
+            print(f"\nrows: {size}")
+            print(f"{'stage':<28}{'rows':>9}{'seconds':>10}{'throughput':>22}"
+                  f"{'p50 ms':>10}{'p99 ms':>10}{'peak RSS':>11}")
+            for stage, metrics in results[str(size)].items():
+                _print_row(stage, metrics)
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as file:
+            json.dump(results, file, indent=2)
+    if args.baseline:
+        with open(args.baseline, "r", encoding="utf-8") as file:
+            regressions = compare(results, json.load(file), args.tolerance)
+        print("\nNo regressions" if not regressions else "\nRegressions:")
+        for regression in regressions:
+            print(f"\t{regression}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,78 @@
+"""
+===============================================
+Europeana.process_data - Benchmarks
+===============================================
+Compares Europeana.process_data, which extracts years with Series.str.extract and
+maps centuries through a lookup table, with the row-by-row version it replaced
+(three re.search calls per row through df.apply(axis=1), then century_mapping per
+row), checks that both give identical output and prints the speedup.
+
+    python -m benchmarks.bench_europeana_years --rows 1000000
+
+Functions
+----------
+    process_data_rowwise: The row-by-row processing, kept as the reference
+    main: Runs the benchmark
+
+Authors
+----------
+    Madison Sanchez-Forman and Mya Strayer
+"""
+import argparse
+
+import pandas as pd
+
+from benchmarks.bench_met_process_data import time_call
+from benchmarks.synthetic import make_europeana_objects
+from data_aquisition.common_functions import century_mapping # pylint: disable=import-error
+from data_aquisition.europeana import Europeana # pylint: disable=import-error
+
+def unloaded_europeana(df: pd.DataFrame) -> Europeana:
+    """ Creates a Europeana holding df, without querying the API """
+    europeana = Europeana.__new__(Europeana)
+    europeana.df = df.copy()
+    return europeana
+
+def process_data_rowwise(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    The original row-by-row Europeana.process_data.
+
+    Parameters
+    ----------
+    df (pd.DataFrame): The Europeana search results
+
+    Returns
+    -------
+    pd.DataFrame: The processed objects
+    """
+    europeana = unloaded_europeana(df)
+    europeana.df.fillna('Unknown', inplace=True)
+    cols_to_keep = ['europeana_id', 'image_url',
+                    'title', 'creator',
+                    'description', 'country', 'provider']
+    europeana.df = europeana.df[cols_to_keep]
+    europeana.df['year'] = europeana.df.apply(europeana.extract_year, axis=1).astype(int)
+    europeana.df['repository'] = 'EUROPEANA'
+    europeana.df['Century'] = europeana.df['year'].apply(century_mapping)
+    return europeana.df.replace(-1, "Unknown")
+
+def main():
+    """ Runs the benchmark """
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[2])
+    parser.add_argument('--rows', type=int, default=1000000, help="number of synthetic objects")
+    parser.add_argument('--repeat', type=int, default=1, help="runs per implementation")
+    args = parser.parse_args()
+
+    df = make_europeana_objects(args.rows)
+    rowwise_time, expected = time_call(lambda: process_data_rowwise(df), args.repeat)
+    vectorized_time, result = time_call(lambda: unloaded_europeana(df).process_data(),
+                                        args.repeat)
+    pd.testing.assert_frame_equal(result, expected)
+
+    print(f"rows:       {args.rows}")
+    print(f"row-wise:   {rowwise_time:.2f}s")
+    print(f"vectorized: {vectorized_time:.2f}s")
+    print(f"speedup:    {rowwise_time / vectorized_time:.1f}x (identical output)")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,143 @@
+"""
+===============================================
+MET streaming ingestion - Benchmarks
+===============================================
+Compares the peak memory and time of cleaning a MET objects file loaded whole
+(MetMuseum(path) then filter_and_save, every column parsed into Python strings)
+with stream_pipeline (only the used columns, a chunk of rows at a time). The
+synthetic file is padded with unused text columns to the 54 columns of
+MetObjects.txt and already has image urls, so nothing is requested from the API.
+Each run happens in a fresh process so its peak RSS can be read, then both
+outputs are checked to be identical.
+
+    python -m benchmarks.bench_met_streaming --rows 485000 --chunk-rows 50000
+
+Functions
+----------
+    write_met_file: Writes a synthetic MET objects file padded with unused columns
+    peak_rss: Peak RSS of this process in MB
+    measure: Runs a function in a fresh process, returns its time, peak RSS and result
+    main: Runs the benchmark
+
+Authors
+----------
+    Madison Sanchez-Forman and Mya Strayer
+"""
+import argparse
+import multiprocessing
+import os
+import resource
+import tempfile
+import time
+from queue import Empty
+
+import pandas as pd
+
+from benchmarks.synthetic import make_met_objects
+from data_aquisition.met_museum import MetMuseum, stream_pipeline # pylint: disable=import-error
+from data_aquisition.storage import load_dataset # pylint: disable=import-error
+
+MET_FILE_COLUMNS = 54
+
+def write_met_file(path: str, rows: int) -> None:
+    """
+    Writes a synthetic MET objects file padded with unused columns.
+
+    Parameters
+    ----------
+    path (str): Path of the CSV file
+    rows (int): Number of objects
+    """
+    df = make_met_objects(rows)
+    for i in range(MET_FILE_COLUMNS - len(df.columns)):
+        df[f"Unused {i}"] = df['Object ID'] + f" unused text {i}"
+    df.to_csv(path, index=False)
+
+def _run_whole(source: str, target: str) -> None:
+    """ Loads the file whole, then cleans and saves it """
+    MetMuseum(source).filter_and_save(target, process_data=True)
+
+def _run_streaming(source: str, target: str, chunk_rows: int) -> None:
+    """ Streams the file through the cleaning chunk by chunk """
+    stream_pipeline(source, target, chunk_rows=chunk_rows, fetch_images=False)
+
+def peak_rss() -> float:
+    """
+    Peak RSS of this process in MB.
+
+    ru_maxrss is kept across exec, so a spawned child would report its parent's peak
+    (e.g. from writing the synthetic file). VmHWM starts over with the new program.
+
+    Returns
+    -------
+    float: The peak resident set size in MB
+    """
+    try:
+        with open('/proc/self/status', 'r', encoding='utf-8') as file:
+            for line in file:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+def _measured(queue, function, args) -> None:
+    """ Child process body of measure """
+    start = time.perf_counter()
+    result = function(*args)
+    elapsed = time.perf_counter() - start
+    queue.put((elapsed, peak_rss(), result))
+
+def measure(function, *args) -> tuple:
+    """
+    Runs a function in a fresh process.
+
+    Parameters
+    ----------
+    function (callable): Module level function to run
+    *args: Its arguments
+
+    Returns
+    -------
+    tuple: (time in seconds, peak RSS of the process in MB, what function returned)
+    """
+    context = multiprocessing.get_context('spawn')
+    queue = context.Queue()
+    process = context.Process(target=_measured, args=(queue, function, args))
+    process.start()
+    # read before joining, a child cannot exit while its result is still in the pipe
+    while True:
+        try:
+            result = queue.get(timeout=1)
+            break
+        except Empty:
+            if not process.is_alive():
+                raise RuntimeError(f"{function.__name__} failed with exit code "
+                                   f"{process.exitcode}") from None
+    process.join()
+    return result
+
+def main():
+    """ Runs the benchmark """
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[2])
+    parser.add_argument('--rows', type=int, default=485000, help="number of synthetic objects")
+    parser.add_argument('--chunk-rows', type=int, default=50000, help="rows per streamed chunk")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        source = os.path.join(tmp_dir, 'MetObjects.txt')
+        write_met_file(source, args.rows)
+        whole = os.path.join(tmp_dir, 'whole.parquet')
+        streamed = os.path.join(tmp_dir, 'streamed.parquet')
+
+        whole_time, whole_rss, _ = measure(_run_whole, source, whole)
+        stream_time, stream_rss, _ = measure(_run_streaming, source, streamed, args.chunk_rows)
+        pd.testing.assert_frame_equal(load_dataset(streamed), load_dataset(whole))
+
+        print(f"rows:       {args.rows} ({os.path.getsize(source) / 2**20:.0f}MB file)")
+        print(f"whole:      {whole_time:.2f}s, peak RSS {whole_rss:.0f}MB")
+        print(f"streaming:  {stream_time:.2f}s, peak RSS {stream_rss:.0f}MB "
+              f"with {args.chunk_rows} row chunks (identical output)")
+
+if __name__ == "__main__":
+    main()
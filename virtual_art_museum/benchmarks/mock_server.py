@@ -0,0 +1,207 @@
+"""
+===============================================
+Mock MET / Europeana Server - Benchmarks
+===============================================
+This module contains a local aiohttp stand-in for the MET objects API and the
+Europeana image hosts, so the fetch stages can be benchmarked (and tested) without
+the network and without hitting the real rate limits.
+
+Every response is delayed by a configurable latency, and a configurable share of
+requests is answered with a 500 or with a 429 and a Retry-After header, so retries,
+backoff and the adaptive rate limiter are exercised as well.
+
+The server runs in its own process, so it does not compete with the client's event
+loop and its memory does not count towards the client's peak RSS. Image hosts are
+told apart by address: the server also listens on 127.0.0.2, 127.0.0.3, ... which
+Linux routes to the loopback interface (other systems may need them aliased first).
+
+Classes
+----------
+    MockSettings: Latency and failure rates of the server
+    MockServer: Runs the server in a separate process
+
+Functions
+----------
+    create_app: Builds the aiohttp application
+    serve: Runs the application until the process is terminated
+
+Authors
+----------
+    Madison Sanchez-Forman and Mya Strayer
+"""
+import asyncio
+import multiprocessing
+import random
+from typing import NamedTuple
+
+from aiohttp import web
+
+# the first bytes of a JPEG, all check_europeana_response reads of an image
+JPEG_HEADER = b'\xff\xd8\xff\xe0\x00\x10JFIF\x00'
+
+class MockSettings(NamedTuple):
+    """
+    Latency and failure rates of the mock server.
+
+    Attributes
+    ----------
+    latency : float
+        mean seconds before a response is sent
+    jitter : float
+        responses are delayed uniformly within latency +/- jitter
+    error_rate : float
+        share of requests answered with a 500
+    throttle_rate : float
+        share of requests answered with a 429
+    retry_after : float
+        Retry-After seconds sent with a 429
+    no_image_rate : float
+        share of MET objects without a primaryImage
+    seed : int
+        seed for the random failures
+    """
+    latency: float = 0.02
+    jitter: float = 0.01
+    error_rate: float = 0.005
+    throttle_rate: float = 0.001
+    retry_after: float = 0.1
+    no_image_rate: float = 0.2
+    seed: int = 0
+
+def create_app(settings: MockSettings = MockSettings()) -> web.Application:
+    """
+    Builds the aiohttp application.
+
+    Routes
+    ------
+    GET /objects/{object_id}: MET object JSON with a primaryImage on the image hosts
+    GET /images/{name}: the first bytes of a JPEG
+    GET /stats: number of requests, 500s and 429s sent so far
+
+    Parameters
+    ----------
+    settings (MockSettings): Latency and failure rates
+
+    Returns
+    -------
+    web.Application: The application
+    """
+    rng = random.Random(settings.seed)
+    stats = {'requests': 0, 'errors': 0, 'throttled': 0}
+
+    async def respond(request, body):
+        """ Delays, then answers with body() or with a failure """
+        stats['requests'] += 1
+        await asyncio.sleep(max(0.0, settings.latency
+                                + rng.uniform(-settings.jitter, settings.jitter)))
+        draw = rng.random()
+        if draw < settings.error_rate:
+            stats['errors'] += 1
+            return web.Response(status=500)
+        if draw < settings.error_rate + settings.throttle_rate:
+            stats['throttled'] += 1
+            return web.Response(status=429, headers={'Retry-After': str(settings.retry_after)})
+        return body(request)
+
+    def met_object(request):
+        object_id = request.match_info['object_id']
+        # the same object always has (or lacks) an image, whatever the request order
+        has_image = random.Random(object_id).random() >= settings.no_image_rate
+        image = f"http://{request.host}/images/{object_id}.jpg" if has_image else ""
+        return web.json_response({'objectID': object_id, 'primaryImage': image})
+
+    def image(request): # pylint: disable=unused-argument
+        return web.Response(body=JPEG_HEADER, content_type='image/jpeg')
+
+    async def objects_handler(request):
+        return await respond(request, met_object)
+
+    async def images_handler(request):
+        return await respond(request, image)
+
+    async def stats_handler(request): # pylint: disable=unused-argument
+        return web.json_response(stats)
+
+    app = web.Application()
+    app.router.add_get('/objects/{object_id}', objects_handler)
+    app.router.add_get('/images/{name}', images_handler)
+    app.router.add_get('/stats', stats_handler)
+    return app
+
+async def _start(settings: MockSettings, hosts: list, port: int) -> int:
+    """ Starts the application on every host, returns the port it listens on """
+    runner = web.AppRunner(create_app(settings), access_log=None)
+    await runner.setup()
+    site = web.TCPSite(runner, hosts[0], port)
+    await site.start()
+    port = runner.addresses[0][1] # the port the OS picked if port was 0
+    for host in hosts[1:]:
+        await web.TCPSite(runner, host, port).start()
+    return port
+
+def serve(settings: MockSettings, hosts: list, port: int = 0, ready=None) -> None:
+    """
+    Runs the application until the process is terminated.
+
+    Parameters
+    ----------
+    settings (MockSettings): Latency and failure rates
+    hosts (list of str): Addresses to listen on
+    port (int): Port to listen on, 0 lets the OS pick a free one
+    ready (multiprocessing.Queue, optional): Receives the port once the server is up
+    """
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+    port = loop.run_until_complete(_start(settings, hosts, port))
+    if ready is not None:
+        ready.put(port)
+    loop.run_forever()
+
+class MockServer:
+    """
+    Runs the mock server in a separate process, as a context manager.
+
+    Parameters
+    ----------
+    settings : MockSettings, optional
+        latency and failure rates, by default MockSettings()
+    image_hosts : int, optional
+        number of addresses image urls are spread over, by default 1
+    """
+    def __init__(self, settings: MockSettings = MockSettings(), image_hosts: int = 1):
+        self.settings = settings
+        self.hosts = [f"127.0.0.{i + 1}" for i in range(max(1, image_hosts))]
+        self.port = None
+        self._process = None
+
+    @property
+    def met_objects_url(self) -> str:
+        """ Stand-in for async_utils.MET_OBJECTS_URL, set as the MET_OBJECTS_URL variable """
+        return f"http://{self.hosts[0]}:{self.port}/objects"
+
+    def image_url(self, i: int) -> str:
+        """ Url of the i-th image, spread round robin over the image hosts """
+        return f"http://{self.hosts[i % len(self.hosts)]}:{self.port}/images/{i}.jpg"
+
+    def start(self) -> 'MockServer':
+        """ Starts the server process and waits until it listens """
+        context = multiprocessing.get_context('spawn')
+        ready = context.Queue()
+        self._process = context.Process(target=serve, args=(self.settings, self.hosts, 0, ready),
+                                        daemon=True)
+        self._process.start()
+        self.port = ready.get(timeout=30)
+        return self
+
+    def stop(self) -> None:
+        """ Terminates the server process """
+        if self._process is not None:
+            self._process.terminate()
+            self._process.join()
+            self._process = None
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
@@ -0,0 +1,102 @@
+"""
+===============================================
+Synthetic Data - Benchmarks
+===============================================
+This module builds synthetic datasets shaped like the real sources, so the
+pipeline can be benchmarked at any size without the (Git LFS) data files.
+
+Functions
+----------
+    make_met_objects: Builds a frame shaped like MetObjects.txt
+    make_europeana_objects: Builds a frame shaped like the Europeana search results
+
+Authors
+----------
+    Madison Sanchez-Forman and Mya Strayer
+"""
+import numpy as np
+import pandas as pd
+
+CULTURES = ['American', 'probably Greek, ancient', 'Possibly French', 'Japanese',
+            'China|Korea', 'Egyptian, Middle Kingdom', ' ', '']
+DEPARTMENTS = ['American Wing', 'Asian Art', 'Egyptian Art', 'European Paintings',
+               'Greek and Roman Art', 'Drawings and Prints']
+ARTISTS = ['Tiffany Studios', 'Katsushika Hokusai | Utagawa Hiroshige',
+           'Winslow Homer', 'Unknown Artist', '']
+MEDIUMS = ['Oil on canvas', 'Bronze', 'Woodblock print; ink and color on paper',
+           'Terracotta', 'Gelatin silver print']
+TAGS = ['Men|Women', 'Landscapes', 'Flowers | Birds | Trees', 'Portraits', '']
+
+def _choose(rng, values, n, missing=0.0):
+    """ Draws n values, replacing a fraction of them with NaN """
+    column = rng.choice(np.array(values, dtype=object), size=n)
+    column[rng.random(n) < missing] = np.nan
+    return column
+
+def make_met_objects(n: int, seed: int = 0) -> pd.DataFrame:
+    """
+    Builds a frame shaped like MetObjects.txt read with dtype='str'.
+
+    Values cover the cases the cleaning has to handle: '|' delimited lists,
+    'probably' / 'possibly' qualifiers, blank and missing cells, and years
+    from ancient BC dates up to dates past the valid range.
+
+    Parameters
+    ----------
+    n (int): Number of rows
+    seed (int): Seed for the random generator
+
+    Returns
+    -------
+    pd.DataFrame: The synthetic objects, every column as strings
+    """
+    rng = np.random.default_rng(seed)
+    return pd.DataFrame({
+        'Object Number': [f"{year}.{i}" for i, year in enumerate(rng.integers(1870, 2024, n))],
+        'Object ID': np.arange(1, n + 1).astype(str),
+        'Department': _choose(rng, DEPARTMENTS, n),
+        'Title': _choose(rng, ['Vase', 'Portrait of a Woman (detail)', 'Untitled',
+                               'The Great Wave|Fuji'], n, missing=0.01),
+        'Culture': _choose(rng, CULTURES, n, missing=0.4),
+        'Artist Display Name': _choose(rng, ARTISTS, n, missing=0.3),
+        'Artist Display Bio': _choose(rng, ['American, 1836-1910', ' | ', 'Japanese'], n,
+                                      missing=0.5),
+        'Object Begin Date': rng.integers(-3000, 2030, n).astype(str),
+        'Medium': _choose(rng, MEDIUMS, n, missing=0.05),
+        'Repository': 'Metropolitan Museum of Art, New York, NY',
+        'Tags': _choose(rng, TAGS, n, missing=0.5),
+        'image_url': [f"https://images.metmuseum.org/CRDImages/{i}.jpg" for i in range(n)],
+    })
+
+def make_europeana_objects(n: int, seed: int = 0) -> pd.DataFrame:
+    """
+    Builds a frame shaped like the Europeana search results after fillna('Unknown').
+
+    Years show up in the description, the title or the creator's life dates, in
+    some rows in several of them and in some rows in none.
+
+    Parameters
+    ----------
+    n (int): Number of rows
+    seed (int): Seed for the random generator
+
+    Returns
+    -------
+    pd.DataFrame: The synthetic objects
+    """
+    rng = np.random.default_rng(seed)
+    years = rng.integers(1000, 2030, n).astype(str)
+    has_year = rng.random((3, n))
+    descriptions = _choose(rng, ['Oil painting of a harbour', 'Engraving, printed in ',
+                                 'Photograph', 'Map of the region drawn c. '], n)
+    titles = _choose(rng, ['Portrait of a man', 'View of the city ', 'Untitled'], n)
+    creators = _choose(rng, ['Rembrandt van Rijn', 'Unknown', 'Jan Steen (1626-'], n)
+    return pd.DataFrame({
+        'europeana_id': [f"/{i % 2000}/item_{i}" for i in range(n)],
+        'image_url': [f"https://example.org/images/{i}.jpg" for i in range(n)],
+        'title': np.where(has_year[0] < 0.3, titles + years, titles),
+        'creator': np.where(has_year[1] < 0.3, creators + '1679)', creators),
+        'description': np.where(has_year[2] < 0.5, descriptions + years, descriptions),
+        'country': _choose(rng, ['Netherlands', 'France', 'Italy', 'Unknown'], n),
+        'provider': _choose(rng, ['Rijksmuseum', 'Europeana Foundation', 'Unknown'], n),
+    })
@@ -0,0 +1,196 @@
+"""
+===============================================
+Collection
+===============================================
+
+This module contains the query engine that lets the homepage search and filter
+the whole collection instead of a small random sample.
+
+Only the columns the search and filters need are loaded, once, to build the
+keyword and facet indexes. A query only works with row positions. The rows of
+the requested page are then read straight from disk with take_rows, so the
+gallery never holds more of the collection in memory than what is on screen.
+CSV datasets are the exception, they cannot be read from the middle, so their
+rows are loaded once instead of parsing the whole file for every page.
+Several datasets (e.g. MET and Europeana) are served as one collection, with
+positions running through them one after the other.
+
+A single collection is shared, read-only, by every session of the app process.
+Feather datasets are memory mapped once, so every session reads its pages from
+the same mapped file through the OS page cache. Query results are kept once per
+distinct set of filters, as a packed bitmap in display order (about 60kB for the
+whole MET collection), so a session only needs to hold its filters and how many
+results it has scrolled through.
+
+Classes
+----------
+    Collection: Searchable, filterable view over one or more datasets on disk
+
+Authors
+----------
+    Madison Sanchez-Forman and Mya Strayer
+"""
+import uuid
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+
+from data_aquisition.storage import apply_dtypes, load_dataset, memory_map_dataset, take_rows
+from search_index import FacetIndex, LRUCache, SearchIndex
+
+SEARCH_COLUMNS = ['Title', 'Artist', 'Culture', 'Year', 'Century', 'Medium', 'Tags',
+                  'Department', 'Description', 'Repository']
+FACET_COLUMNS = ['Culture', 'Repository', 'Year']
+QUERY_CACHE_SIZE = 256 # distinct filter combinations whose results are kept
+
+# the datasets, both indexes and the display order are kept for the life of the app
+class Collection: # pylint: disable=too-many-instance-attributes
+    """
+    Searchable, filterable view over one or more datasets on disk.
+
+    Results come back in a fixed shuffled order, so MET and Europeana objects are
+    mixed on every page instead of one source after the other.
+
+    Parameters
+    ----------
+    paths : list of str
+        datasets to serve, Feather gives the cheapest page reads, then Parquet.
+        CSV datasets are held in memory
+    columns : list, optional
+        columns of the rows returned by rows, by default all of them
+    random_state : int, optional
+        seed for the display order
+    cache_size : int, optional
+        number of query results kept, by default QUERY_CACHE_SIZE
+
+    Attributes
+    ----------
+    facet_data : pd.DataFrame
+        the Culture, Repository and Year columns of the whole collection, for the filter widgets
+    version : str
+        token that changes every time a collection is loaded, for cache keys
+    """
+    def __init__(self, paths, columns=None, random_state=None, cache_size=QUERY_CACHE_SIZE):
+        self.paths = list(paths)
+        self.columns = columns
+        # nothing is read until rows are taken, pages of the file are shared through the OS
+        self._tables = {path: memory_map_dataset(path, columns)
+                        for path in self.paths if path.endswith('.feather')}
+        # a CSV would be parsed whole for every page, so its rows are kept in memory
+        self._tables.update({path: pa.Table.from_pandas(load_dataset(path, columns),
+                                                        preserve_index=False)
+                             for path in self.paths if path.endswith('.csv')})
+
+        index_columns = list(dict.fromkeys(SEARCH_COLUMNS + FACET_COLUMNS))
+        frames = [load_dataset(path, columns=index_columns) for path in self.paths]
+        self.starts = np.cumsum([0] + [len(frame) for frame in frames])
+        # concat loses categoricals whose categories differ so reapply them
+        data = apply_dtypes(pd.concat(frames, ignore_index=True))
+
+        self.search_index = SearchIndex(data[[col for col in SEARCH_COLUMNS if col in data]])
+        self.facets = FacetIndex(data)
+        self.facet_data = data[FACET_COLUMNS]
+
+        self.order = np.random.default_rng(random_state).permutation(len(data))
+        self._rank = np.empty_like(self.order)
+        self._rank[self.order] = np.arange(len(data))
+        self.version = uuid.uuid4().hex
+
+        self._results = LRUCache(cache_size)
+
+    def __len__(self):
+        """ Number of objects in the collection """
+        return int(self.starts[-1])
+
+    def query(self, search='', culture=None, years=None, datasource=None) -> np.ndarray:
+        """
+        Finds the objects matching the homepage filters.
+
+        Every filter is a bitmap from the facet index (the search results are turned
+        into one too), they are combined with a bitwise AND.
+
+        Parameters
+        ----------
+        search (str): Keywords, matched as word prefixes
+        culture (list): Selected cultures, none selects every culture
+        years (tuple): First and last year, None for every year
+        datasource (str): 'MET', 'Europeana' or None for both
+
+        Returns
+        -------
+        np.ndarray: Positions of the matching objects, in display order
+        """
+        key = (search.strip().lower() if search else '', tuple(sorted(culture or [])),
+               None if years is None else (years[0], years[1]), datasource)
+        bitmap = self._results.get(key)
+        if bitmap is None:
+            bitmap = self._query_bitmap(*key)
+            self._results.put(key, bitmap)
+        return self.order[np.flatnonzero(np.unpackbits(bitmap, count=len(self)))]
+
+    def _query_bitmap(self, search, culture, years, datasource) -> np.ndarray:
+        """ Runs a query, returns a read-only packed bitmap with a bit per display rank """
+        bitmaps = []
+        if years is not None:
+            bitmaps.append(self.facets.year_range(years[0], years[1]))
+        if search:
+            bitmaps.append(self.facets.from_positions(self.search_index.search(search)))
+        if culture:
+            bitmaps.append(self.facets.facet('Culture', culture))
+        if datasource in ('MET', 'Europeana'):
+            bitmaps.append(self.facets.facet('Repository', [datasource]))
+
+        ranks = np.zeros(len(self), dtype=bool)
+        ranks[self._rank[self.facets.select(bitmaps)]] = True
+        bitmap = np.packbits(ranks)
+        bitmap.flags.writeable = False
+        return bitmap
+
+    def rows(self, positions) -> pd.DataFrame:
+        """
+        Reads the rows at the given positions from disk.
+
+        Parameters
+        ----------
+        positions (array-like): Positions returned by query, e.g. one page of them
+
+        Returns
+        -------
+        pd.DataFrame: The rows in the order of positions, indexed by position
+        """
+        positions = np.asarray(positions, dtype=np.int64)
+        parts = []
+        for source, path in enumerate(self.paths):
+            start, end = self.starts[source], self.starts[source + 1]
+            local = np.unique(positions[(positions >= start) & (positions < end)]) - start
+            if local.size == 0:
+                continue
+            if path in self._tables:
+                part = self._tables[path].take(pa.array(local)).to_pandas()
+            else:
+                part = take_rows(path, local, self.columns)
+            part.index = local + start
+            parts.append(part)
+        if not parts:
+            return pd.DataFrame(columns=self.columns)
+        return apply_dtypes(pd.concat(parts).loc[positions])
+
+    def page(self, positions, offset: int, limit: int):
+        """
+        Reads one page of query results.
+
+        Parameters
+        ----------
+        positions (np.ndarray): Positions returned by query
+        offset (int): Index of the first result of the page
+        limit (int): Maximum number of results on the page
+
+        Returns
+        -------
+        tuple: (pd.DataFrame of the page's rows, offset of the next page,
+                None if this was the last page)
+        """
+        next_offset = offset + limit
+        rows = self.rows(positions[offset:next_offset])
+        return rows, (next_offset if next_offset < len(positions) else None)
@@ -17,23 +17,67 @@ References
 
 Functions
 ----------
+    met_objects_url: Base url of the MET objects API, MET_OBJECTS_URL unless overridden
     check_dropbox_content: Checks if dropbox content is an image 
     check_europeana_response: Checks if europeana response is a valid image url
-    fetch: Fetches the image url from the source
-    bound_fetch: Fetches the image url from the source with rate limiting
+    read_result: Reads the image url out of a successful response
+    fetch_once: Sends a single (possibly conditional) request
+    fetch: Fetches the image url from the source, consulting the response cache
+    stream_fetch: Fetches urls with a bounded worker pool, yielding results as they complete
+    build_url_dict: Maps each url to fetch to the unique id of its object
+    resolve: Fetches every url and returns the result for each unique id
     run: Runs the fetch function on the dataframe
+    resolve_objects: Synchronous wrapper around resolve
+    resolve_chunks: Resolves chunks of urls one after the other over one session and limiter
+    resolve_objects_chunked: Synchronous wrapper around resolve_chunks
+    fetch_changed_ids: Fetches the ids of MET objects changed since a date
+    changed_object_ids: Synchronous wrapper around fetch_changed_ids
     filter_objects: Filters the dataframe based on the source
 
 Authors
 ----------
     Madison Sanchez-Forman and Mya Strayer
 """
+import os
 import time
+from contextlib import asynccontextmanager
 
 import asyncio
 import aiohttp
 
-from tqdm.asyncio import tqdm_asyncio
+from tqdm import tqdm
+
+from data_aquisition.http_session import create_session # pylint: disable=import-error
+from data_aquisition.rate_limit import ( # pylint: disable=import-error
+    RateLimiter,
+    backoff_delay,
+    parse_retry_after
+)
+from data_aquisition.response_cache import ( # pylint: disable=import-error
+    ResponseCache,
+    SQLiteResponseCache
+)
+
+MET_OBJECTS_URL = "https://collectionapi.metmuseum.org/public/collection/v1/objects"
+DEFAULT_WORKERS = 100
+DEFAULT_MAX_RETRIES = 4
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+THROTTLE_STATUSES = {429, 503} # statuses that mean the host wants us to slow down
+_STOP = object() # sentinel that tells a worker / the consumer that a producer is finished
+
+def met_objects_url() -> str:
+    """
+    Base url of the MET objects API.
+
+    The MET_OBJECTS_URL environment variable is read on every call, so a mirror or
+    a local stand-in (see benchmarks/mock_server.py) can be set at any time before
+    urls are built.
+
+    Returns
+    -------
+    str: The url objects are requested under, without a trailing slash
+    """
+    return os.environ.get('MET_OBJECTS_URL', MET_OBJECTS_URL).rstrip('/')
 
 def check_dropbox_content(content: bytes):
     """
@@ -77,134 +121,462 @@ def check_europeana_response(url: str, content: bytes) -> str:
         return ""
     return url
 
-async def fetch(session:aiohttp.ClientSession, url:str, flag:str) -> str: # pylint: disable=too-many-return-statements
+async def read_result(response, url: str, flag: str) -> str:
+    """
+    Reads the resolved image url out of a successful (status 200) response.
+
+    Parameters
+    ----------
+    response (aiohttp.ClientResponse): The response object
+    url (str): The url that was fetched
+    flag (str): The flag to determine the source
+
+    Returns
+    -------
+    str: The image url if it is a valid image link, an empty string otherwise
+    """
+    if flag == "MET":
+        data = await response.json()
+        if 'primaryImage' in data and data['primaryImage']:
+            return data['primaryImage']
+        return ""
+
+    if flag == "EUROPEANA":
+        content = await response.content.read(9)
+        return check_europeana_response(url, content)
+    raise ValueError(f"Invalid source given: {flag}. Must be either MET or EUROPEANA")
+
+class RetryableStatus(Exception):
+    """ Raised for responses (429 / 5xx) that are worth retrying """
+    def __init__(self, status: int, retry_after: float = None):
+        super().__init__(f"HTTP {status}")
+        self.status = status
+        self.retry_after = retry_after
+
+async def fetch_once(session: aiohttp.ClientSession, url: str, flag: str, cache=None, # pylint: disable=too-many-arguments
+                     entry=None) -> str:
+    """
+    Sends a single (possibly conditional) request for url.
+
+    Parameters
+    ----------
+    session (aiohttp.ClientSession): The session object
+    url (str): The url to fetch
+    flag (str): The flag to determine the source
+    cache (ResponseCache, optional): Cache of previously resolved urls
+    entry (CacheEntry, optional): The stale cache entry for url, if any
+
+    Returns
+    -------
+    str: The image url if it is a valid image link, an empty string otherwise
+
+    Raises
+    ------
+    RetryableStatus: if the server answered with a status in RETRY_STATUSES
+    """
+    headers = ResponseCache.conditional_headers(entry)
+    async with session.get(url, headers=headers) as response:
+        if response.status == 304 and entry is not None:
+            cache.touch(url)
+            return entry.result
+        if response.status == 200:
+            result = await read_result(response, url, flag)
+            if cache is not None:
+                cache.put(url, result,
+                          etag=response.headers.get('ETag'),
+                          last_modified=response.headers.get('Last-Modified'))
+            return result
+        if response.status in RETRY_STATUSES:
+            raise RetryableStatus(response.status,
+                                  parse_retry_after(response.headers.get('Retry-After')))
+        if response.status == 404 and cache is not None:
+            cache.put(url, "") # the object is gone, no need to ask again until it expires
+        return ""
+
+async def fetch(session:aiohttp.ClientSession, url:str, flag:str, cache=None, # pylint: disable=too-many-arguments
+                limiter=None, max_retries: int = DEFAULT_MAX_RETRIES) -> str:
     """
     Fetches the image url using the session object.
 
     This function is designed to be used with the MET data and Europeana data.
-    There are two different cases that must be addressed for each.
+    There are two different cases that must be addressed for each. If a cache is
+    given, fresh entries are returned without a request and stale entries are
+    revalidated with a conditional request (If-None-Match / If-Modified-Since).
+    429 / 5xx responses and connection errors are retried with jittered exponential
+    backoff, honoring Retry-After, and reported to the limiter so it can back off.
 
     Parameters
     ----------
     session (aiohttp.ClientSession): The session object
     url (str): The url to fetch
     flag (str): The flag to determine the source
+    cache (ResponseCache, optional): Cache of previously resolved urls
+    limiter (RateLimiter, optional): Per-host rate and concurrency limits
+    max_retries (int, optional): Number of retries after the first attempt
 
     Returns
     -------
-    str: The image url if it is a valid image link, an empty string otherwise
+    str: The image url if it is a valid image link, an empty string otherwise.
+        None if every attempt failed, so the object can be retried later
+        instead of being dropped as if it had no image.
     """
-    try:
-        async with session.get(url) as response:
-            if response.status == 200:
-                if flag == "MET":
-                    data = await response.json()
-                    if 'primaryImage' in data and data['primaryImage']:
-                        return data['primaryImage']
-                    return ""
-
-                if flag == "EUROPEANA":
-                    content = await response.content.read(9)
-                    if url.startswith('https://www.dropbox.com'):
-                        if check_dropbox_content(content):
-                            return url
-                        return ""
-                    return url
-                raise ValueError(f"Invalid source given: {flag}. Must be either MET or EUROPEANA")
+    entry = cache.get(url) if cache is not None else None
+    if entry is not None and cache.is_fresh(entry):
+        return entry.result
+
+    error = None
+    for attempt in range(max_retries + 1):
+        if limiter is not None:
+            await limiter.acquire(url)
+        throttled, retry_after = False, None
+        try:
+            return await fetch_once(session, url, flag, cache=cache, entry=entry)
+        except RetryableStatus as e:
+            error, retry_after = e, e.retry_after
+            throttled = e.status in THROTTLE_STATUSES
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            error, throttled = e, True
+        except Exception as e: # pylint: disable=broad-exception-caught
+            print(f"Error fetching {url}: {e}")
             return ""
-    except Exception as e: # pylint: disable=broad-exception-caught
-        print(f"Error fetching {url}: {e}")
-        return ""
+        finally:
+            if limiter is not None:
+                await limiter.release(url, throttled=throttled, retry_after=retry_after)
+
+        if attempt < max_retries:
+            await asyncio.sleep(max(retry_after or 0, backoff_delay(attempt)))
 
-async def bound_fetch(
-    semaphore: asyncio.Semaphore,
-    session: aiohttp.ClientSession,
-    url: str,
-    flag: str
-) -> str:
+    print(f"Error fetching {url}: {error!r}, giving up after {max_retries + 1} attempts")
+    return None
+
+async def stream_fetch(session: aiohttp.ClientSession, urls, flag: str, cache=None, # pylint: disable=too-many-arguments
+                       limiter=None, workers: int = DEFAULT_WORKERS, queue_size: int = None):
     """
-    Fetch URL with rate limiting via semaphore.
-    
+    Fetches urls with a fixed pool of workers, yielding results as they complete.
+
+    A producer feeds urls into a bounded queue that the workers pull from, and the
+    workers push (url, result) pairs into a second bounded queue that this generator
+    drains. Only workers + 2 * queue_size urls are ever in memory at once, so memory
+    stays flat no matter how many urls are given. Results are yielded in completion
+    order, not input order.
+
     Parameters
     ----------
-        semaphore: Semaphore for rate limiting requests
-        session: aiohttp client session
-        url: URL to fetch
-        flag: Source flag ('MET' or 'EUROPEANA')
-        
-    Returns:
+    session (aiohttp.ClientSession): The session object
+    urls (iterable): The urls to fetch, may be a lazy iterator
+    flag (str): The flag to determine the source
+    cache (ResponseCache, optional): Cache of previously resolved urls
+    limiter (RateLimiter, optional): Per-host rate and concurrency limits
+    workers (int, optional): Number of concurrent requests, by default 100
+    queue_size (int, optional): Size of the bounded queues, by default 2 * workers
+
+    Yields
     -------
-        str: The image url if it is a valid image link, an empty string otherwise
+    tuple: (url, image url, empty string, or None if the url could not be fetched)
+    """
+    queue_size = queue_size or 2 * workers
+    todo = asyncio.Queue(maxsize=queue_size)
+    done = asyncio.Queue(maxsize=queue_size)
+
+    async def producer():
+        error = None
+        try:
+            for url in urls:
+                await todo.put(url)
+        except Exception as e: # pylint: disable=broad-exception-caught
+            error = e
+        # stop the workers even on error, so they drain and the error can surface
+        for _ in range(workers):
+            await todo.put(_STOP)
+        if error is not None:
+            raise error
+
+    async def worker():
+        try:
+            while True:
+                url = await todo.get()
+                if url is _STOP:
+                    break
+                result = await fetch(session, url, flag, cache=cache, limiter=limiter)
+                await done.put((url, result))
+        except Exception as e: # pylint: disable=broad-exception-caught
+            await done.put(e) # hand the error to the consumer instead of hanging it
+            return
+        await done.put(_STOP)
+
+    tasks = [asyncio.ensure_future(producer())]
+    tasks += [asyncio.ensure_future(worker()) for _ in range(workers)]
+    finished = 0
+    try:
+        while finished < workers:
+            item = await done.get()
+            if item is _STOP:
+                finished += 1
+                continue
+            if isinstance(item, Exception):
+                raise item
+            yield item
+        # surface an exception raised while iterating over urls
+        await tasks[0]
+    finally:
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+@asynccontextmanager
+async def _session_scope(session: aiohttp.ClientSession, flag: str):
+    """ Yields the given session, or a new tuned session for flag that is closed afterwards """
+    if session is not None:
+        yield session
+        return
+    async with create_session(flag) as new_session:
+        yield new_session
+
+def build_url_dict(df, flag: str):
     """
-    async with semaphore:
-        return await fetch(session, url, flag)
+    Builds the dict that maps url -> unique id for every object in the dataframe.
 
-async def run(df, flag: str):
+    Parameters
+    ----------
+    df (pd.DataFrame): The dataframe to fetch the image urls from
+    flag (str): The flag to determine the source
+
+    Returns
+    -------
+    tuple: (dict of url -> unique id, name of the unique id column)
+    """
+    if flag == "MET":
+        df.dropna(subset=['Object ID'], inplace=True) # just in case
+        df.drop_duplicates(subset=['Object ID'], inplace=True)
+        base_url = met_objects_url()
+        url_dict = {f"{base_url}/{obj_id}": obj_id for obj_id in df['Object ID'].tolist()}
+        return url_dict, 'Object ID'
+
+    if flag == "EUROPEANA":
+        return dict(zip(df['image_url'], df['europeana_id'])), 'europeana_id'
+    raise ValueError(f"Invalid source given: {flag}. Must be either MET or EUROPEANA")
+
+async def _resolve_pass(session, urls, url_dict, flag, resolved, progress, # pylint: disable=too-many-arguments
+                        keep_failed=False, cache=None, limiter=None,
+                        workers: int = DEFAULT_WORKERS) -> list:
+    """
+    Runs one pass of resolve over urls, storing each result in resolved by unique id.
+
+    Parameters
+    ----------
+    session (aiohttp.ClientSession): The session object
+    urls (iterable): The urls to fetch in this pass
+    url_dict (dict): Maps url -> unique id
+    flag (str): The flag to determine the source
+    resolved (dict): Maps unique id -> result, updated in place
+    progress (tqdm): Progress bar, advanced once per stored result
+    keep_failed (bool, optional): Hold back urls that could not be fetched instead of
+        storing None for them, by default False
+    cache (ResponseCache, optional): Cache of previously resolved urls
+    limiter (RateLimiter, optional): Per-host rate and concurrency limits
+    workers (int, optional): Number of concurrent requests
+
+    Returns
+    -------
+    list: The urls held back for another pass
+    """
+    failed = []
+    async for url, result in stream_fetch(session, urls, flag, cache=cache,
+                                          limiter=limiter, workers=workers):
+        if result is None and keep_failed:
+            failed.append(url)
+            continue
+        resolved[url_dict[url]] = result
+        progress.update()
+    return failed
+
+async def resolve(url_dict: dict, flag: str, cache=None, # pylint: disable=too-many-arguments
+                  workers: int = DEFAULT_WORKERS, limiter=None, retry_passes: int = 1,
+                  session: aiohttp.ClientSession = None) -> dict:
+    """
+    Fetches every url in url_dict and returns the result for each unique id.
+
+    Urls that still fail after fetch's own retries are collected and given another
+    pass once everything else is done, when the hosts have had time to recover.
+
+    Parameters
+    ----------
+    url_dict (dict): Maps url -> unique id
+    flag (str): The flag to determine the source
+    cache (ResponseCache, optional): Cache of previously resolved urls
+    workers (int, optional): Number of concurrent requests
+    limiter (RateLimiter, optional): Per-host limits, a new RateLimiter by default
+    retry_passes (int, optional): Extra passes over urls that failed, by default 1
+    session (aiohttp.ClientSession, optional): Session to reuse, by default one is
+        created with create_session(flag) and closed when done
+
+    Returns
+    -------
+    dict: Maps unique id -> image url, empty string if the object has no valid image,
+        None if it could not be fetched at all
+    """
+    limiter = RateLimiter() if limiter is None else limiter
+    resolved = {}
+    pending = url_dict.keys()
+    async with _session_scope(session, flag) as session:
+        print(f"Fetching {len(url_dict)} urls with {workers} workers...")
+        with tqdm(total=len(url_dict), miniters=50) as progress:
+            for attempt in range(retry_passes + 1):
+                pending = await _resolve_pass(session, pending, url_dict, flag, resolved,
+                                              progress, keep_failed=attempt < retry_passes,
+                                              cache=cache, limiter=limiter, workers=workers)
+                if not pending:
+                    break
+                print(f"Retrying {len(pending)} urls that could not be fetched...")
+    return resolved
+
+async def run(df, flag: str, cache=None, limiter=None, workers: int = DEFAULT_WORKERS):
     """
     Runs the fetch function on the dataframe.
 
     This function is designed to be used with the MET data and Europeana data.
     It performs the bulk parallel fetching of the image urls. The function is designed
     to be used with the MET data and Europeana data.It begins by building a dict that maps
-    url -> unique id. It then creates a list of tasks where each task is a call to the
-    bound_fetch function. It then gathers the results and filters the dataframe based
-    on the results.
+    url -> unique id. It then resolves every url through the stream_fetch worker pool
+    and filters the dataframe based on the results.
 
     Parameters
     ----------
     df (pd.DataFrame): The dataframe to fetch the image urls from
     flag (str): The flag to determine the source
+    cache (ResponseCache, optional): Cache of previously resolved urls
+    limiter (RateLimiter, optional): Per-host limits, a new RateLimiter by default
+    workers (int, optional): Number of concurrent requests
     
     Returns
     -------
     pd.DataFrame: The dataframe with the valid image urls
     """
-    url_dict = {}
-    col_name = ''
-    if flag == "MET":
-        base_url = "https://collectionapi.metmuseum.org/public/collection/v1/objects"
-        df.dropna(subset=['Object ID'], inplace=True) # just in case
-        df.drop_duplicates(subset=['Object ID'], inplace=True)
-        url_dict = {f"{base_url}/{obj_id}": obj_id for obj_id in df['Object ID'].tolist()}
-        col_name = 'Object ID'
+    url_dict, col_name = build_url_dict(df, flag)
+    start_time = time.time()
 
-    elif flag == "EUROPEANA":
-        url_dict = dict(zip(df['image_url'], df['europeana_id']))
-        col_name = 'europeana_id'
-    else:
-        raise ValueError(f"Invalid source given: {flag}. Must be either MET or EUROPEANA")
+    resolved = await resolve(url_dict, flag, cache=cache, workers=workers, limiter=limiter)
+    # Create dictionary mapping IDs to valid image URLs (filtering out empty / failed results)
+    valid_dictionary = {obj_id: result for obj_id, result in resolved.items() if result}
+    n_failed = sum(1 for result in resolved.values() if result is None)
+    filtered_df = df[df[col_name].isin(valid_dictionary.keys())].copy()
 
-    tasks = []
-    max_requests = 100
-    semaphore = asyncio.Semaphore(max_requests)
-    start_time = time.time()
+    if flag == "MET":
+        filtered_df['image_url'] = filtered_df['Object ID'].map(valid_dictionary)
 
-    async with aiohttp.ClientSession() as session:
-        # Create tasks for each URL to fetch in parallel
-        tasks = [asyncio.ensure_future(bound_fetch(semaphore, session, url, flag))
-                for url in url_dict.keys()]
-
-        total_tasks = len(tasks)
-        print(f"All {total_tasks} tasks created, waiting for responses...")
-        results = await tqdm_asyncio.gather(*tasks, miniters=50)
-        # Create dictionary mapping IDs to valid image URLs (filtering out empty results)
-        valid_dictionary = {
-                            url_dict[url]: result for url, result in
-                            zip(url_dict.keys(), results) if result != ""
-                            }
-        filtered_df = df[df[col_name].isin(valid_dictionary.keys())].copy()
-
-        if flag == "MET":
-            filtered_df['image_url'] = filtered_df['Object ID'].map(valid_dictionary)
-
-        print("All tasks completed.")
-        print(f"\tOriginal shape: {df.shape}")
-        print(f"\tFiltered shape: {filtered_df.shape}")
-        print(f"\tTime taken: {time.time() - start_time} seconds")
+    print("All tasks completed.")
+    print(f"\tOriginal shape: {df.shape}")
+    print(f"\tFiltered shape: {filtered_df.shape}")
+    if n_failed:
+        print(f"\t{n_failed} objects could not be fetched, use a cache or journal to retry them")
+    print(f"\tTime taken: {time.time() - start_time} seconds")
 
     return filtered_df
 
-def filter_objects(df, flag: str):
+def resolve_objects(url_dict: dict, flag: str, cache=None) -> dict:
+    """
+    Synchronous wrapper around resolve so that asyncio does not need to be imported elsewhere.
+
+    Parameters
+    ----------
+    url_dict (dict): Maps url -> unique id
+    flag (str): The flag to determine the source
+    cache (ResponseCache, optional): Cache of previously resolved urls
+
+    Returns
+    -------
+    dict: Maps unique id -> image url, empty string if the object has no valid image,
+        None if it could not be fetched at all
+    """
+    return asyncio.run(resolve(url_dict, flag, cache=cache))
+
+async def resolve_chunks(url_dicts, flag: str, on_chunk, cache=None,
+                         workers: int = DEFAULT_WORKERS) -> None:
+    """
+    Resolves chunks of urls one after the other, handing each chunk's results over.
+
+    Every chunk shares one session and RateLimiter, so pooled connections and the
+    adaptive per-host limits carry over from one chunk to the next instead of
+    starting again at the initial rate.
+
+    Parameters
+    ----------
+    url_dicts (iterable of dict): Chunks, each mapping url -> unique id
+    flag (str): The flag to determine the source
+    on_chunk (callable): Called with each chunk and its results (see resolve) once the
+        chunk is done, e.g. to checkpoint them
+    cache (ResponseCache, optional): Cache of previously resolved urls
+    workers (int, optional): Number of concurrent requests
+    """
+    limiter = RateLimiter()
+    async with create_session(flag) as session:
+        for url_dict in url_dicts:
+            results = await resolve(url_dict, flag, cache=cache, workers=workers,
+                                    limiter=limiter, session=session)
+            on_chunk(url_dict, results)
+
+def resolve_objects_chunked(url_dicts, flag: str, on_chunk, cache=None) -> None:
+    """
+    Synchronous wrapper around resolve_chunks, a single event loop serves every chunk.
+
+    Parameters
+    ----------
+    url_dicts (iterable of dict): Chunks, each mapping url -> unique id
+    flag (str): The flag to determine the source
+    on_chunk (callable): Called with each chunk and its results
+    cache (ResponseCache, optional): Cache of previously resolved urls
+    """
+    asyncio.run(resolve_chunks(url_dicts, flag, on_chunk, cache=cache))
+
+async def fetch_changed_ids(since: str, session: aiohttp.ClientSession = None,
+                            max_retries: int = DEFAULT_MAX_RETRIES) -> list:
+    """
+    Fetches the ids of every MET object whose metadata changed since a date.
+
+    Parameters
+    ----------
+    since (str): Date in YYYY-MM-DD format
+    session (aiohttp.ClientSession, optional): Session to reuse
+    max_retries (int, optional): Number of retries after the first attempt
+
+    Returns
+    -------
+    list: The changed object ids as strings, matching the dtype of MetObjects.txt
+    """
+    async with _session_scope(session, 'MET') as session:
+        for attempt in range(max_retries + 1):
+            retry_after = None
+            try:
+                async with session.get(met_objects_url(),
+                                       params={'metadataDate': since}) as response:
+                    if response.status == 200:
+                        data = await response.json()
+                        return [str(obj_id) for obj_id in data.get('objectIDs') or []]
+                    if response.status not in RETRY_STATUSES:
+                        response.raise_for_status()
+                    retry_after = parse_retry_after(response.headers.get('Retry-After'))
+            except (aiohttp.ClientConnectionError, asyncio.TimeoutError):
+                if attempt == max_retries:
+                    raise
+            if attempt < max_retries:
+                await asyncio.sleep(max(retry_after or 0, backoff_delay(attempt)))
+    raise RuntimeError(f"Could not fetch objects changed since {since}")
+
+def changed_object_ids(since: str) -> list:
+    """
+    Synchronous wrapper around fetch_changed_ids.
+
+    Parameters
+    ----------
+    since (str): Date in YYYY-MM-DD format
+
+    Returns
+    -------
+    list: The changed object ids as strings
+    """
+    return asyncio.run(fetch_changed_ids(since))
+
+def filter_objects(df, flag: str, cache_path=None):
     """
     Filters the dataframe based on the source. It simply runs the run function. so that asyncio 
     does not need to be imported elsewhere.
@@ -213,9 +585,18 @@ def filter_objects(df, flag: str):
     ----------
     df (pd.DataFrame): The dataframe to filter
     flag (str): The flag to determine the source
+    cache_path (str, optional): Path to a sqlite response cache. Repeat runs with the
+        same cache only send conditional requests for stale urls.
 
     Returns
     -------
     pd.DataFrame: The dataframe with the valid image urls
     """
-    return asyncio.run(run(df, flag))
+    if cache_path is None:
+        return asyncio.run(run(df, flag))
+
+    with SQLiteResponseCache(cache_path) as cache:
+        evicted = cache.evict_expired()
+        if evicted:
+            print(f"Evicted {evicted} expired entries from {cache_path}")
+        return asyncio.run(run(df, flag, cache=cache))
@@ -0,0 +1,106 @@
+"""
+===============================================
+Checkpoint - Data Acquisition
+===============================================
+This module contains the append-only journal used to checkpoint the
+image url acquisition pipeline.
+
+Resolving image urls for all ~485k MET objects takes hours. Instead of holding
+every result in memory until the very end, results are appended to a JSON lines
+journal one chunk at a time. If the pipeline crashes, the next run loads the
+journal, skips every object that was already resolved and carries on from there.
+
+Classes
+----------
+    ResultJournal: Append-only JSON lines journal of resolved objects
+
+Functions
+----------
+    chunked: Splits a list into consecutive chunks
+
+Authors
+----------
+    Madison Sanchez-Forman and Mya Strayer
+"""
+import json
+import os
+
+def chunked(items: list, chunk_size: int):
+    """
+    Splits a list into consecutive chunks.
+
+    Parameters
+    ----------
+    items (list): The items to split
+    chunk_size (int): The maximum size of each chunk
+
+    Returns
+    -------
+    generator of lists, each at most chunk_size long
+    """
+    if chunk_size < 1:
+        raise ValueError(f"chunk_size must be positive, got {chunk_size}")
+    for start in range(0, len(items), chunk_size):
+        yield items[start:start + chunk_size]
+
+class ResultJournal:
+    """
+    Append-only JSON lines journal mapping object ids to resolved image urls.
+
+    Every line is a single record {"id": ..., "image_url": ...}. An empty image_url
+    means the object was resolved but has no image, so it is skipped on restart too.
+    Later lines win over earlier ones, and a truncated final line (from a crash in
+    the middle of a write) is ignored.
+
+    Parameters
+    ----------
+    path : str
+        path to the journal file, created on the first append
+    """
+    def __init__(self, path):
+        self.path = path
+
+    def load(self) -> dict:
+        """
+        Loads every record in the journal.
+
+        Returns
+        -------
+        dict: Maps object id -> image url
+        """
+        resolved = {}
+        if not os.path.exists(self.path):
+            return resolved
+        with open(self.path, "r", encoding="utf-8") as file:
+            for line in file:
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    continue # partially written line from an interrupted run
+                resolved[record['id']] = record['image_url']
+        return resolved
+
+    def append(self, results: dict) -> None:
+        """
+        Appends a chunk of results to the journal and flushes it to disk.
+
+        Parameters
+        ----------
+        results (dict): Maps object id -> image url
+        """
+        lines = [json.dumps({'id': obj_id, 'image_url': url}) + "\n"
+                 for obj_id, url in results.items()]
+        if self._ends_mid_line():
+            lines.insert(0, "\n") # keep the next record off a truncated line
+        with open(self.path, "a", encoding="utf-8") as file:
+            file.writelines(lines)
+            file.flush()
+            os.fsync(file.fileno())
+
+    def _ends_mid_line(self) -> bool:
+        """ Checks if the journal was left with a partially written last line """
+        if not os.path.exists(self.path) or os.path.getsize(self.path) == 0:
+            return False
+        with open(self.path, "rb") as file:
+            file.seek(-1, os.SEEK_END)
+            return file.read(1) != b"\n"
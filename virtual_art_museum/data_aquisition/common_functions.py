@@ -7,7 +7,10 @@ This module contains the common functions for the data aquisition pipeline.
 Functions
 ----------
     print_example_rows: Prints the first n rows of a dataframe
+    century_label: Names a century, the lookup shared by the century mappers
     century_mapping: Maps a year to a century
+    map_centuries: Maps a column of years to centuries in one vectorized pass
+    map_distinct: Applies a vectorized transform to the distinct values of a column only
     image_processing_europeana: Processes the Europeana data to be compatible with MET
     blend_datasources: Blends the MET and Europeana data
     reorder_columns: Reorders the columns of the two dataframes to be compatible with each other
@@ -19,8 +22,17 @@ Authors
 """
 from math import ceil
 
+import numpy as np
 import pandas as pd
 
+from data_aquisition.culture_resolver import CultureResolver # pylint: disable=import-error
+from data_aquisition.storage import ( # pylint: disable=import-error
+    load_dataset,
+    resolve_dataset_path,
+    save_dataset
+)
+from data_aquisition.tag_matcher import TagMatcher # pylint: disable=import-error
+
 def print_example_rows(df, n=5):
     """
     Prints the first n rows of a dataframe in a readable format.
@@ -41,7 +53,27 @@ def print_example_rows(df, n=5):
             print(f"\t{col}: {row[col]}")
         print("--------------------------------")
 
-def century_mapping(year): # pylint: disable=too-many-return-statements
+LAST_VALID_YEAR = 2015 # later years are data entry errors, their century is unknown
+ORDINAL_SUFFIXES = {1: 'st', 2: 'nd', 3: 'rd'} # every other AD century is 'th'
+
+def century_label(century: int, before_christ: bool) -> str:
+    """
+    Names a century. Both century mappers build their labels here, so they agree.
+
+    Parameters
+    ----------
+    century (int): The century number, 1 for years 1 - 100
+    before_christ (bool): True for BC years
+
+    Returns
+    -------
+    str: e.g. "1st century AD" or "5th century BC"
+    """
+    if before_christ:
+        return f"{century}th century BC"
+    return f"{century}{ORDINAL_SUFFIXES.get(century, 'th')} century AD"
+
+def century_mapping(year):
     """
     Maps a year to a century.
 
@@ -56,45 +88,88 @@ def century_mapping(year): # pylint: disable=too-many-return-statements
     try:
         # Convert to int if it's a string
         year = int(year)
+    except (ValueError, TypeError):
+        return "Unknown"
+    # Check valid range
+    if year > LAST_VALID_YEAR:
+        return "Unknown"
+    return century_label(ceil(abs(year) / 100), year < 0)
 
-        # Check valid range
-        if year > 2015:
-            return "Unknown"
+def map_centuries(years: pd.Series) -> pd.Series:
+    """
+    Maps a column of years to centuries, the vectorized form of century_mapping.
 
-        # Calculate century
-        century = ceil(abs(year) / 100)
+    Integer columns are mapped through a lookup table with one label per distinct
+    (century, BC) pair, built with century_label, then gathered back with a single
+    take. Any other column (e.g. years mixed with "Unknown") is passed through
+    century_mapping one distinct value at a time, so the result is always the same
+    as years.apply(century_mapping).
 
-        # Handle BC years
-        if year < 0:
-            return f"{century}th century BC"
+    Parameters
+    ----------
+    years (pd.Series): The years to map
 
-        # Handle AD years with proper suffixes
-        if century == 1:
-            return f"{century}st century AD"
-        if century == 2:
-            return f"{century}nd century AD"
-        if century == 3:
-            return f"{century}rd century AD"
-        return f"{century}th century AD"
+    Returns
+    -------
+    pd.Series: The century of each year
+    """
+    if not pd.api.types.is_integer_dtype(years):
+        return map_distinct(years, lambda values: values.map(century_mapping))
+
+    values = years.to_numpy(dtype=np.int64)
+    # key = 2 * century + 1 for BC, -1 marks years past LAST_VALID_YEAR
+    keys = 2 * np.ceil(np.abs(values) / 100).astype(np.int64) + (values < 0)
+    keys[values > LAST_VALID_YEAR] = -1
+    table, positions = np.unique(keys, return_inverse=True)
+    labels = np.array([century_label(key // 2, key % 2 == 1) if key >= 0 else "Unknown"
+                       for key in table.tolist()], dtype=object)
+    return pd.Series(labels[positions], index=years.index, name=years.name, dtype=object)
+
+def map_distinct(column: pd.Series, transform) -> pd.Series:
+    """
+    Applies a vectorized transform to the distinct values of a column only.
 
-    except (ValueError, TypeError):
-        return "Unknown"
+    Text columns such as Culture, Medium or Department repeat a small set of values,
+    so the transform runs over thousands of values instead of hundreds of thousands
+    and the results are gathered back with a single take. Missing values are passed
+    to the transform once, as NaN.
+
+    Parameters
+    ----------
+    column (pd.Series): The column to transform
+    transform (callable): Takes and returns a pd.Series of the same length
 
-def image_processing_europeana(met, europeana): # pylint: disable=too-many-statements
+    Returns
+    -------
+    pd.Series: The transformed column, same index as column
+    """
+    codes, uniques = pd.factorize(column)
+    values = pd.Series(np.append(np.asarray(uniques, dtype=object), np.nan), dtype=object)
+    mapped = np.asarray(transform(values), dtype=object)
+    codes[codes == -1] = len(uniques) # factorize marks missing values with -1
+    return pd.Series(mapped[codes], index=column.index, name=column.name)
+
+def image_processing_europeana(met, europeana, # pylint: disable=too-many-statements
+                               word_boundary=False, workers=1):
     """
     Transforms the Europeana data to be 
     compatible with MET merge.
     - Reads through the description column
         and tries to match for any Mediums
-        or Tags (based on MET)
+        or Tags (based on MET), with a
+        TagMatcher built once from the MET
+        tags (word_boundary / workers are
+        passed on to it)
     - Updates country column to match any
-        culture within the MET data
+        culture within the MET data, with a
+        CultureResolver built once from the
+        MET cultures
     - Makes a fake column for Artist Bio
     - Replaces 'Unknown' in year column
         with unrealistic value
     - Renames columns to match MET's
     """
-    europeana['year'] = europeana['year'].apply(century_mapping)
+    europeana['year'] = map_centuries(europeana['year'])
     europeana['Medium'] = "Medium unknown"
     europeana['Tags'] = "Tags unknown"
     europeana['repository'] = "Europeana"
@@ -102,101 +177,25 @@ def image_processing_europeana(met, europeana): # pylint: disable=too-many-state
     tags = met['Tags'].str.split(',').explode().unique()
     cultures = met['Culture'].str.split(',').explode().unique()
 
-    def find_tags(description):
-        ''' Searches through the description
-        column, finding any Tag matches '''
-        tags_match = []
-
+    def clean_description(description):
+        ''' Lowercases the description column,
+        marking missing descriptions '''
         if description == 'Unknown' or str(description).startswith('warning:'):
             return "Description unknown"
 
-        description = str(description).lower()
-
-        for tag in tags:
-            if tag.lower() in description:
-                tags_match.append(tag)
-
-        return description
-
-    europeana['description'] = europeana['description'].apply(find_tags)
-
-    for idx, row in europeana.iterrows():
-        description = str(row['description']).lower()
-
-        tags_match = [tag for tag in tags if tag and tag.lower() in description]
-        if tags_match:
-            europeana.at[idx, 'Tags'] = ", ".join(tags_match)
-
-    country_to_culture = {
-        'United Kingdom': 'British',
-        'England': 'British',
-        'Scotland': 'British',
-        'Wales': 'British',
-        'Ireland': 'Irish',
-        'France': 'French',
-        'Germany': 'German',
-        'Italy': 'Italian',
-        'Spain': 'Spanish',
-        'Portugal': 'Portuguese',
-        'Netherlands': 'Dutch',
-        'Belgium': 'Belgian',
-        'Switzerland': 'Swiss',
-        'Austria': 'Austrian',
-        'Greece': 'Greek',
-        'Denmark': 'Danish',
-        'Sweden': 'Swedish',
-        'Norway': 'Norwegian',
-        'Finland': 'Finnish',
-        'Russia': 'Russian',
-        'Poland': 'Polish',
-        'Hungary': 'Hungarian',
-        'Czech Republic': 'Czech',
-        'Romania': 'Romanian',
-        'Bulgaria': 'Bulgarian',
-        'Turkey': 'Turkish'}
-
-    for culture in cultures:
-        country_match = None
-        culture = str(culture).strip()
-
-        # Remove suffixes to check for match
-        if culture.endswith('ish'):
-            country_match = culture[:-3]
-        elif culture.endswith('ese'):
-            country_match = culture[:-3]
-        elif culture.endswith('ian'):
-            country_match = culture[:-3]
-        elif culture.endswith('ch'):
-            country_match = culture[:-2] + 'ce'
-        elif culture.endswith('ish'):
-            country_match = culture[:-3]
-
-        if country_match and country_match not in country_to_culture.values():
-            country_to_culture[country_match] = culture
-
-    def map_countries_to_culture(country):
-        ''' Maps countries to respective cultures '''
-        if pd.isna(country) or country == 'Unknown':
-            return 'Culture unknown'
-
-        country = str(country).strip()
-
-        if country in country_to_culture:
-            return country_to_culture[country]
-
-        for known_country, culture in country_to_culture.items():
-            if known_country in country:
-                return culture
-
-        for culture in cultures:
-            culture_lower = culture.lower()
-            country_lower = country.lower()
-            if culture_lower in country_lower:
-                return culture
-
-        return 'Culture unknown'
-
-    europeana['Culture'] = europeana['country'].apply(map_countries_to_culture)
+        return str(description).lower()
+
+    europeana['description'] = europeana['description'].apply(clean_description)
+
+    matcher = TagMatcher(tags, word_boundary=word_boundary)
+    tags_matches = matcher.find_many(europeana['description'], workers=workers)
+    europeana['Tags'] = [", ".join(tags_match) if tags_match else "Tags unknown"
+                         for tags_match in tags_matches]
+
+    # countries repeat a lot, each distinct one is resolved once
+    resolver = CultureResolver(cultures)
+    europeana['Culture'] = map_distinct(europeana['country'],
+                                        lambda countries: countries.map(resolver.resolve))
 
     def clean_title(title):
         ''' Makes a cleaner title to print '''
@@ -275,8 +274,8 @@ def main():
     """
     Main function to run the data aquisition pipeline.
     """
-    met = pd.read_csv('../data/MetObjects_final_filtered_processed.csv')
-    europeana = pd.read_csv('../data/Europeana_data_processed.csv')
+    met = load_dataset(resolve_dataset_path('../data/MetObjects_final_filtered_processed.csv'))
+    europeana = load_dataset(resolve_dataset_path('../data/Europeana_data_processed.csv'))
     met, europeana = reorder_columns(met, europeana)
 
     print_example_rows(met, n=1)
@@ -285,7 +284,7 @@ def main():
     print("Blending dataframes")
     blended = blend_datasources(met, europeana)
     print_example_rows(blended, n=1)
-    blended.to_csv('../data/blended_data.csv', index=False)
+    save_dataset(blended, '../data/blended_data.parquet')
 
     print(f"Length of MET: {len(met)}")
     print(f"Length of Europeana: {len(europeana)}")
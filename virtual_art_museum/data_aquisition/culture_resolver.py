@@ -0,0 +1,137 @@
+"""
+===============================================
+Culture Resolver - Data Acquisition
+===============================================
+This module contains the mapping from Europeana countries to MET cultures.
+
+Europeana objects have a country where the MET has a culture. A country is looked
+up in a table of known countries, then matched as a substring of the countries in
+the table, then against every MET culture. Doing those scans for every row made
+Europeana processing cost rows x cultures. The resolver builds the table and the
+lowercased cultures once, and remembers the culture of every country it resolved,
+so the scans run once per distinct country.
+
+Classes
+----------
+    CultureResolver: Maps Europeana countries to MET cultures
+
+Authors
+----------
+    Madison Sanchez-Forman and Mya Strayer
+"""
+import pandas as pd
+
+UNKNOWN_CULTURE = 'Culture unknown'
+
+COUNTRY_TO_CULTURE = {
+    'United Kingdom': 'British',
+    'England': 'British',
+    'Scotland': 'British',
+    'Wales': 'British',
+    'Ireland': 'Irish',
+    'France': 'French',
+    'Germany': 'German',
+    'Italy': 'Italian',
+    'Spain': 'Spanish',
+    'Portugal': 'Portuguese',
+    'Netherlands': 'Dutch',
+    'Belgium': 'Belgian',
+    'Switzerland': 'Swiss',
+    'Austria': 'Austrian',
+    'Greece': 'Greek',
+    'Denmark': 'Danish',
+    'Sweden': 'Swedish',
+    'Norway': 'Norwegian',
+    'Finland': 'Finnish',
+    'Russia': 'Russian',
+    'Poland': 'Polish',
+    'Hungary': 'Hungarian',
+    'Czech Republic': 'Czech',
+    'Romania': 'Romanian',
+    'Bulgaria': 'Bulgarian',
+    'Turkey': 'Turkish'}
+
+def guess_country(culture: str):
+    """
+    Guesses the country of a culture by its suffix, e.g. Japanese -> Japan.
+
+    Parameters
+    ----------
+    culture (str): The culture, already stripped
+
+    Returns
+    -------
+    str: The guessed country, None if the culture has no known suffix
+    """
+    if culture.endswith(('ish', 'ese', 'ian')):
+        return culture[:-3]
+    if culture.endswith('ch'):
+        return culture[:-2] + 'ce'
+    return None
+
+# one public method, the class only exists to keep the memo of resolved countries
+class CultureResolver: # pylint: disable=too-few-public-methods
+    """
+    Maps Europeana countries to MET cultures, scanning once per distinct country.
+
+    A country resolves to, in order: the culture of the same country in the table,
+    the culture of the first country in the table it contains (case sensitive), the
+    first MET culture it contains (case insensitive), or 'Culture unknown'.
+
+    Parameters
+    ----------
+    cultures : iterable of str
+        the MET cultures, in the order they are tried
+    country_to_culture : dict, optional
+        the known countries, by default COUNTRY_TO_CULTURE. Cultures with a country
+        suffix that is not yet a known culture are added to it
+    """
+    def __init__(self, cultures, country_to_culture=None):
+        self.cultures = list(cultures)
+        self.country_to_culture = dict(COUNTRY_TO_CULTURE if country_to_culture is None
+                                       else country_to_culture)
+        for culture in self.cultures:
+            culture = str(culture).strip()
+            country_match = guess_country(culture)
+            if country_match and country_match not in self.country_to_culture.values():
+                self.country_to_culture[country_match] = culture
+
+        self._countries = list(self.country_to_culture.items())
+        self._lowered = [(culture.lower(), culture) for culture in self.cultures
+                         if isinstance(culture, str)]
+        self._resolved = {}
+
+    def resolve(self, country) -> str:
+        """
+        Finds the culture of a country, remembering the answer.
+
+        Parameters
+        ----------
+        country (str): The Europeana country, missing values are allowed
+
+        Returns
+        -------
+        str: The MET culture, 'Culture unknown' if none matches
+        """
+        if pd.isna(country) or country == 'Unknown':
+            return UNKNOWN_CULTURE
+        country = str(country).strip()
+        if country not in self._resolved:
+            self._resolved[country] = self._scan(country)
+        return self._resolved[country]
+
+    def _scan(self, country: str) -> str:
+        """ Scans the table, then the cultures, for a stripped country """
+        if country in self.country_to_culture:
+            return self.country_to_culture[country]
+
+        for known_country, culture in self._countries:
+            if known_country in country:
+                return culture
+
+        country_lower = country.lower()
+        for culture_lower, culture in self._lowered:
+            if culture_lower in country_lower:
+                return culture
+
+        return UNKNOWN_CULTURE
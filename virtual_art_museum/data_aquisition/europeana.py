@@ -12,10 +12,23 @@ We query all these terms and save as much data back as possible. In the future,
 we would love to add to this dataset.
 Number of unique objects in result: ~4,000
 
+pyeuropeana's search is a blocking call, so query terms are harvested in a thread
+pool driven by asyncio: up to HARVEST_CONCURRENCY terms run at once, each following
+its own cursor chain page by page, and every search request takes a token from one
+shared token bucket so the API as a whole sees at most SEARCH_RATE requests per
+second. A full harvest takes about as long as the slowest term instead of the sum
+of all of them.
+
 Classes
 ----------
     Europeana
 
+Functions
+----------
+    harvest_term: Follows the cursor chain of a single query term
+    harvest: Harvests many query terms concurrently
+    extract_years: Finds the year of every object in a dataframe
+
 References
 ----------
     https://europeana.eu/api/
@@ -24,20 +37,132 @@ Authors
 ----------
     Madison Sanchez-Forman and Mya Strayer
 """
+import asyncio
+import functools
 import re
 import os
+import time
+from concurrent.futures import ThreadPoolExecutor
 
 from dotenv import load_dotenv
 
 from pyeuropeana import utils
 from pyeuropeana import apis
+import numpy as np
 import pandas as pd
 
 from data_aquisition.async_utils import filter_objects # pylint: disable=import-error
 from data_aquisition.common_functions import ( # pylint: disable=import-error
     print_example_rows,
-    century_mapping
+    map_centuries
 )
+from data_aquisition.rate_limit import TokenBucket # pylint: disable=import-error
+from data_aquisition.storage import save_dataset # pylint: disable=import-error
+
+HARVEST_CONCURRENCY = 8 # query terms harvested at once
+SEARCH_RATE = 10        # search requests per second, shared by every term
+MAX_RESULTS = 500       # maximum number of results per query term, also the page size
+DATE_PATTERN = r'(\d{4})' # regex pattern YYYY
+YEAR_COLUMNS = ['description', 'title', 'creator'] # searched for a year in this order
+
+async def harvest_term(query: str, bucket: TokenBucket, executor, max_results=MAX_RESULTS):
+    """
+    Follows the cursor chain of a single query term.
+
+    Pages of a term depend on the previous page's cursor so they are fetched one
+    after the other, other terms run meanwhile.
+
+    Parameters
+    ----------
+    query (str): The query term
+    bucket (TokenBucket): Rate limit shared by every term
+    executor (ThreadPoolExecutor): Threads the blocking search calls run in
+    max_results (int): Maximum number of results for the term
+
+    Returns
+    -------
+    list: One dataframe per page of results, in cursor order
+    """
+    loop = asyncio.get_running_loop()
+    frames = []
+    cursor = '*' # Initial cursor value
+    total_results = 0
+    while cursor and total_results < max_results:
+        await bucket.acquire()
+        search = functools.partial(
+            apis.search,
+            query=query,
+            reusability='open AND permission', # ensure rights to use the data
+            cursor=cursor, # pass the cursor to the next page
+            qf='LANGUAGE:en AND TYPE:IMAGE',
+            rows=max_results # Maximum allowed per request
+        )
+        response = await loop.run_in_executor(executor, search)
+        if not response.get('items'): # if no results, break
+            break
+        # convert the response to a dataframe
+        frames.append(utils.search2df(response))
+
+        cursor = response.get('nextCursor') # move the pointer
+        total_results += len(response.get('items', []))
+        print(f"\t\tQuery Term: {query} - Total Results: {total_results}")
+    return frames
+
+async def harvest(query_terms, concurrency=HARVEST_CONCURRENCY, rate=SEARCH_RATE,
+                  max_results=MAX_RESULTS) -> pd.DataFrame:
+    """
+    Harvests many query terms concurrently.
+
+    Parameters
+    ----------
+    query_terms (iterable of str): The query terms
+    concurrency (int): Maximum number of terms harvested at once
+    rate (float): Maximum search requests per second across every term
+    max_results (int): Maximum number of results per term
+
+    Returns
+    -------
+    pd.DataFrame: The results of every term, in the order of query_terms
+    """
+    bucket = TokenBucket(rate)
+    semaphore = asyncio.Semaphore(concurrency)
+
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        async def bounded(query):
+            async with semaphore:
+                return await harvest_term(query, bucket, executor, max_results)
+        results = await asyncio.gather(*(bounded(query) for query in query_terms))
+
+    frames = [frame for term_frames in results for frame in term_frames]
+    if not frames:
+        return pd.DataFrame()
+    return pd.concat(frames, ignore_index=True)
+
+def extract_years(df: pd.DataFrame, columns=None) -> pd.Series:
+    """
+    Finds the year of every object, the vectorized form of Europeana.extract_year.
+
+    The first YYYY in the first column that has one is the year. Each column is
+    only searched (with Series.str.extract) in the rows where the columns before it
+    had no year, so most rows are searched once.
+
+    Parameters
+    ----------
+    df (pd.DataFrame): The objects
+    columns (list, optional): The columns to search in order, by default YEAR_COLUMNS
+
+    Returns
+    -------
+    pd.Series: The year of each object as an int, -1 where none was found
+    """
+    years = np.full(len(df), np.nan, dtype=object)
+    for col in YEAR_COLUMNS if columns is None else columns:
+        missing = np.flatnonzero(pd.isna(years))
+        if missing.size == 0:
+            break
+        found = df[col].iloc[missing].astype(str).str.extract(DATE_PATTERN, expand=False)
+        years[missing] = found.to_numpy(dtype=object)
+    return pd.Series(years, index=df.index).fillna(-1).astype(int)
 
 class Europeana:
     """
@@ -51,6 +176,8 @@ class Europeana:
     ----------
     save_final : bool, optional
         T/F on if actually want to save the result right now, by default False
+    cache_path : str, optional
+        path to a sqlite response cache so repeat runs skip unchanged image urls
 
     Attributes:
     ----------
@@ -58,9 +185,10 @@ class Europeana:
         dataframe of Europeana objects.
 
     """
-    def __init__(self, save_final=False):
+    def __init__(self, save_final=False, cache_path=None):
         """ Initalalizes class with empty dataframe """
         self.df = pd.DataFrame()
+        self.cache_path = cache_path
         current_dir = os.path.dirname(os.path.abspath(__file__))
         self.query_path = os.path.join(os.path.dirname(current_dir),
                                         'data',
@@ -68,15 +196,20 @@ class Europeana:
         self.df = self.create_final(save_final=save_final)
 
 
-    def bulk_requests(self, is_test=False):
+    def bulk_requests(self, is_test=False, concurrency=HARVEST_CONCURRENCY):
         """
         Queries the Europeana API for each query term in query_terms.csv
         Saves the results to a dataframe and filters out any objects without images.
 
-        This function interates through each query term in query_terms.csv,
-        and queries the Europeana API for each term. It then saves the results
+        This function harvests the query terms in query_terms.csv concurrently,
+        following each term's cursor chain (see harvest). It then saves the results
         to a dataframe and filters out any objects without images.
 
+        Parameters
+        ----------
+            is_test (bool, optional): only query the first 5 terms. Defaults to False.
+            concurrency (int, optional): number of terms queried at once.
+
         Returns:
         --------
             pd.DataFrame: dataframe of Europeana objects.
@@ -87,32 +220,17 @@ class Europeana:
         query_terms = set(query_terms.iloc[:, 0].tolist())
         print("\n\nBeginning to build data from Europeana.")
 
-        for query in query_terms:
-            cursor = '*'  # Initial cursor value
-            total_results = 0
-            max_results = 500 # Set a maximum number of results per query
-
-            while cursor and total_results < max_results:
-                response = apis.search(
-                    query=query,
-                    reusability = 'open AND permission', # ensure rights to use the data
-                    cursor=cursor, # pass the cursor to the next page
-                    qf='LANGUAGE:en AND TYPE:IMAGE',
-                    rows=max_results  # Maximum allowed per request
-                )
-                if not response.get('items'): # if no results, break
-                    break
-                # convert the response to a dataframe
-                df_new = utils.search2df(response)
-                self.df = pd.concat([self.df, df_new], ignore_index=True)
-
-                cursor = response.get('nextCursor') # move the pointer
-                total_results += len(response.get('items', []))
-                print(f"\t\tQuery Term: {query} - Total Results: {total_results}")
+        start_time = time.time()
+        harvested = asyncio.run(harvest(sorted(query_terms, key=str),
+                                           concurrency=concurrency))
+        self.df = pd.concat([self.df, harvested], ignore_index=True)
+        print(f"Harvested {len(harvested)} results for {len(query_terms)} query terms "
+              f"in {time.time() - start_time:.1f} seconds")
 
         self.df = self.df.dropna(subset=['image_url']) # drop any objects without images
         self.df = self.df.drop_duplicates(subset=['image_url']) # drop any duplicate images
-        self.df = filter_objects(self.df, flag="EUROPEANA") # filter out any objects without images
+        # filter out any objects without images
+        self.df = filter_objects(self.df, flag="EUROPEANA", cache_path=self.cache_path)
         print_example_rows(self.df, n=1)
         print(f"Found {len(self.df)} valid image urls")
         return self.df
@@ -153,7 +271,7 @@ class Europeana:
         --------
             pd.DataFrame: dataframe of Europeana objects.
         """
-        self.df['year'] = self.df.apply(self.extract_year, axis=1).astype(int)
+        self.df['year'] = extract_years(self.df)
         return self.df
 
     def process_data(self):
@@ -165,13 +283,12 @@ class Europeana:
         --------
             pd.DataFrame: dataframe of Europeana objects.
         """
-        self.df.fillna('Unknown', inplace=True) # fill missing values with 'Unknown'
-
         # Keep relevant columns
         cols_to_keep = ['europeana_id', 'image_url',
                         'title', 'creator', 
                         'description', 'country', 'provider']
-        self.df = self.df[cols_to_keep]
+        # fill missing values with 'Unknown', only in the columns that are kept
+        self.df = self.df[cols_to_keep].fillna('Unknown')
 
         # Create year column
         self.df = self.create_year_column()
@@ -180,7 +297,7 @@ class Europeana:
         self.df['repository'] = 'EUROPEANA'
 
         # Create Century column
-        self.df['Century'] = self.df['year'].apply(century_mapping)
+        self.df['Century'] = map_centuries(self.df['year'])
         self.df = self.df.replace(-1, "Unknown")
         return self.df
 
@@ -200,7 +317,7 @@ class Europeana:
         self.df = self.bulk_requests()
         self.df = self.process_data()
         if save_final:
-            self.df.to_csv(f"Europeana_data_v{version}.csv", index=False)
+            save_dataset(self.df, f"Europeana_data_v{version}.parquet")
         print_example_rows(self.df, n=5)
         return self.df
 
@@ -212,7 +329,7 @@ def main():
     load_dotenv()
     api_key = os.getenv('EUROPEANA_API_KEY')
     os.environ['EUROPEANA_API_KEY'] = api_key
-    Europeana()
+    Europeana(cache_path='../data/europeana_response_cache.sqlite')
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,103 @@
+"""
+===============================================
+HTTP Session - Data Acquisition
+===============================================
+This module contains the session factory shared by the MET and Europeana fetches.
+
+A default aiohttp.ClientSession has a global limit of 100 connections, no per-host
+limit, a 10 second DNS cache, 15 second keepalive and a single 5 minute total
+timeout. The MET fetch talks to one API host, so it wants every connection pointed
+at that host and kept alive for as long as possible. Europeana image urls are spread
+across hundreds of provider hosts, so it wants a larger pool, a small per-host limit
+(to be polite to small providers) and a long DNS cache. Both are built from the
+profiles below, and any setting can be overridden per call.
+
+aiohttp only speaks HTTP/1.1, so pooled keepalive connections are what removes the
+per-request connection setup; there is no HTTP/2 transport to switch to.
+
+References
+----------
+    https://docs.aiohttp.org/en/stable/client_reference.html#tcpconnector
+    https://docs.aiohttp.org/en/stable/client_quickstart.html#timeouts
+
+Functions
+----------
+    session_settings: Returns the settings for a source, with overrides applied
+    create_session: Creates a tuned aiohttp.ClientSession
+
+Authors
+----------
+    Madison Sanchez-Forman and Mya Strayer
+"""
+import aiohttp
+
+DEFAULT_SETTINGS = {
+    'limit': 100,               # connections across all hosts
+    'limit_per_host': 0,        # 0 means no per-host limit
+    'ttl_dns_cache': 300,       # seconds a DNS lookup is reused
+    'keepalive_timeout': 60,    # seconds an idle connection is kept in the pool
+    'connect_timeout': 10,      # seconds to get a connection (including DNS and TLS)
+    'read_timeout': 30,         # seconds to wait between chunks of the response
+    'total_timeout': None,      # no cap on the whole request, retries handle slow hosts
+}
+
+SESSION_PROFILES = {
+    # a single API host, so every connection can go to it
+    'MET': {'limit': 100, 'limit_per_host': 100},
+    # hundreds of image hosts, many of them small providers
+    'EUROPEANA': {'limit': 200, 'limit_per_host': 8, 'ttl_dns_cache': 3600},
+}
+
+def session_settings(flag: str = None, **overrides) -> dict:
+    """
+    Returns the connection settings for a source.
+
+    Parameters
+    ----------
+    flag (str, optional): 'MET' or 'EUROPEANA', None for the defaults
+    overrides: Any key of DEFAULT_SETTINGS to change
+
+    Returns
+    -------
+    dict: The merged settings
+    """
+    if flag is not None and flag not in SESSION_PROFILES:
+        raise ValueError(f"Invalid source given: {flag}. Must be either MET or EUROPEANA")
+    unknown = set(overrides) - set(DEFAULT_SETTINGS)
+    if unknown:
+        raise ValueError(f"Unknown session settings: {sorted(unknown)}")
+
+    settings = dict(DEFAULT_SETTINGS)
+    settings.update(SESSION_PROFILES.get(flag, {}))
+    settings.update(overrides)
+    return settings
+
+def create_session(flag: str = None, **overrides) -> aiohttp.ClientSession:
+    """
+    Creates an aiohttp.ClientSession with a tuned connector and granular timeouts.
+
+    Must be called from inside a running event loop.
+
+    Parameters
+    ----------
+    flag (str, optional): 'MET' or 'EUROPEANA', None for the defaults
+    overrides: Any key of DEFAULT_SETTINGS to change
+
+    Returns
+    -------
+    aiohttp.ClientSession: The session, to be used as an async context manager
+    """
+    settings = session_settings(flag, **overrides)
+    connector = aiohttp.TCPConnector(
+        limit=settings['limit'],
+        limit_per_host=settings['limit_per_host'],
+        use_dns_cache=True,
+        ttl_dns_cache=settings['ttl_dns_cache'],
+        keepalive_timeout=settings['keepalive_timeout'],
+    )
+    timeout = aiohttp.ClientTimeout(
+        total=settings['total_timeout'],
+        sock_connect=settings['connect_timeout'],
+        sock_read=settings['read_timeout'],
+    )
+    return aiohttp.ClientSession(connector=connector, timeout=timeout)
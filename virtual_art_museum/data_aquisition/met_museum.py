@@ -19,11 +19,17 @@ Functions
 ----------
     _request_image_urls: Requests image urls from the MET API
     _run_full_pipeline: Runs the full pipeline
+    sync: Updates a previously built dataset with objects changed since the last run
     split_delimited: Splits delimited values into a list
+    split_delimited_column: Vectorized split_delimited over a whole column
     clean_culture: Cleans culture column
+    clean_culture_column: Vectorized clean_culture over a whole column
     replace_empty: Replaces empty values with 'Unknown'
-    process_data: Filters to only relevant columns and renames / cleans columns
-    filter_and_save: Filters the dataframe and saves it to a new csv file
+    process_data: Filters to only relevant columns and renames / cleans columns,
+        optionally in row-range shards spread over worker processes
+    _clean_shard: Cleans one shard of a Feather file, run in a worker process
+    stream_pipeline: Requests image urls and cleans MetObjects.txt chunk by chunk
+    filter_and_save: Filters the dataframe and saves it to a new parquet / csv file
     main: Main function to run the pipeline
 
 References
@@ -35,16 +41,64 @@ Authors
     Madison Sanchez-Forman and Mya Strayer
 """
 
+import json
+import os
 import re
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import nullcontext
+from datetime import date
+from math import ceil
 
 import pandas as pd
-
-from data_aquisition.async_utils import filter_objects # pylint: disable=import-error
+import pyarrow as pa
+from pyarrow import feather
+
+from data_aquisition.async_utils import ( # pylint: disable=import-error
+    build_url_dict,
+    changed_object_ids,
+    filter_objects,
+    resolve_objects,
+    resolve_objects_chunked
+)
+from data_aquisition.checkpoint import ResultJournal, chunked # pylint: disable=import-error
+from data_aquisition.response_cache import SQLiteResponseCache # pylint: disable=import-error
+from data_aquisition.storage import ( # pylint: disable=import-error
+    CSV_CHUNK_SIZE,
+    DatasetWriter,
+    read_csv_chunks,
+    save_dataset
+)
 from data_aquisition.common_functions import ( # pylint: disable=import-error
     print_example_rows,
-    century_mapping
+    map_centuries,
+    map_distinct
 )
 
+DELIMITER = re.compile(r'\s*\|\s*')
+CULTURE_QUALIFIERS = re.compile(r'\b(?:probably|possibly)\b\s*', flags=re.IGNORECASE)
+COLS_TO_KEEP = ['Object Number', 'Department', 'Title', 'Culture',
+                'Artist Display Name', 'Artist Display Bio',
+                'Object Begin Date', 'Medium', 'Repository', 'Tags',
+                'image_url']
+# the columns of MetObjects.txt the pipeline reads, image_url only once it has been requested
+RAW_COLUMNS = ['Object ID'] + COLS_TO_KEEP
+MIN_SHARD_ROWS = 50000 # smaller shards cost more in process startup and IPC than they save
+
+def _str_accessor(column: pd.Series):
+    """ Returns column.str, or None if the column holds no strings (e.g. Year) """
+    try:
+        return column.str
+    except AttributeError:
+        return None
+
+def _is_empty(column: pd.Series) -> pd.Series:
+    """ Marks missing and blank cells of a column """
+    text = _str_accessor(column) if column.dtype == object else None
+    if text is None:
+        text = column.astype(str).str
+    return column.isna() | text.strip().eq('')
+
 
 class MetMuseum:
     """
@@ -55,10 +109,18 @@ class MetMuseum:
 
     Parameters
     ----------
-    file_path : str
+    file_path : str or pd.DataFrame
         path to met objects file. Can either be the unfiltered or filtered version.
+        an already loaded dataframe of met objects is used as is.
     is_test : bool, optional
         if true, only the first 250 objects will be used. will be used in test cases.
+    cache_path : str, optional
+        path to a sqlite response cache so repeat runs skip unchanged objects.
+    journal_path : str, optional
+        path to a JSON lines journal. if given, image urls are resolved in checkpointed
+        chunks and a restarted run skips every object already in the journal.
+    chunk_size : int, optional
+        number of objects resolved per checkpoint, by default 5000
 
     Attributes
     ----------
@@ -66,9 +128,16 @@ class MetMuseum:
         dataframe of met objects.
     """
 
-    def __init__(self, file_path, run_full_pipeline=False, save_name='./data/test_met_objects.csv'):
+    def __init__(self, file_path, run_full_pipeline=False, save_name='./data/test_met_objects.csv', # pylint: disable=too-many-arguments
+                 cache_path=None, journal_path=None, chunk_size=5000):
         """ Initalizes class with given file path """
-        self.df = pd.read_csv(file_path, dtype='str')
+        if isinstance(file_path, pd.DataFrame):
+            self.df = file_path.copy()
+        else:
+            self.df = pd.read_csv(file_path, dtype='str')
+        self.cache_path = cache_path
+        self.journal_path = journal_path
+        self.chunk_size = chunk_size
         # If has images is false, we need to run request pipeline
         if run_full_pipeline:
             # save name is set to a test file since we don't want to overwrite the original
@@ -88,12 +157,165 @@ class MetMuseum:
         """
         print("\n\nBeginning to build data from the Metropolitan Museum of Art.")
         print("Requesting image urls...")
-        self.df = filter_objects(self.df, 'MET')
+        self.df = self._resolve_all()
         self.df = self.process_data()
         if save_final:
-            self.df.to_csv(path, index=False)
+            save_dataset(self.df, path)
         # print("Example row from the final dataframe:")
         # print_example_rows(self.df, n=1)
+
+    def _resolve_all(self, resolved: dict = None) -> pd.DataFrame:
+        """
+        Requests the image url of every object, checkpointed if a journal was given.
+
+        Parameters
+        ----------
+        resolved : dict, optional
+            the journal already loaded, see _request_image_urls
+
+        Returns
+        -------
+        pd.DataFrame of objects with a valid image url
+        """
+        if self.journal_path:
+            return self._request_image_urls(resolved)
+        return filter_objects(self.df, 'MET', cache_path=self.cache_path)
+
+    def sync(self, dataset_path, state_path=None) -> pd.DataFrame:
+        """
+        Brings a previously built dataset of objects with image urls up to date.
+
+        The first call (no dataset or sync state yet) resolves every object and saves
+        the result. Every later call asks the MET API which objects changed since the
+        last sync (/objects?metadataDate=), resolves only those and merges them into
+        the saved dataset: changed objects get their new image url, objects that lost
+        their image are dropped, and objects that could not be fetched keep their old row.
+
+        Changed objects that are missing from the loaded MetObjects.txt cannot be added,
+        since their other columns come from that file; download a newer dump to pick them up.
+
+        Parameters
+        ----------
+        dataset_path : str
+            csv of objects with an image_url column (the output of the request stage)
+        state_path : str, optional
+            json file holding the date of the last sync, by default dataset_path + '.sync.json'
+
+        Returns
+        -------
+        pd.DataFrame of objects with a valid image url, also stored in self.df
+        """
+        state_path = state_path or f"{dataset_path}.sync.json"
+        sync_date = date.today().isoformat() # taken before querying so nothing slips through
+
+        if not (os.path.exists(dataset_path) and os.path.exists(state_path)):
+            print("No previous sync found, requesting image urls for every object...")
+            self.df = self._resolve_all()
+        else:
+            with open(state_path, "r", encoding="utf-8") as file:
+                since = json.load(file)['last_sync']
+            self.df = self._merge_changes(pd.read_csv(dataset_path, dtype='str'), since)
+
+        self.df.to_csv(dataset_path, index=False)
+        with open(state_path, "w", encoding="utf-8") as file:
+            json.dump({'last_sync': sync_date}, file)
+        return self.df
+
+    def _merge_changes(self, previous, since) -> pd.DataFrame:
+        """
+        Resolves objects changed since a date and merges them into a previous dataset.
+
+        Parameters
+        ----------
+        previous : pd.DataFrame
+            objects with image urls from the last sync
+        since : str
+            date of the last sync in YYYY-MM-DD format
+
+        Returns
+        -------
+        pd.DataFrame of objects with a valid image url
+        """
+        changed = set(changed_object_ids(since))
+        rows = self.df[self.df['Object ID'].isin(changed)].copy()
+        print(f"{len(changed)} objects changed since {since}, "
+              f"{len(changed) - rows['Object ID'].nunique()} of them are not in the loaded dump")
+
+        url_dict, _ = build_url_dict(rows, 'MET')
+        if self.cache_path:
+            # these objects changed, so always revalidate their cached responses
+            with SQLiteResponseCache(self.cache_path, ttl=0) as cache:
+                resolved = resolve_objects(url_dict, 'MET', cache=cache)
+        else:
+            resolved = resolve_objects(url_dict, 'MET')
+        # objects that could not be fetched keep their previous row
+        resolved = {obj_id: url for obj_id, url in resolved.items() if url is not None}
+
+        rows['image_url'] = rows['Object ID'].map(resolved)
+        rows = rows[rows['image_url'].notna() & (rows['image_url'] != "")]
+        merged = pd.concat([previous[~previous['Object ID'].isin(resolved.keys())], rows],
+                           ignore_index=True)
+        print(f"\tUpdated {len(rows)} objects, dataset went from {len(previous)} to {len(merged)}")
+        return merged
+
+    def _request_image_urls(self, resolved: dict = None) -> pd.DataFrame:
+        """
+        Requests image urls from the MET API in checkpointed chunks.
+
+        Results are appended to the journal after every chunk, so a crashed run only
+        loses the chunk that was in flight. Objects already in the journal are skipped.
+
+        Parameters
+        ----------
+        resolved : dict, optional
+            the journal already loaded with ResultJournal.load, updated in place. lets
+            stream_pipeline read the journal once instead of once per chunk, by default
+            the journal is loaded here
+
+        Returns
+        -------
+        pd.DataFrame of objects with a valid image url
+        """
+        journal = ResultJournal(self.journal_path)
+        if resolved is None:
+            resolved = journal.load()
+
+        url_dict, _ = build_url_dict(self.df, 'MET')
+        pending = [url for url, obj_id in url_dict.items() if obj_id not in resolved]
+        n_chunks = ceil(len(pending) / self.chunk_size)
+        print(f"{len(url_dict) - len(pending)} objects already resolved, {len(pending)} remaining "
+              f"in {n_chunks} chunks")
+
+        n_done = 0
+        def checkpoint(chunk, results):
+            """ Journals a chunk's results as soon as it is resolved """
+            nonlocal n_done
+            # objects that could not be fetched stay out of the journal and are retried next run
+            results = {obj_id: url for obj_id, url in results.items() if url is not None}
+            journal.append(results)
+            resolved.update(results)
+            n_done += 1
+            n_valid = sum(1 for url in results.values() if url)
+            print(f"\tChunk {n_done}/{n_chunks}: {n_valid}/{len(chunk)} objects with images, "
+                  f"{len(chunk) - len(results)} to retry")
+
+        cache = SQLiteResponseCache(self.cache_path) if self.cache_path else None
+        try:
+            if pending:
+                # one session and rate limiter for every chunk, so they keep what they learnt
+                resolve_objects_chunked(({url: url_dict[url] for url in urls}
+                                         for urls in chunked(pending, self.chunk_size)),
+                                        'MET', checkpoint, cache=cache)
+        finally:
+            if cache is not None:
+                cache.close()
+
+        image_urls = self.df['Object ID'].map(resolved)
+        filtered_df = self.df[image_urls.notna() & (image_urls != "")].copy()
+        filtered_df['image_url'] = image_urls[filtered_df.index]
+        print(f"\tFiltered shape: {filtered_df.shape}")
+        return filtered_df
+
     def split_delimited(self, cell):
         """
         Splits delimited values into a list
@@ -111,6 +333,30 @@ class MetMuseum:
             return ", ".join(items)
         return cell
 
+    def split_delimited_column(self, column):
+        """
+        Splits delimited values of a whole column, same output as column.apply(split_delimited)
+        Parameters
+        ----------
+        column : pd.Series
+            column to split
+
+        Returns
+        -------
+        pd.Series of split values
+        """
+        text = _str_accessor(column)
+        if text is None:
+            return column
+        delimited = text.contains('|', regex=False, na=False)
+        if not delimited.any():
+            return column
+
+        column = column.copy()
+        column[delimited] = (column[delimited].str.strip()
+                             .str.replace(DELIMITER, ', ', regex=True))
+        return column
+
     def clean_culture(self, culture):
         """
         Cleans culture column
@@ -126,10 +372,31 @@ class MetMuseum:
         if not isinstance(culture, str):
             return "Culture unknown"
 
-        cleaned = re.sub(r'\b(?:probably|possibly)\b\s*', '', culture, flags=re.IGNORECASE)
+        cleaned = CULTURE_QUALIFIERS.sub('', culture)
         cleaned = cleaned.split(',')[0].strip()
         return cleaned
 
+    def clean_culture_column(self, column):
+        """
+        Cleans a whole culture column, same output as column.apply(clean_culture)
+        Parameters
+        ----------
+        column : pd.Series
+            cultures to clean
+
+        Returns
+        -------
+        pd.Series of cleaned cultures
+        """
+        text = _str_accessor(column)
+        if text is None:
+            return pd.Series("Culture unknown", index=column.index, name=column.name)
+
+        cleaned = (text.replace(CULTURE_QUALIFIERS, '', regex=True)
+                   .str.split(',', n=1).str[0].str.strip())
+        # anything that is not a string comes out of the .str methods as NaN
+        return cleaned.fillna("Culture unknown")
+
     def replace_empty(self):
         """
         Replaces empty values with 'Unknown'
@@ -143,12 +410,9 @@ class MetMuseum:
         pd.DataFrame with empty values replaced with 'Unknown'
         """
         for col in self.df.columns:
-            is_empty = (
-                self.df[col].isna() |
-                (self.df[col] is None) |
-                (self.df[col].astype(str).str.strip() == ''))
-
-            self.df.loc[is_empty, col] = f"{col} unknown"
+            is_empty = _is_empty(self.df[col])
+            if is_empty.any():
+                self.df.loc[is_empty, col] = f"{col} unknown"
 
         return self.df
 
@@ -168,19 +432,57 @@ class MetMuseum:
         cleaned = re.sub(r'^\W+|\W+$', '', cleaned)
         return cleaned.strip()
 
-    def process_data(self):
+    def _clean_values(self, col, values):
+        """
+        Runs the text cleaning of process_data on values of a single column
+        Parameters
+        ----------
+        col : str
+            name of the column the values belong to
+        values : pd.Series
+            values to clean
+
+        Returns
+        -------
+        pd.Series of cleaned values
+        """
+        values = self.split_delimited_column(values)
+        if col == 'Culture':
+            values = self.clean_culture_column(values)
+        return values.mask(_is_empty(values), f"{col} unknown")
+
+    def process_data(self, workers: int = 1, shard_rows: int = None, executor=None):
         """
         Filters to only relevant columns and renames / cleans columns
+
+        With several workers the rows are split into contiguous row ranges, each cleaned
+        in its own process. The relevant columns are written once to an uncompressed
+        Feather (Arrow IPC) file that every worker memory maps, so shards are not pickled,
+        and each worker hands its result back the same way. Cleaning works value by value,
+        so the shards concatenated in row order are identical to a serial run.
+
+        Parameters
+        ----------
+        workers : int, optional
+            number of worker processes, 1 cleans in this process, by default 1
+        shard_rows : int, optional
+            rows per shard, by default the rows split evenly over the workers but at
+            least MIN_SHARD_ROWS
+        executor : ProcessPoolExecutor, optional
+            pool to clean the shards in, kept across calls by stream_pipeline, by default
+            a pool is started for this call
+
         Returns
         -------
         pd.DataFrame with relevant columns
         """
-        cols_to_keep = ['Object Number', 'Department', 'Title', 'Culture',
-                        'Artist Display Name', 'Artist Display Bio',
-                        'Object Begin Date', 'Medium', 'Repository', 'Tags',
-                        'image_url']
+        if workers > 1:
+            shard_rows = shard_rows or max(ceil(len(self.df) / workers), MIN_SHARD_ROWS)
+            if len(self.df) > shard_rows:
+                self.df = self._process_sharded(workers, shard_rows, executor)
+                return self.df
 
-        self.df = self.df[cols_to_keep]
+        self.df = self.df[COLS_TO_KEEP].copy()
         # Change repository to MET
         self.df['Repository'] = 'MET'
 
@@ -192,36 +494,121 @@ class MetMuseum:
                            'Artist Display Bio' : 'Artist biographic information',
                            'Object Begin Date' : 'Year'}, inplace=True)
 
-        # Split delimited values into a list
-        for col in self.df.columns:
-            self.df[col] = self.df[col].apply(self.split_delimited)
+        # Split delimited values, clean culture and replace empty values with 'Unknown',
+        # once per distinct value of each text column
+        for col in self.df.columns.drop('Year'):
+            self.df[col] = map_distinct(self.df[col],
+                                        lambda values, col=col: self._clean_values(col, values))
 
-        # Clean culture column
-        self.df['Culture'] = self.df['Culture'].apply(self.clean_culture)
+        # Create Century column
+        self.df['Century'] = map_centuries(self.df['Year'])
+        return self.df
 
-        # Replace empty values with 'Uknown'
-        self.df = self.replace_empty()
+    def _process_sharded(self, workers: int, shard_rows: int, executor=None) -> pd.DataFrame:
+        """
+        Runs process_data over row-range shards in worker processes.
 
-        # Clean title column
-        self.df['Title'].apply(self.clean_title)
+        Parameters
+        ----------
+        workers : int
+            number of worker processes
+        shard_rows : int
+            rows per shard
+        executor : ProcessPoolExecutor, optional
+            pool to use, by default one is started and shut down here
 
-        # Create Century column
-        self.df['Century'] = self.df['Year'].apply(century_mapping)
-        return self.df
+        Returns
+        -------
+        pd.DataFrame with relevant columns, in the original row order and index
+        """
+        bounds = [(start, min(start + shard_rows, len(self.df)))
+                  for start in range(0, len(self.df), shard_rows)]
+        print(f"\tCleaning {len(self.df)} objects in {len(bounds)} shards "
+              f"on {min(workers, len(bounds))} processes")
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            source = os.path.join(tmp_dir, "raw.feather")
+            table = pa.Table.from_pandas(self.df[COLS_TO_KEEP], preserve_index=False)
+            feather.write_feather(table, source, compression='uncompressed')
+            del table
+
+            targets = [os.path.join(tmp_dir, f"shard_{i}.feather") for i in range(len(bounds))]
+            pool = (nullcontext(executor) if executor is not None
+                    else ProcessPoolExecutor(max_workers=min(workers, len(bounds))))
+            with pool as pool:
+                # map keeps the order of the shards, whichever finishes first
+                targets = list(pool.map(_clean_shard, [source] * len(bounds),
+                                        *zip(*bounds), targets))
+            cleaned = pd.concat([feather.read_table(target).to_pandas() for target in targets],
+                                ignore_index=True)
+        cleaned.index = self.df.index
+        return cleaned
 
-    def filter_and_save(self, path, process_data=True) -> None:
+    def filter_and_save(self, path, process_data=True, workers=1) -> None:
         """
-        Filters the dataframe and saves it to a new csv file. assumes we already have image urls.
+        Filters the dataframe and saves it to a new file. assumes we already have image urls.
 
         Parameters
         ----------
         path : str
-            path to save the final dataframe
+            path to save the final dataframe, .parquet / .feather / .csv
+        workers : int, optional
+            number of processes cleaning the data, by default 1
         """
         if process_data:
-            self.df = self.process_data()
+            self.df = self.process_data(workers=workers)
             print_example_rows(self.df, n=1)
-        self.df.to_csv(path, index=False)
+        save_dataset(self.df, path)
+
+def stream_pipeline(file_path, save_path, chunk_rows=CSV_CHUNK_SIZE, fetch_images=True, # pylint: disable=too-many-arguments
+                    workers=1, cache_path=None, journal_path=None) -> int:
+    """
+    Requests image urls and cleans a MET objects file chunk by chunk.
+
+    Loading MetObjects.txt whole parses every one of its columns into Python strings,
+    though only RAW_COLUMNS are used. Here the file is streamed with read_csv_chunks,
+    reading only those columns, and every chunk is resolved, cleaned and appended to
+    save_path before the next one is read, so peak memory is bounded by chunk_rows.
+    The result is the same as MetMuseum(file_path, ...) followed by filter_and_save.
+
+    Parameters
+    ----------
+    file_path : str
+        path to the MET objects file, MetObjects.txt or a file that already has image urls
+    save_path : str
+        path to save the cleaned objects, .parquet / .feather / .csv
+    chunk_rows : int, optional
+        number of rows read at a time, by default CSV_CHUNK_SIZE
+    fetch_images : bool, optional
+        request image urls from the MET API. if false the file must have an image_url
+        column, by default True
+    workers : int, optional
+        number of processes cleaning each chunk, by default 1. one pool serves every
+        chunk, and only chunks above MIN_SHARD_ROWS are sharded, so workers need a
+        chunk_rows of a few MIN_SHARD_ROWS to pay off
+    cache_path : str, optional
+        path to a sqlite response cache, see MetMuseum
+    journal_path : str, optional
+        path to a JSON lines journal, see MetMuseum
+
+    Returns
+    -------
+    int: number of objects saved
+    """
+    # the journal is read once, not once per chunk
+    resolved = ResultJournal(journal_path).load() if fetch_images and journal_path else None
+    # started once, not once per chunk, smaller chunks are cleaned in this process
+    pool = ProcessPoolExecutor(max_workers=workers) if workers > 1 else nullcontext()
+    # the columns of a cleaned chunk, saved if every object is filtered out
+    template = MetMuseum(pd.DataFrame(columns=RAW_COLUMNS, dtype='str')).process_data()
+    with pool as executor, DatasetWriter(save_path, template) as writer:
+        for i, chunk in enumerate(read_csv_chunks(file_path, RAW_COLUMNS, chunk_rows)):
+            met = MetMuseum(chunk, cache_path=cache_path, journal_path=journal_path)
+            if fetch_images:
+                met.df = met._resolve_all(resolved) # pylint: disable=protected-access
+            if len(met.df):
+                writer.write(met.process_data(workers=workers, executor=executor))
+            print(f"\tChunk {i + 1}: {len(chunk)} objects read, {writer.rows} saved so far")
+    return writer.rows
 
 def main():
     """
@@ -230,8 +617,38 @@ def main():
     # met = MetMuseum('../data/MetObjects_final.csv', run_full_pipeline=True)
     # met.filter_and_save(path='../data/MetObjects_final_filtered_II.csv')
     # print(f"Length of final filtered dataframe: {len(met.df)}")
-    met_test = MetMuseum('../data/MetObjects.txt', run_full_pipeline=True)
-    met_test.filter_and_save(path='../data/MetObjects_test.csv', process_data=True)
+    met_test = MetMuseum('../data/MetObjects.txt',
+                         cache_path='../data/met_response_cache.sqlite',
+                         journal_path='../data/met_image_urls.jsonl')
+    # only the first sync requests every object, later ones fetch what changed since
+    met_test.sync('../data/MetObjects_final.csv')
+    met_test.filter_and_save(path='../data/MetObjects_test.parquet', process_data=True,
+                             workers=os.cpu_count())
+
+def _clean_shard(source: str, start: int, stop: int, target: str) -> str:
+    """
+    Cleans rows [start, stop) of a Feather file into another one, run in a worker process.
+
+    Parameters
+    ----------
+    source : str
+        uncompressed Feather file of the raw objects, memory mapped so only the
+        pages of this shard are read
+    start : int
+        first row of the shard
+    stop : int
+        row after the last row of the shard
+    target : str
+        Feather file the cleaned shard is written to
+
+    Returns
+    -------
+    str: target
+    """
+    table = feather.read_table(source, memory_map=True).slice(start, stop - start)
+    cleaned = MetMuseum(table.to_pandas()).process_data()
+    feather.write_feather(cleaned.reset_index(drop=True), target, compression='uncompressed')
+    return target
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,245 @@
+"""
+===============================================
+Rate Limiting - Data Acquisition
+===============================================
+This module contains the rate limiting and retry helpers used by async_utils.fetch.
+
+A fixed number of concurrent requests either leaves throughput on the table or
+trips the MET API's rate limit, which answers with bursts of 429 / 5xx responses.
+Each host therefore gets a token bucket (requests per second) and an adaptive
+concurrency limit that grows additively while requests succeed and is cut in half
+whenever the host pushes back (AIMD, the same scheme TCP uses for congestion control).
+Retry-After headers pause the host's bucket, and failed requests are retried with
+jittered exponential backoff.
+
+References
+----------
+    https://metmuseum.github.io/ (80 requests per second limit)
+    https://aws.amazon.com/blogs/architecture/exponential-backoff-and-jitter/
+
+Classes
+----------
+    TokenBucket: Requests per second limit for a single host
+    AdaptiveConcurrency: AIMD concurrency limit for a single host
+    RateLimiter: Per-host token buckets and concurrency limits
+
+Functions
+----------
+    backoff_delay: Jittered exponential backoff for a retry attempt
+    parse_retry_after: Parses a Retry-After header into seconds
+
+Authors
+----------
+    Madison Sanchez-Forman and Mya Strayer
+"""
+import asyncio
+import random
+import time
+from email.utils import parsedate_to_datetime
+from urllib.parse import urlsplit
+
+# requests per second and maximum concurrent requests for hosts we know about
+HOST_LIMITS = {
+    'collectionapi.metmuseum.org': (80, 100),
+}
+DEFAULT_HOST_LIMITS = (20, 20) # Europeana image urls are spread across many small providers
+
+def backoff_delay(attempt: int, base: float = 0.5, cap: float = 30.0) -> float:
+    """
+    Computes a "full jitter" exponential backoff delay.
+
+    Parameters
+    ----------
+    attempt (int): The retry attempt, starting at 0
+    base (float): The delay of the first attempt in seconds
+    cap (float): The maximum delay in seconds
+
+    Returns
+    -------
+    float: A random delay between 0 and min(cap, base * 2 ** attempt)
+    """
+    return random.uniform(0, min(cap, base * 2 ** attempt))
+
+def parse_retry_after(value) -> float:
+    """
+    Parses a Retry-After header, which is either a number of seconds or an HTTP date.
+
+    Parameters
+    ----------
+    value (str): The header value, may be None
+
+    Returns
+    -------
+    float: Seconds to wait, or None if the header is missing or invalid
+    """
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        retry_at = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    return max(0.0, retry_at.timestamp() - time.time())
+
+class TokenBucket:
+    """
+    Token bucket that limits the request rate to a single host.
+
+    Tokens refill continuously at rate per second up to capacity. acquire takes a
+    token, sleeping if the bucket is empty. Since the event loop is single threaded,
+    a token is reserved before sleeping so concurrent callers queue up fairly.
+
+    Parameters
+    ----------
+    rate : float
+        tokens added per second
+    capacity : float, optional
+        maximum burst size, by default one second worth of tokens
+    """
+    def __init__(self, rate, capacity=None):
+        self.rate = rate
+        self.capacity = capacity or rate
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.blocked_until = 0.0
+
+    def reserve(self, now=None) -> float:
+        """
+        Takes a token and returns how long the caller has to wait before using it.
+
+        Parameters
+        ----------
+        now (float, optional): The current time.monotonic()
+
+        Returns
+        -------
+        float: Seconds to wait, 0 if a token was available
+        """
+        now = time.monotonic() if now is None else now
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        self.tokens -= 1
+        return max(0.0, -self.tokens / self.rate, self.blocked_until - now)
+
+    async def acquire(self) -> None:
+        """ Waits until a token is available """
+        wait = self.reserve()
+        if wait > 0:
+            await asyncio.sleep(wait)
+
+    def pause(self, seconds: float) -> None:
+        """ Stops handing out tokens for the given number of seconds (Retry-After) """
+        self.blocked_until = max(self.blocked_until, time.monotonic() + seconds)
+
+class AdaptiveConcurrency:
+    """
+    Additive-increase / multiplicative-decrease limit on concurrent requests.
+
+    Every successful request raises the limit by increase / limit, so the limit grows
+    by about `increase` per round trip of requests. Every throttled request multiplies
+    the limit by decrease.
+
+    Parameters
+    ----------
+    maximum : int
+        largest allowed limit
+    initial : int, optional
+        starting limit, by default half of maximum
+    minimum : int, optional
+        smallest allowed limit, by default 1
+    increase : float, optional
+        additive increase per round trip, by default 1
+    decrease : float, optional
+        multiplicative decrease when throttled, by default 0.5
+    """
+    def __init__(self, maximum, initial=None, minimum=1, increase=1.0, decrease=0.5): # pylint: disable=too-many-arguments
+        self.maximum = maximum
+        self.minimum = minimum
+        self.limit = float(initial or max(minimum, maximum // 2))
+        self.increase = increase
+        self.decrease = decrease
+        self.in_flight = 0
+        self._condition = None
+
+    def _get_condition(self) -> asyncio.Condition:
+        """ Creates the condition lazily so it binds to the running event loop """
+        if self._condition is None:
+            self._condition = asyncio.Condition()
+        return self._condition
+
+    async def acquire(self) -> None:
+        """ Waits until fewer than limit requests are in flight """
+        condition = self._get_condition()
+        async with condition:
+            while self.in_flight >= int(self.limit):
+                await condition.wait()
+            self.in_flight += 1
+
+    async def release(self, throttled: bool = False) -> None:
+        """
+        Frees a slot and adjusts the limit.
+
+        Parameters
+        ----------
+        throttled (bool): True if the host pushed back (429 / 503 / connection error)
+        """
+        condition = self._get_condition()
+        async with condition:
+            self.in_flight -= 1
+            if throttled:
+                self.limit = max(self.minimum, self.limit * self.decrease)
+            else:
+                self.limit = min(self.maximum, self.limit + self.increase / self.limit)
+            condition.notify_all()
+
+class RateLimiter:
+    """
+    Per-host token buckets and adaptive concurrency limits.
+
+    Parameters
+    ----------
+    host_limits : dict, optional
+        maps host -> (requests per second, maximum concurrency), by default HOST_LIMITS
+    default_limits : tuple, optional
+        (requests per second, maximum concurrency) for any other host
+    """
+    def __init__(self, host_limits=None, default_limits=DEFAULT_HOST_LIMITS):
+        self.host_limits = HOST_LIMITS if host_limits is None else host_limits
+        self.default_limits = default_limits
+        self._hosts = {}
+
+    def _host(self, url: str):
+        """ Returns the (TokenBucket, AdaptiveConcurrency) pair for the host of url """
+        host = urlsplit(url).hostname or ''
+        if host not in self._hosts:
+            rate, concurrency = self.host_limits.get(host, self.default_limits)
+            self._hosts[host] = (TokenBucket(rate), AdaptiveConcurrency(concurrency))
+        return self._hosts[host]
+
+    def concurrency(self, url: str) -> float:
+        """ Returns the current concurrency limit for the host of url """
+        return self._host(url)[1].limit
+
+    async def acquire(self, url: str) -> None:
+        """ Waits for a concurrency slot and a token for the host of url """
+        bucket, concurrency = self._host(url)
+        await concurrency.acquire()
+        await bucket.acquire()
+
+    async def release(self, url: str, throttled: bool = False, retry_after: float = None) -> None:
+        """
+        Releases the slot taken by acquire.
+
+        Parameters
+        ----------
+        url (str): The url that was requested
+        throttled (bool): True if the host pushed back
+        retry_after (float): Seconds the host asked us to wait, if any
+        """
+        bucket, concurrency = self._host(url)
+        if retry_after:
+            bucket.pause(retry_after)
+        await concurrency.release(throttled=throttled)
@@ -0,0 +1,190 @@
+"""
+===============================================
+Response Cache - Data Acquisition
+===============================================
+This module contains the on-disk cache used by async_utils.fetch.
+
+Almost none of the ~485k MET objects change between runs of the acquisition
+pipeline, so re-requesting every url on every run wastes hours. The cache stores
+the resolved result of each url (the MET primaryImage, or the validated Europeana
+image url) together with the ETag / Last-Modified validators the server sent.
+Fresh entries are returned without touching the network, stale entries are
+revalidated with a conditional request, and entries older than max_age are evicted.
+
+Classes
+----------
+    CacheEntry: A single cached result and its validators
+    ResponseCache: Base class describing the cache interface used by fetch
+    SQLiteResponseCache: SQLite implementation of ResponseCache
+
+Authors
+----------
+    Madison Sanchez-Forman and Mya Strayer
+"""
+import abc
+import sqlite3
+import time
+from collections import namedtuple
+
+DEFAULT_TTL = 7 * 24 * 60 * 60       # one week before an entry must be revalidated
+DEFAULT_MAX_AGE = 90 * 24 * 60 * 60  # entries not seen for 90 days are evicted
+
+CacheEntry = namedtuple('CacheEntry', ['result', 'etag', 'last_modified', 'fetched_at'])
+
+class ResponseCache(abc.ABC):
+    """
+    Abstract base class for the response caches used by fetch.
+
+    Subclasses implement get, put and touch, and can then be passed to fetch / run,
+    which makes it easy to swap SQLite for another key / value store. Freshness logic
+    lives here so every backend agrees on what "fresh" means.
+
+    Parameters
+    ----------
+    ttl : float, optional
+        seconds an entry is considered fresh, by default one week
+    max_age : float, optional
+        seconds after which an entry is evicted, by default 90 days
+    """
+    def __init__(self, ttl=DEFAULT_TTL, max_age=DEFAULT_MAX_AGE):
+        self.ttl = ttl
+        self.max_age = max_age
+
+    @abc.abstractmethod
+    def get(self, url):
+        """ Returns the CacheEntry for url, or None if it is not cached """
+
+    @abc.abstractmethod
+    def put(self, url, result, etag=None, last_modified=None):
+        """ Stores the result for url along with its validators """
+
+    @abc.abstractmethod
+    def touch(self, url):
+        """ Marks the entry for url as freshly validated (HTTP 304) """
+
+    def evict_expired(self):
+        """ Removes entries older than max_age, returns the number removed """
+        return 0
+
+    def close(self):
+        """ Releases any resources held by the cache """
+
+    def is_fresh(self, entry, now=None):
+        """
+        Checks if an entry can be used without contacting the server.
+
+        Parameters
+        ----------
+        entry (CacheEntry): The cached entry
+        now (float, optional): The current time, defaults to time.time()
+
+        Returns
+        -------
+        bool: True if the entry is younger than the ttl
+        """
+        now = time.time() if now is None else now
+        return now - entry.fetched_at < self.ttl
+
+    @staticmethod
+    def conditional_headers(entry):
+        """
+        Builds the headers for a conditional request from a cached entry.
+
+        Parameters
+        ----------
+        entry (CacheEntry): The cached entry, may be None
+
+        Returns
+        -------
+        dict: If-None-Match / If-Modified-Since headers, empty if there are no validators
+        """
+        headers = {}
+        if entry is None:
+            return headers
+        if entry.etag:
+            headers['If-None-Match'] = entry.etag
+        if entry.last_modified:
+            headers['If-Modified-Since'] = entry.last_modified
+        return headers
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+class SQLiteResponseCache(ResponseCache):
+    """
+    Response cache stored in a single SQLite file.
+
+    Writes are batched and committed every commit_every puts so that caching
+    hundreds of thousands of results does not pay for a transaction each.
+
+    Parameters
+    ----------
+    path : str
+        path to the sqlite file, created if it does not exist
+    ttl : float, optional
+        seconds an entry is considered fresh
+    max_age : float, optional
+        seconds after which an entry is evicted
+    commit_every : int, optional
+        number of writes between commits, by default 500
+    """
+    def __init__(self, path, ttl=DEFAULT_TTL, max_age=DEFAULT_MAX_AGE, commit_every=500):
+        super().__init__(ttl=ttl, max_age=max_age)
+        self.path = path
+        self.commit_every = commit_every
+        self._pending = 0
+        self._conn = sqlite3.connect(path)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute(
+            'CREATE TABLE IF NOT EXISTS responses ('
+            'url TEXT PRIMARY KEY, '
+            'result TEXT NOT NULL, '
+            'etag TEXT, '
+            'last_modified TEXT, '
+            'fetched_at REAL NOT NULL)'
+        )
+        self._conn.commit()
+
+    def get(self, url):
+        row = self._conn.execute(
+            'SELECT result, etag, last_modified, fetched_at FROM responses WHERE url = ?',
+            (url,)
+        ).fetchone()
+        if row is None:
+            return None
+        return CacheEntry(*row)
+
+    def put(self, url, result, etag=None, last_modified=None):
+        self._conn.execute(
+            'INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?)',
+            (url, result, etag, last_modified, time.time())
+        )
+        self._maybe_commit()
+
+    def touch(self, url):
+        self._conn.execute('UPDATE responses SET fetched_at = ? WHERE url = ?',
+                           (time.time(), url))
+        self._maybe_commit()
+
+    def evict_expired(self):
+        cursor = self._conn.execute('DELETE FROM responses WHERE fetched_at < ?',
+                                    (time.time() - self.max_age,))
+        self._conn.commit()
+        return cursor.rowcount
+
+    def close(self):
+        self._conn.commit()
+        self._conn.close()
+
+    def __len__(self):
+        return self._conn.execute('SELECT COUNT(*) FROM responses').fetchone()[0]
+
+    def _maybe_commit(self):
+        """ Commits once enough writes have been batched up """
+        self._pending += 1
+        if self._pending >= self.commit_every:
+            self._conn.commit()
+            self._pending = 0
@@ -0,0 +1,434 @@
+"""
+===============================================
+Storage - Data Acquisition
+===============================================
+This module contains the storage layer for the processed MET, Europeana and blended data.
+
+Every stage of the pipeline used to round-trip through CSV, which means re-parsing
+every row as text and re-inferring types on each load. Datasets are now written as
+Parquet (or Feather) with explicit dtypes: low-cardinality text columns such as
+Culture and Repository are stored as categoricals, and Year as an integer. Readers
+can ask for only the columns they need, so app startup no longer parses the long
+free-text columns it never shows. CSV is still supported for the files already in
+the repository, and a CSV path transparently resolves to its columnar sibling once
+one has been written. Rows are read straight from disk by position, so the app's
+cold start costs about as much as the rows it shows instead of the whole dataset.
+Large raw CSV files (the ~300MB MetObjects.txt) are streamed in chunks of only
+the needed columns and written out chunk by chunk, so memory is bounded by a chunk.
+
+Classes
+----------
+    DatasetWriter: Appends chunks of a dataset to a file
+
+Functions
+----------
+    apply_dtypes: Casts the known columns of a dataset to their storage dtypes
+    columnar_path: Returns the Parquet / Feather sibling of a path
+    resolve_dataset_path: Prefers the columnar sibling of a path if it exists
+    dataset_columns: Lists the columns stored in a dataset without loading it
+    save_dataset: Saves a dataset, the format is chosen by the file extension
+    load_dataset: Loads a dataset, optionally only some of its columns
+    count_rows: Counts the rows of a dataset
+    memory_map_dataset: Opens a Feather dataset as a memory mapped Arrow table
+    take_rows: Reads only the rows at the given positions
+    read_csv_chunks: Streams some columns of a CSV file in chunks of rows
+    convert_dataset: Converts a CSV dataset to Parquet / Feather
+    main: Converts the CSV datasets in the data directory
+
+Authors
+----------
+    Madison Sanchez-Forman and Mya Strayer
+"""
+import os
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+from pyarrow import csv, feather
+
+CATEGORICAL_COLUMNS = ['Culture', 'Department', 'Repository', 'Century']
+INTEGER_COLUMNS = ['Year']
+COLUMNAR_EXTENSIONS = ('.parquet', '.feather')
+CSV_CHUNK_SIZE = 50000
+PARQUET_ROW_GROUP_SIZE = 16384 # small groups so take_rows decodes little beyond the rows asked for
+CSV_BLOCK_SIZE = 1 << 20       # bytes parsed at a time when streaming a CSV file
+
+def apply_dtypes(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Casts the known columns of a dataset to their storage dtypes.
+
+    Columns that are not present are skipped, so this works on projections too.
+
+    Parameters
+    ----------
+    df (pd.DataFrame): The dataset
+
+    Returns
+    -------
+    pd.DataFrame: The dataset with categorical and integer columns cast
+    """
+    dtypes = {col: 'category' for col in CATEGORICAL_COLUMNS if col in df.columns}
+    dtypes.update({col: 'int64' for col in INTEGER_COLUMNS if col in df.columns})
+    return df.astype(dtypes)
+
+def columnar_path(path: str, extension: str = '.parquet') -> str:
+    """
+    Returns the Parquet / Feather sibling of a path.
+
+    Parameters
+    ----------
+    path (str): Path to a dataset, e.g. data/blended_data.csv
+    extension (str): '.parquet' or '.feather'
+
+    Returns
+    -------
+    str: The same path with its extension replaced, e.g. data/blended_data.parquet
+    """
+    return os.path.splitext(path)[0] + extension
+
+def resolve_dataset_path(path: str, extensions: tuple = COLUMNAR_EXTENSIONS) -> str:
+    """
+    Prefers the columnar sibling of a path if one has been written.
+
+    Parameters
+    ----------
+    path (str): Path to a dataset
+    extensions (tuple): Extensions to look for, in order of preference
+
+    Returns
+    -------
+    str: The first sibling with one of the extensions that exists, otherwise path itself
+    """
+    if path.endswith(COLUMNAR_EXTENSIONS):
+        return path
+    for extension in extensions:
+        candidate = columnar_path(path, extension)
+        if os.path.exists(candidate):
+            return candidate
+    return path
+
+def dataset_columns(path: str) -> list:
+    """
+    Lists the columns stored in a dataset without loading any rows.
+
+    Parameters
+    ----------
+    path (str): Path to a .parquet, .feather or .csv dataset
+
+    Returns
+    -------
+    list: The column names
+    """
+    if path.endswith('.parquet'):
+        return pq.read_schema(path).names
+    if path.endswith('.feather'):
+        return feather.read_table(path, memory_map=True).schema.names
+    return pd.read_csv(path, nrows=0).columns.tolist()
+
+def save_dataset(df: pd.DataFrame, path: str) -> None:
+    """
+    Saves a dataset with explicit dtypes, the format is chosen by the file extension.
+
+    Parameters
+    ----------
+    df (pd.DataFrame): The dataset
+    path (str): Path ending in .parquet, .feather or .csv
+    """
+    if path.endswith('.parquet'):
+        apply_dtypes(df).to_parquet(path, index=False, row_group_size=PARQUET_ROW_GROUP_SIZE)
+    elif path.endswith('.feather'):
+        # uncompressed so the file can be memory mapped and rows taken without decoding it all
+        apply_dtypes(df).reset_index(drop=True).to_feather(path, compression='uncompressed')
+    else:
+        df.to_csv(path, index=False)
+
+def load_dataset(path: str, columns: list = None) -> pd.DataFrame:
+    """
+    Loads a dataset, optionally only some of its columns.
+
+    Requested columns that the dataset does not have are ignored, so the same
+    projection can be used for MET, Europeana and blended files.
+
+    Parameters
+    ----------
+    path (str): Path ending in .parquet, .feather or .csv
+    columns (list, optional): Columns to load, by default all of them
+
+    Returns
+    -------
+    pd.DataFrame: The dataset with categorical and integer columns cast
+    """
+    if columns is not None and path.endswith(COLUMNAR_EXTENSIONS):
+        available = set(dataset_columns(path))
+        columns = [col for col in columns if col in available]
+
+    if path.endswith('.parquet'):
+        df = pd.read_parquet(path, columns=columns)
+    elif path.endswith('.feather'):
+        df = pd.read_feather(path, columns=columns)
+    elif columns is not None:
+        wanted = set(columns)
+        df = pd.read_csv(path, usecols=lambda col: col in wanted)
+    else:
+        df = pd.read_csv(path)
+    return apply_dtypes(df)
+
+def count_rows(path: str) -> int:
+    """
+    Counts the rows of a dataset, from the file metadata for columnar formats.
+
+    Parameters
+    ----------
+    path (str): Path ending in .parquet, .feather or .csv
+
+    Returns
+    -------
+    int: The number of rows
+    """
+    if path.endswith('.parquet'):
+        return pq.ParquetFile(path).metadata.num_rows
+    if path.endswith('.feather'):
+        return feather.read_table(path, columns=[], memory_map=True).num_rows
+    return sum(len(chunk) for chunk in pd.read_csv(path, usecols=[0], chunksize=CSV_CHUNK_SIZE))
+
+def memory_map_dataset(path: str, columns: list = None) -> pa.Table:
+    """
+    Opens a Feather dataset as a memory mapped Arrow table.
+
+    Nothing is read up front, and since the file is uncompressed the table's buffers
+    point straight into the mapping. Every process (and thread) that maps the file
+    shares the same pages through the OS page cache.
+
+    Parameters
+    ----------
+    path (str): Path ending in .feather
+    columns (list, optional): Columns to map, by default all of them
+
+    Returns
+    -------
+    pa.Table: The memory mapped table
+    """
+    if columns is not None:
+        available = set(dataset_columns(path))
+        columns = [col for col in columns if col in available]
+    return feather.read_table(path, columns=columns, memory_map=True)
+
+def _plan_row_groups(parquet_file: pq.ParquetFile, indices: np.ndarray) -> list:
+    """
+    Groups sorted row positions by the Parquet row group that holds them.
+
+    Parameters
+    ----------
+    parquet_file (pq.ParquetFile): The opened Parquet file
+    indices (np.ndarray): Sorted, unique row positions
+
+    Returns
+    -------
+    list: (row group, positions within that row group) for every row group to read
+    """
+    sizes = [parquet_file.metadata.row_group(i).num_rows
+             for i in range(parquet_file.num_row_groups)]
+    starts = np.concatenate([[0], np.cumsum(sizes)])
+    groups = np.searchsorted(starts, indices, side='right') - 1
+    return [(int(group), indices[groups == group] - starts[group])
+            for group in np.unique(groups)]
+
+def _take_parquet_rows(path: str, indices: np.ndarray, columns: list = None) -> pd.DataFrame:
+    """ Reads the rows at sorted positions of a Parquet file, one row group at a time """
+    parquet_file = pq.ParquetFile(path)
+    tables = [parquet_file.read_row_group(group, columns=columns).take(pa.array(local))
+              for group, local in _plan_row_groups(parquet_file, indices)]
+    if not tables:
+        schema = parquet_file.schema_arrow
+        tables = [schema.empty_table().select(columns or schema.names)]
+    return pa.concat_tables(tables).to_pandas()
+
+def _take_csv_rows(path: str, indices: np.ndarray, columns: list = None) -> pd.DataFrame:
+    """ Reads the rows at sorted positions of a CSV file by streaming it in chunks """
+    wanted = None if columns is None else set(columns)
+    usecols = None if wanted is None else (lambda col: col in wanted)
+    parts, offset = [], 0
+    for chunk in pd.read_csv(path, usecols=usecols, chunksize=CSV_CHUNK_SIZE):
+        local = indices[(indices >= offset) & (indices < offset + len(chunk))] - offset
+        parts.append(chunk.iloc[local])
+        offset += len(chunk)
+    return pd.concat(parts, ignore_index=True)
+
+def take_rows(path: str, indices, columns: list = None) -> pd.DataFrame:
+    """
+    Reads only the rows at the given positions.
+
+    Feather files are memory mapped, so only the pages holding the requested rows
+    are read. Parquet files only decode the row groups that hold a requested row.
+    CSV files have no random access and are streamed in chunks.
+
+    Parameters
+    ----------
+    path (str): Path ending in .parquet, .feather or .csv
+    indices (array-like): Row positions to read
+    columns (list, optional): Columns to load, by default all of them
+
+    Returns
+    -------
+    pd.DataFrame: The rows in ascending position order, with a fresh index
+    """
+    indices = np.unique(np.asarray(indices, dtype=np.int64))
+    if columns is not None and path.endswith(COLUMNAR_EXTENSIONS):
+        available = set(dataset_columns(path))
+        columns = [col for col in columns if col in available]
+
+    if path.endswith('.feather'):
+        df = memory_map_dataset(path, columns).take(pa.array(indices)).to_pandas()
+    elif path.endswith('.parquet'):
+        df = _take_parquet_rows(path, indices, columns)
+    else:
+        df = _take_csv_rows(path, indices, columns)
+    return apply_dtypes(df.reset_index(drop=True))
+
+def read_csv_chunks(path: str, columns: list = None, chunk_rows: int = CSV_CHUNK_SIZE,
+                    block_size: int = CSV_BLOCK_SIZE):
+    """
+    Streams some columns of a CSV file in chunks of rows, every value as a string.
+
+    The file is parsed by pyarrow a block at a time and only the requested columns
+    are converted, so the other columns never become Python objects and memory is
+    bounded by a chunk. Empty cells and the usual NA markers are missing values,
+    as with pd.read_csv(path, dtype='str'). Quoted cells may span lines, as the
+    Dimensions and Artist Display Bio cells of MetObjects.txt do.
+
+    Parameters
+    ----------
+    path (str): Path to the CSV file
+    columns (list, optional): Columns to read, those the file does not have are ignored.
+        by default all of them
+    chunk_rows (int): Number of rows per chunk, the last one can be smaller
+    block_size (int): Bytes parsed at a time, by default CSV_BLOCK_SIZE
+
+    Yields
+    ------
+    pd.DataFrame: The next chunk, indexed by row position in the file
+    """
+    header = pd.read_csv(path, nrows=0).columns.tolist()
+    columns = header if columns is None else [col for col in columns if col in header]
+    reader = csv.open_csv(path,
+                          read_options=csv.ReadOptions(block_size=block_size),
+                          # without it a quoted newline on a block boundary desyncs the parser
+                          parse_options=csv.ParseOptions(newlines_in_values=True),
+                          convert_options=csv.ConvertOptions(
+                              include_columns=columns,
+                              column_types={col: pa.string() for col in columns},
+                              strings_can_be_null=True))
+    batches, n_rows, offset = [], 0, 0
+    for batch in reader:
+        batches.append(batch)
+        n_rows += batch.num_rows
+        while n_rows >= chunk_rows:
+            table = pa.Table.from_batches(batches)
+            chunk = table.slice(0, chunk_rows)
+            rest = table.slice(chunk_rows)
+            batches, n_rows = rest.to_batches(), rest.num_rows
+            yield _chunk_frame(chunk, offset)
+            offset += chunk_rows
+    if n_rows:
+        yield _chunk_frame(pa.Table.from_batches(batches), offset)
+
+def _chunk_frame(table: pa.Table, offset: int) -> pd.DataFrame:
+    """ Converts a chunk to pandas, indexed by row position from offset """
+    df = table.to_pandas()
+    df.index = pd.RangeIndex(offset, offset + len(df))
+    return df
+
+class DatasetWriter:
+    """
+    Appends chunks of a dataset to a file, the format is chosen by the file extension.
+
+    Parquet and Feather files are written through pyarrow writers, a row group /
+    record batch per chunk, and CSV files are appended to. Every chunk must have the
+    columns and dtypes of the first one. Columns are stored as plain types,
+    load_dataset casts the known ones when the file is read back. The file is
+    replaced even if no chunk is written, so a previous run's output is never left
+    behind looking like this one's.
+
+    Parameters
+    ----------
+    path : str
+        path ending in .parquet, .feather or .csv, overwritten if it exists
+    template : pd.DataFrame, optional
+        empty frame with the columns and dtypes written if no chunk is, by default
+        a file without columns
+    """
+    def __init__(self, path: str, template: pd.DataFrame = None):
+        self.path = path
+        self.template = template
+        self.rows = 0
+        self._opened = False
+        self._schema = None
+        self._writer = None
+
+    def write(self, df: pd.DataFrame) -> None:
+        """ Appends a chunk """
+        if self.path.endswith(COLUMNAR_EXTENSIONS):
+            table = pa.Table.from_pandas(df, schema=self._schema, preserve_index=False)
+            if self._writer is None:
+                self._schema = table.schema
+                if self.path.endswith('.parquet'):
+                    self._writer = pq.ParquetWriter(self.path, self._schema)
+                else:
+                    # the Feather V2 format is the Arrow IPC file format, uncompressed to memory map
+                    self._writer = pa.ipc.new_file(self.path, self._schema)
+            if self.path.endswith('.parquet'):
+                self._writer.write_table(table, row_group_size=PARQUET_ROW_GROUP_SIZE)
+            else:
+                self._writer.write_table(table)
+        else:
+            df.to_csv(self.path, mode='a' if self._opened else 'w',
+                      header=not self._opened, index=False)
+        self._opened = True
+        self.rows += len(df)
+
+    def close(self) -> None:
+        """ Finishes the file, writing an empty one with the template if nothing was written """
+        if not self._opened:
+            self.write(self.template.iloc[:0] if self.template is not None else pd.DataFrame())
+        if self._writer is not None:
+            self._writer.close()
+            self._writer = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+def convert_dataset(path: str, extension: str = '.parquet') -> str:
+    """
+    Converts a CSV dataset to Parquet / Feather next to the original file.
+
+    Parameters
+    ----------
+    path (str): Path to the CSV dataset
+    extension (str): '.parquet' or '.feather'
+
+    Returns
+    -------
+    str: Path of the converted dataset
+    """
+    converted = columnar_path(path, extension)
+    save_dataset(load_dataset(path), converted)
+    return converted
+
+def main():
+    """
+    Converts the processed CSV datasets in the data directory to Parquet and Feather.
+    """
+    for name in ['MetObjects_final_filtered_processed.csv',
+                 'Europeana_data_processed.csv',
+                 'blended_data.csv']:
+        path = os.path.join('..', 'data', name)
+        if os.path.exists(path):
+            for extension in COLUMNAR_EXTENSIONS:
+                print(f"Converted {path} to {convert_dataset(path, extension)}")
+
+if __name__ == "__main__":
+    main()
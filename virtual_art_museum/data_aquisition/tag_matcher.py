@@ -0,0 +1,151 @@
+"""
+===============================================
+Tag Matcher - Data Acquisition
+===============================================
+This module contains the multi-pattern matcher used to tag Europeana descriptions
+with the MET tag vocabulary.
+
+Testing every tag against every description with a substring check is
+O(descriptions x tags) work. Instead, an Aho-Corasick automaton is built once from
+the vocabulary: a trie of the tags where every node also links to the longest
+proper suffix that is itself a trie node. Each description is then scanned a single
+time, character by character, and every tag occurring in it is found in that one
+pass, however many tags there are. Overlapping tags (e.g. "men" in "women") are all
+reported, so the result is the same as testing each tag with `in`.
+
+References
+----------
+    https://en.wikipedia.org/wiki/Aho%E2%80%93Corasick_algorithm
+
+Classes
+----------
+    TagMatcher: Finds every tag of a vocabulary that occurs in a text
+
+Authors
+----------
+    Madison Sanchez-Forman and Mya Strayer
+"""
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+from data_aquisition.checkpoint import chunked # pylint: disable=import-error
+
+def _is_word_char(char: str) -> bool:
+    """ Checks if a character is part of a word, like the regex \\w """
+    return char.isalnum() or char == '_'
+
+class TagMatcher:
+    """
+    Aho-Corasick automaton over a tag vocabulary.
+
+    Matching is case insensitive. Tags are reported as given, in vocabulary order,
+    so tags that only differ in case or surrounding spaces are each reported.
+
+    Parameters
+    ----------
+    tags : iterable of str
+        the tag vocabulary, empty and non-string entries are ignored
+    word_boundary : bool, optional
+        if true, a tag only matches where it does not cut through a word, so "art"
+        matches "pop art" but not "party". by default False (plain substring matching)
+    """
+    def __init__(self, tags, word_boundary=False):
+        self.tags = [tag for tag in tags if isinstance(tag, str) and tag]
+        self.word_boundary = word_boundary
+        self._patterns = [tag.lower() for tag in self.tags]
+        self._goto = [{}]     # node -> {character: child node}
+        self._fail = [0]      # node -> longest proper suffix that is a node
+        self._output = [()]   # node -> ids of the tags ending at this node
+        self._build()
+
+    def _build(self) -> None:
+        """ Builds the trie, then the failure links breadth first """
+        for tag_id, pattern in enumerate(self._patterns):
+            node = 0
+            for char in pattern:
+                if char not in self._goto[node]:
+                    self._goto.append({})
+                    self._fail.append(0)
+                    self._output.append(())
+                    self._goto[node][char] = len(self._goto) - 1
+                node = self._goto[node][char]
+            self._output[node] += (tag_id,)
+
+        queue = deque(self._goto[0].values())
+        while queue:
+            node = queue.popleft()
+            for char, child in self._goto[node].items():
+                queue.append(child)
+                fail = self._fail[node]
+                while fail and char not in self._goto[fail]:
+                    fail = self._fail[fail]
+                self._fail[child] = self._goto[fail].get(char, 0)
+                # a node also outputs every tag that ends at its suffix
+                self._output[child] += self._output[self._fail[child]]
+
+    def _bounded(self, text: str, tag_id: int, end: int) -> bool:
+        """ Checks that the match of a tag ending at text[end] does not cut through a word """
+        pattern = self._patterns[tag_id]
+        start = end - len(pattern) + 1
+        if start > 0 and _is_word_char(pattern[0]) and _is_word_char(text[start - 1]):
+            return False
+        if end + 1 < len(text) and _is_word_char(pattern[-1]) and _is_word_char(text[end + 1]):
+            return False
+        return True
+
+    def find(self, text: str) -> list:
+        """
+        Finds every tag that occurs in a text with a single scan.
+
+        Parameters
+        ----------
+        text (str): The text to search
+
+        Returns
+        -------
+        list: The matching tags, in vocabulary order
+        """
+        text = str(text).lower()
+        goto, fail, output = self._goto, self._fail, self._output
+        found = set()
+        node = 0
+        for end, char in enumerate(text):
+            while node and char not in goto[node]:
+                node = fail[node]
+            node = goto[node].get(char, 0)
+            if output[node]:
+                if self.word_boundary:
+                    found.update(tag_id for tag_id in output[node]
+                                 if self._bounded(text, tag_id, end))
+                else:
+                    found.update(output[node])
+        return [self.tags[tag_id] for tag_id in sorted(found)]
+
+    def find_many(self, texts, workers: int = 1, chunk_size: int = 5000) -> list:
+        """
+        Finds the tags of many texts, optionally in parallel.
+
+        Scanning is pure Python and CPU bound, so texts are split into chunks and the
+        chunks are spread over worker processes rather than threads.
+
+        Parameters
+        ----------
+        texts (iterable of str): The texts to search
+        workers (int): Number of worker processes, 1 scans in this process
+        chunk_size (int): Number of texts sent to a worker at a time
+
+        Returns
+        -------
+        list: One list of matching tags per text, in the order of texts
+        """
+        texts = list(texts)
+        if workers <= 1 or len(texts) <= chunk_size:
+            return [self.find(text) for text in texts]
+
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            chunks = executor.map(self._find_chunk, chunked(texts, chunk_size))
+            return [tags for chunk in chunks for tags in chunk]
+
+    def _find_chunk(self, texts: list) -> list:
+        """ Finds the tags of a chunk of texts, run in a worker process """
+        return [self.find(text) for text in texts]
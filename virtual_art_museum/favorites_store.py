@@ -0,0 +1,192 @@
+"""
+===============================================
+Favorites Store
+===============================================
+
+This module contains the store the homepage and favorites page keep favorites in.
+
+Favorites used to be a list of dicts in session state, written out whole to
+favorites_cache.json on every removal. That file was shared by every user of the
+app, so concurrent sessions overwrote each other, and checking if an artwork was
+already a favorite was a linear scan of the list. Favorites are now rows of a
+SQLite table keyed by (user, object id): adding, removing and checking one
+favorite is a single indexed statement, whatever the number of favorites.
+
+The database runs in WAL mode, so sessions reading favorites never block the
+session writing one, and several app processes can share the file.
+
+A user is identified by a random id kept in session state and in the page url
+(?user=...), so favorites survive a reload and can be opened from a bookmark.
+
+Classes
+----------
+    FavoritesStore: SQLite table of favorites per user
+
+Functions
+----------
+    object_id: Builds the id of an artwork from its repository and object number
+    session_user: Returns the user id of a Streamlit session
+
+Authors
+----------
+    Madison Sanchez-Forman and Mya Strayer
+"""
+import os
+import sqlite3
+import threading
+import time
+import uuid
+
+base_dir = os.path.dirname(os.path.abspath(__file__))
+
+FAVORITES_DB = os.path.join(base_dir, "favorites.sqlite")
+USER_PARAM = "user" # query parameter the user id is kept in
+
+def object_id(repository: str, object_number) -> str:
+    """
+    Builds the id of an artwork. Object numbers are only unique within a repository.
+
+    Parameters
+    ----------
+    repository (str): 'MET' or 'Europeana'
+    object_number (str): The Object Number of the artwork
+
+    Returns
+    -------
+    str: The object id, e.g. 'MET:1979.486.1'
+    """
+    return f"{repository}:{object_number}"
+
+def session_user(session_state, query_params) -> str:
+    """
+    Returns the user id of a session, creating one for a new user.
+
+    Parameters
+    ----------
+    session_state (mapping): st.session_state
+    query_params (mapping): st.query_params, the id is kept there so a reload keeps it
+
+    Returns
+    -------
+    str: The user id
+    """
+    user = session_state.get('user_id') or query_params.get(USER_PARAM) or uuid.uuid4().hex
+    session_state['user_id'] = user
+    if query_params.get(USER_PARAM) != user:
+        query_params[USER_PARAM] = user
+    return user
+
+class FavoritesStore:
+    """
+    Favorites of every user in a single SQLite file.
+
+    One connection is shared by the threads Streamlit runs sessions in, statements
+    are serialized with a lock and each one is committed straight away.
+
+    Parameters
+    ----------
+    path : str, optional
+        path to the sqlite file, created if it does not exist, by default FAVORITES_DB
+    timeout : float, optional
+        seconds to wait for another process holding the write lock, by default 10
+    """
+    def __init__(self, path=FAVORITES_DB, timeout=10):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, timeout=timeout, check_same_thread=False)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute(
+            'CREATE TABLE IF NOT EXISTS favorites ('
+            'user_id TEXT NOT NULL, '
+            'object_id TEXT NOT NULL, '
+            'image_url TEXT NOT NULL, '
+            'title TEXT NOT NULL, '
+            'added_at REAL NOT NULL, '
+            'PRIMARY KEY (user_id, object_id)) WITHOUT ROWID'
+        )
+        # lists a user's favorites in the order they were added without sorting
+        self._conn.execute('CREATE INDEX IF NOT EXISTS favorites_by_time '
+                           'ON favorites (user_id, added_at)')
+        self._conn.commit()
+
+    def _execute(self, sql: str, params=()):
+        """ Runs one statement and commits it """
+        with self._lock:
+            cursor = self._conn.execute(sql, params)
+            self._conn.commit()
+            return cursor
+
+    def add(self, user: str, obj_id: str, image_url: str, title: str) -> bool:
+        """
+        Adds an artwork to a user's favorites.
+
+        Parameters
+        ----------
+        user (str): The user id
+        obj_id (str): The artwork's id, see object_id
+        image_url (str): The artwork's image
+        title (str): The artwork's title
+
+        Returns
+        -------
+        bool: True if it was added, False if it was already a favorite
+        """
+        cursor = self._execute('INSERT OR IGNORE INTO favorites VALUES (?, ?, ?, ?, ?)',
+                               (user, obj_id, image_url, title, time.time()))
+        return cursor.rowcount > 0
+
+    def remove(self, user: str, obj_id: str) -> bool:
+        """ Removes an artwork from a user's favorites, returns False if it was not one """
+        cursor = self._execute('DELETE FROM favorites WHERE user_id = ? AND object_id = ?',
+                               (user, obj_id))
+        return cursor.rowcount > 0
+
+    def clear(self, user: str) -> int:
+        """ Removes every favorite of a user, returns the number removed """
+        return self._execute('DELETE FROM favorites WHERE user_id = ?', (user,)).rowcount
+
+    def contains(self, user: str, obj_id: str) -> bool:
+        """ Checks if an artwork is one of a user's favorites """
+        with self._lock:
+            row = self._conn.execute(
+                'SELECT 1 FROM favorites WHERE user_id = ? AND object_id = ?',
+                (user, obj_id)
+            ).fetchone()
+        return row is not None
+
+    def favorites(self, user: str) -> list:
+        """
+        Lists a user's favorites.
+
+        Parameters
+        ----------
+        user (str): The user id
+
+        Returns
+        -------
+        list: One dict per favorite with object_id, image_url and Title, oldest first
+        """
+        with self._lock:
+            rows = self._conn.execute(
+                'SELECT object_id, image_url, title FROM favorites '
+                'WHERE user_id = ? ORDER BY added_at',
+                (user,)
+            ).fetchall()
+        return [{'object_id': row[0], 'image_url': row[1], 'Title': row[2]} for row in rows]
+
+    def count(self, user: str) -> int:
+        """ Number of favorites of a user """
+        with self._lock:
+            return self._conn.execute('SELECT COUNT(*) FROM favorites WHERE user_id = ?',
+                                      (user,)).fetchone()[0]
+
+    def close(self):
+        """ Closes the connection """
+        with self._lock:
+            self._conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
@@ -2,17 +2,16 @@
 MoVA homepage:
     - Configures page / sidebar components
     - Allows user to add / reset filters for data
-    - Processes MET and Europeana data
-    - Blends the data and sorts images by size
-    - Filters data based on user input
-    - Displays images
+    - Serves the full MET and Europeana collection
+    - Filters data based on user input, with search
+      and facet indexes built once per process and
+      shared by every session
+    - Displays images a page at a time
     - Adds to Favorites
 """
 import time
 
 import streamlit as st
-import pandas as pd
-import numpy as np
 
 from math import ceil
 
@@ -22,6 +21,10 @@ import os
 import re
 
 from popup import display_artwork_popup
+from collection import Collection
+from thumbnails import ThumbnailCache
+from favorites_store import FavoritesStore, object_id, session_user
+from data_aquisition.storage import convert_dataset, resolve_dataset_path
 
 base_dir = os.path.dirname(os.path.abspath(__file__))
 
@@ -29,38 +32,81 @@ MET_PATH = os.path.join(base_dir, "data", "MetObjects_final_filtered_processed.c
 EUROPEANA_PATH = os.path.join(base_dir, "data", "Europeana_data_processed.csv")
 BLENDED_PATH = os.path.join(base_dir, "data", "blended_data.csv")
 
-# Caches the result so it doesn't reload every time Streamlit reruns
-@st.cache_data
-def load_blended_cached(path1: str, path2: str, sample_size: int = 1000) -> pd.DataFrame:
+# Only the columns shown in the gallery / popup or searched by the filters are loaded
+APP_COLUMNS = ['Object Number', 'Title', 'Artist', 'Artist biographic information',
+               'Culture', 'Year', 'Century', 'Medium', 'Tags', 'Department',
+               'Description', 'Dimensions', 'Repository', 'image_url']
+# Memory mapped Feather gives the cheapest random row access, then Parquet, then CSV
+APP_EXTENSIONS = ('.feather', '.parquet')
+
+# Rows read from disk per "Load more", a multiple of the 4 gallery columns
+PAGE_SIZE = 48
+
+# Widths images are shown at, thumbnails are served instead of the full size originals
+GALLERY_WIDTH = 640
+POPUP_WIDTH = 1280
+
+def app_dataset_path(path: str) -> str:
     """
-    Loads stratified sample of data with repository proportions assuming 80% MET and 20% Europeana.
+    Finds the Feather / Parquet version of a dataset, converting a CSV to Feather
+    the first time it is loaded. A CSV can only be read front to back, so reading a
+    page of it means parsing the whole file.
 
     Parameters:
-        path (str): Path to the data file
-        sample_size (int): Number of rows to sample
+        path (str): Path to a data file
     ----------
     Returns:
-        pd.DataFrame: A dataframe containing the sampled data
+        str: Path of the file to serve, the CSV itself if it could not be converted
+    """
+    resolved = resolve_dataset_path(path, APP_EXTENSIONS)
+    if resolved.endswith(APP_EXTENSIONS):
+        return resolved
+    try:
+        return convert_dataset(resolved, '.feather')
+    except OSError as error:
+        print(f"Could not convert {resolved} to Feather, serving the CSV: {error}")
+        return resolved
+
+# Loaded once per process and shared by every session, reruns only read the rows shown
+@st.cache_resource
+def load_collection(path1: str, path2: str) -> Collection:
     """
-    repo_proportions = {
-        'MET': 0.7,        # Stratified sample since we know we have less Europeana data
-        'Europeana': 0.3   
-    }
-    # samples per repository
-    samples_per_repo = {
-        repo: int(sample_size * prop)
-        for repo, prop in repo_proportions.items()
-    }
-    # Sample from each repository
-    samples = [
-        pd.read_csv(path1).sample(n=samples_per_repo['MET']),
-        pd.read_csv(path2).sample(n=samples_per_repo['Europeana'])
-    ]
-    # Combine and shuffle
-    final_df = pd.concat(samples, ignore_index=True).sample(frac=1, random_state=42)
-    print(f"Loaded {len(final_df)} rows\n{final_df['Repository'].value_counts()}")
-    return final_df
+    Loads the full MET and Europeana collection for searching and filtering.
+    Only the indexes stay in memory, rows are read from disk a page at a time.
 
+    Parameters:
+        path1 (str): Path to the MET data file
+        path2 (str): Path to the Europeana data file
+    ----------
+    Returns:
+        Collection: The searchable collection
+    """
+    collection = Collection([app_dataset_path(path1), app_dataset_path(path2)],
+                            columns=APP_COLUMNS)
+    print(f"Loaded {len(collection)} rows\n{collection.facet_data['Repository'].value_counts()}")
+    return collection
+
+# One cache for every session, so an image is only fetched and resized once
+@st.cache_resource
+def load_thumbnails() -> ThumbnailCache:
+    """
+    Creates the thumbnail cache shared by every session.
+
+    Returns:
+        ThumbnailCache: The cache, writing to the static/thumbnails directory
+    """
+    return ThumbnailCache()
+
+# One connection for every session, favorites are kept per user in the database
+@st.cache_resource
+def load_favorites_store() -> FavoritesStore:
+    """
+    Opens the favorites database shared by every session.
+
+    Returns:
+        FavoritesStore: The store, in favorites.sqlite next to the app
+    """
+    return FavoritesStore()
 
 def initialize_session_state(data):
     ''' Initialze session state variables '''
@@ -69,50 +115,47 @@ def initialize_session_state(data):
     if 'culture' not in st.session_state:
         st.session_state.culture = []
     if 'years' not in st.session_state:
-        st.session_state.years = (min(data['Year'].astype(int)), 2025)
+        st.session_state.years = (int(data['Year'].min()), 2025)
     if 'datasource' not in st.session_state:
         st.session_state.datasource = None
-    if 'favorites' not in st.session_state:
-        st.session_state.favorites = []    
     
 def reset_filters(data):
     ''' Resets all filters to default values '''
     st.session_state.search = ''
     st.session_state.culture = []
-    st.session_state.years = (min(data['Year'].astype(int)), 2025)
+    st.session_state.years = (int(data['Year'].min()), 2025)
     st.session_state.datasource = None
 
 def refresh_data():
     ''' Clear cached data and rerun app '''
-    load_blended_cached.clear()
+    load_collection.clear()
 
-    if 'original_data' in st.session_state:
-        del st.session_state['original_data']
+    if 'shown' in st.session_state:
+        del st.session_state['shown']
     
     st.rerun()
 
-@st.cache_data
-def filter_data(data, search, culture, years, datasource):
-    """ Filters the dataframe based on user inputs """
-    if search:
-        mask = False
-        for column in data.columns:
-            # create a boolean mask for which data points contain search parameter
-            mask = mask | data[column].astype(str).str.contains(search, 
-                                                                case=False, na=False)
-        data = data[mask]
-
-    if culture:
-        data = data[data['Culture'].isin(culture)]
+def load_more():
+    ''' Shows the next page of results '''
+    st.session_state.shown += PAGE_SIZE
 
-    data = data[(data['Year'] >= years[0]) & (data['Year'] <= years[1])]
+def filter_data(collection, search, culture, years, datasource):
+    """
+    Filters the collection based on user inputs.
 
-    if datasource == 'MET':
-        data = data[data['Repository'] == 'MET']
-    elif datasource == 'Europeana':
-        data = data[data['Repository'] == 'Europeana']
+    Results are kept in the shared collection, so no session holds a copy of them.
 
-    return data
+    Parameters:
+        collection (Collection): The collection
+        search (str): Keywords
+        culture (list): Selected cultures, none selects every culture
+        years (tuple): First and last year
+        datasource (str): 'MET', 'Europeana' or None for both
+    ----------
+    Returns:
+        np.ndarray: Positions of the matching objects, in display order
+    """
+    return collection.query(search, culture, years, datasource)
 
 def sidebar_setup(data):
     ''' Sets up the sidebar UI '''
@@ -130,7 +173,7 @@ def sidebar_setup(data):
                                      key="culture")
 
     years = st.sidebar.slider('Time Period: ', 
-                              min_value = min(data['Year'].astype(int)),
+                              min_value = int(data['Year'].min()),
                               max_value = 2025,
                               key = "years")
 
@@ -141,6 +184,13 @@ def sidebar_setup(data):
 
 def image_gallery(data):
     ''' Adds Favorited and Popup Functionality'''
+    favorites = load_favorites_store()
+    user = st.session_state.user_id
+    object_ids = [object_id(repository, number)
+                  for repository, number in zip(data['Repository'], data['Object Number'])]
+    thumbnails = load_thumbnails()
+    # cached thumbnails are looked up, the rest are made in the background and shown next rerun
+    image_srcs = thumbnails.urls(data['image_url'], GALLERY_WIDTH)
     cols = st.columns(4, gap='medium')
     for idx, artwork in enumerate(data.itertuples()):
         with cols[idx % 4]:
@@ -149,7 +199,7 @@ def image_gallery(data):
                     <div style='cursor: pointer; transition: transform 0.2s;'
                          onmouseover='this.style.transform="scale(1.02)"'
                          onmouseout='this.style.transform="scale(1)"'>
-                        <img src='{artwork.image_url}' style='width: 100%; border-radius: 5px;'>
+                        <img src='{image_srcs[idx]}' style='width: 100%; border-radius: 5px;'>
                     </div>
                 """, unsafe_allow_html=True)
             
@@ -157,28 +207,26 @@ def image_gallery(data):
             
             # Add to Favorites button
             if st.button(f"Add to Favorites ❤️", key=f"fav_{idx}", use_container_width=True):
-                # Store the artwork data as a dictionary
-                artwork_dict = {
-                    'image_url': artwork.image_url,
-                    'Title': artwork.Title
-                }
-                if artwork_dict not in st.session_state.favorites:
-                    st.session_state.favorites.append(artwork_dict)
+                if favorites.add(user, object_ids[idx], artwork.image_url, artwork.Title):
                     st.success(f"Added '{artwork.Title[:50]}' to favorites!")
                 else:
                     st.warning("This artwork is already in your favorites.")
 
             if st.button(f"Details", key=f"btn_{idx}", use_container_width=True):
                 artwork_dict = data.iloc[idx].to_dict()
-                display_artwork_popup(artwork_dict)
+                display_artwork_popup(artwork_dict,
+                                      thumbnails.file(artwork.image_url, POPUP_WIDTH))
 
 def display_favorites(data):
     ''' Displays the user's favorited artworks '''
-    if not st.session_state.favorites:
+    favorites = load_favorites_store().favorites(st.session_state.user_id)
+    if not favorites:
         st.write("You have no favorites yet. Add some artworks to your favorites!")
     else:
         st.write("### Your Favorites")
-        favorite_data = data[data.index.isin(st.session_state.favorites)]
+        object_ids = {favorite['object_id'] for favorite in favorites}
+        favorite_data = data[[object_id(repository, number) in object_ids for repository, number
+                              in zip(data['Repository'], data['Object Number'])]]
         image_gallery(favorite_data)
 
 def homepage(path1: str, path2: str):
@@ -188,10 +236,10 @@ def homepage(path1: str, path2: str):
         layout="wide",
         initial_sidebar_state="collapsed")
 
-    if 'original_data' not in st.session_state:
-        st.session_state.original_data = load_blended_cached(path1, path2).sample(n=250)
+    collection = load_collection(path1, path2)
+    session_user(st.session_state, st.query_params)
 
-    initialize_session_state(st.session_state.original_data)
+    initialize_session_state(collection.facet_data)
 
     st.logo("https://github.com/madiforman/virtual_art_museum/blob/main/images/MoVA%20bw%20logo.png?raw=true",
         size="large")
@@ -210,17 +258,29 @@ def homepage(path1: str, path2: str):
         reset = st.button('↻', on_click = refresh_data, help = 'Refresh data')
     
     st.markdown("#")      
-    sidebar_setup(st.session_state.original_data)
+    sidebar_setup(collection.facet_data)
 
-    filtered_data = filter_data(
-        st.session_state.original_data,
+    results = filter_data(
+        collection,
         st.session_state.search,
         st.session_state.culture,
         st.session_state.years,
         st.session_state.datasource
     )
 
-    image_gallery(filtered_data)
+    # Start over from the first page whenever the filters change
+    query = (collection.version, st.session_state.search, tuple(st.session_state.culture),
+             tuple(st.session_state.years), st.session_state.datasource)
+    if st.session_state.get('query') != query or 'shown' not in st.session_state:
+        st.session_state.query = query
+        st.session_state.shown = PAGE_SIZE
+
+    st.caption(f"{len(results):,} artworks")
+    shown_data, next_offset = collection.page(results, 0, st.session_state.shown)
+    image_gallery(shown_data)
+
+    if next_offset is not None:
+        st.button("Load more", on_click=load_more, use_container_width=True)
 
 def main():
     homepage(MET_PATH, EUROPEANA_PATH)
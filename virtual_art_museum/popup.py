@@ -18,7 +18,7 @@ import streamlit as st
 import requests
 
 @st.dialog("Details")
-def display_artwork_popup(artwork):
+def display_artwork_popup(artwork, image=None):
     """
     Display a popup with artwork details using Streamlit's dialog feature.
     No session state required.
@@ -26,14 +26,17 @@ def display_artwork_popup(artwork):
     Parameters
     ----------
     artwork (dict): A dictionary containing artwork details
+    image (str): Path or url of the image to show, by default artwork['image_url']
 
     Returns
     -------
     None
     """
+    if image is None:
+        image = artwork['image_url']
     # markdown for styling the popup
     if artwork['Repository'] == "MET":
-        st.image(artwork['image_url'], use_container_width=True)
+        st.image(image, use_container_width=True)
         st.markdown(f"### {artwork['Title']}")
         st.markdown(f"**Artist:** {artwork['Artist']}")
         st.markdown(f"**Artist Bio:** {artwork['Artist biographic information']}")
@@ -43,7 +46,7 @@ def display_artwork_popup(artwork):
         st.markdown(f"**Dimensions**: {artwork.get('Dimensions')}")
 
     elif artwork['Repository'] == 'Europeana':
-        st.image(artwork['image_url'], use_container_width=True)
+        st.image(image, use_container_width=True)
         st.markdown(f"### {artwork['Title']}")
         st.markdown(f"**Artist:** {artwork['Artist']}")
         st.markdown(f"**Culture:** {artwork['Culture']}")
@@ -0,0 +1,309 @@
+"""
+===============================================
+Search Index
+===============================================
+
+This module contains the indexes behind the homepage keyword search and filters.
+They are kept out of mova_home.py so they can be built and tested without Streamlit.
+
+Searching used to cast every column to str and run a case insensitive
+str.contains over all of them on every rerun, a full scan of the dataframe per
+keystroke. The index is built once per loaded dataset instead: every cell is
+split into lowercase word tokens, and each token maps to the sorted list of cells
+it occurs in (a posting list). Tokens are kept sorted, so all tokens starting with
+a prefix are one contiguous range, and a query is a few binary searches plus
+posting list unions and intersections.
+
+A query matches a row when one of its cells contains, for every query word, a
+token starting with that word. "portr" finds "Portrait", and "art 1" finds the
+title "Art 1" but not a row whose title has "art" and whose year has "1".
+
+The Culture / Repository / Year filters used to build a fresh boolean mask and
+copy the dataframe for each filter. The facet index keeps one packed bitmap (a bit
+per row) for the most recently filtered facet values, built the first time a value
+is filtered on, and the years sorted once so a year range is two binary searches.
+Filters are combined with a bitwise AND of the bitmaps and the rows are selected
+once at the end.
+
+Classes
+----------
+    SearchIndex: Inverted index from word prefixes to row positions
+    FacetIndex: Bitmaps per facet value and sorted years for the filters
+    LRUCache: Thread-safe mapping that keeps its most recently used entries
+
+Functions
+----------
+    tokenize: Splits a text into lowercase word tokens
+
+Authors
+----------
+    Madison Sanchez-Forman and Mya Strayer
+"""
+import re
+import threading
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+
+TOKEN = re.compile(r'\w+')
+FACET_COLUMNS = ('Culture', 'Repository')
+MAX_CHAR = chr(0x10FFFF) # sorts after every other character, bounds a prefix range
+BITMAP_CACHE_SIZE = 256  # facet value bitmaps kept, about 60kB each for the MET collection
+
+def tokenize(text) -> list:
+    """
+    Splits a text into lowercase word tokens.
+
+    Parameters
+    ----------
+    text (str): The text, other values are converted with str
+
+    Returns
+    -------
+    list: The tokens in order
+    """
+    return TOKEN.findall(str(text).lower())
+
+class SearchIndex:
+    """
+    Inverted index from word tokens to the cells and rows they occur in.
+
+    Cells are numbered row position * number of columns + column number. The posting
+    lists of all tokens are stored back to back in one array, in token order, with
+    offsets marking where each token's list starts.
+
+    Parameters
+    ----------
+    data : pd.DataFrame
+        the loaded dataset, rows are referred to by position (data.iloc)
+    """
+    def __init__(self, data):
+        self.n_rows = len(data)
+        self.n_columns = len(data.columns)
+
+        terms, cells = [], []
+        for col_number, col in enumerate(data.columns):
+            # tokenize each distinct value once, categorical columns repeat a lot
+            codes, uniques = pd.factorize(data[col].astype(str))
+            token_lists = np.empty(len(uniques), dtype=object)
+            for value_number, value in enumerate(uniques):
+                token_lists[value_number] = tokenize(value)
+            tokens = pd.Series(token_lists[codes],
+                               index=np.arange(self.n_rows) * self.n_columns + col_number)
+            tokens = tokens.explode().dropna()
+            terms.append(tokens.to_numpy(dtype=object))
+            cells.append(tokens.index.to_numpy(dtype=np.int64))
+
+        terms = np.concatenate(terms) if terms else np.array([], dtype=object)
+        cells = np.concatenate(cells) if cells else np.array([], dtype=np.int64)
+        # number the terms in sorted order, then sort and dedupe (term, cell) as one integer
+        codes, self.terms = pd.factorize(terms, sort=True)
+        n_cells = max(self.n_rows * self.n_columns, 1)
+        keys = np.unique(codes.astype(np.int64) * n_cells + cells)
+        # int32 cells halve the size of the posting lists of a full collection
+        self.cells = (keys % n_cells).astype(np.int32 if n_cells < 2 ** 31 else np.int64)
+        self.offsets = np.searchsorted(keys // n_cells, np.arange(len(self.terms) + 1))
+
+    def __len__(self):
+        """ Number of rows in the index """
+        return self.n_rows
+
+    def lookup(self, prefix: str) -> np.ndarray:
+        """
+        Finds the cells containing a token that starts with prefix.
+
+        Parameters
+        ----------
+        prefix (str): Lowercase word prefix
+
+        Returns
+        -------
+        np.ndarray: Sorted cell numbers
+        """
+        start, end = np.searchsorted(self.terms, [prefix, prefix + MAX_CHAR])
+        return np.unique(self.cells[self.offsets[start]:self.offsets[end]])
+
+    def search(self, query: str) -> np.ndarray:
+        """
+        Finds the rows matching every word of a query.
+
+        Parameters
+        ----------
+        query (str): The search text, a query without any words matches every row
+
+        Returns
+        -------
+        np.ndarray: Sorted row positions
+        """
+        words = tokenize(query)
+        if not words:
+            return np.arange(self.n_rows)
+
+        cells = self.lookup(words[0])
+        for word in words[1:]:
+            if len(cells) == 0:
+                break
+            cells = np.intersect1d(cells, self.lookup(word), assume_unique=True)
+        return np.unique(cells // max(self.n_columns, 1))
+
+class LRUCache:
+    """
+    Thread-safe mapping that keeps its most recently used entries.
+
+    Parameters
+    ----------
+    maxsize : int
+        number of entries kept, 0 keeps none
+    """
+    def __init__(self, maxsize: int):
+        self.maxsize = maxsize
+        self._entries = OrderedDict()
+        self._lock = threading.Lock() # Streamlit runs every session in its own thread
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __iter__(self):
+        """ Iterates over a snapshot of the keys, least recently used first """
+        with self._lock:
+            return iter(list(self._entries))
+
+    def values(self) -> list:
+        """ Snapshot of the values, least recently used first """
+        with self._lock:
+            return list(self._entries.values())
+
+    def get(self, key):
+        """ Returns the value of key and marks it as used, None if it is not kept """
+        with self._lock:
+            value = self._entries.get(key)
+            if value is not None:
+                self._entries.move_to_end(key)
+            return value
+
+    def put(self, key, value) -> None:
+        """ Stores a value, dropping the least recently used entries beyond maxsize """
+        with self._lock:
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+class FacetIndex:
+    """
+    Per facet value bitmaps and a sorted year array of a loaded dataset.
+
+    Bitmaps are NumPy boolean arrays packed eight rows to a byte, so combining
+    filters is a bitwise AND over n / 8 bytes. The bitmap of a facet value is built
+    the first time it is asked for and kept in an LRU of cache_size bitmaps, since a
+    full collection can have thousands of cultures and only a few are often selected.
+
+    Parameters
+    ----------
+    data : pd.DataFrame
+        the loaded dataset, rows are referred to by position (data.iloc)
+    facets : tuple, optional
+        the columns that can be filtered on by value, by default FACET_COLUMNS
+    year_column : str, optional
+        the column that can be filtered on by range, by default 'Year'
+    cache_size : int, optional
+        number of facet value bitmaps kept, by default BITMAP_CACHE_SIZE
+    """
+    def __init__(self, data, facets=FACET_COLUMNS, year_column='Year',
+                 cache_size=BITMAP_CACHE_SIZE):
+        self.n_rows = len(data)
+        self._codes = {}
+        self._values = {}
+        for facet in facets:
+            codes, uniques = pd.factorize(data[facet])
+            self._codes[facet] = codes
+            self._values[facet] = {value: code for code, value in enumerate(uniques)}
+        self._bitmaps = LRUCache(cache_size)
+
+        years = data[year_column].to_numpy()
+        self._year_order = np.argsort(years, kind='stable')
+        self._sorted_years = years[self._year_order]
+
+    def all_rows(self) -> np.ndarray:
+        """ Returns the bitmap with every row set """
+        return self.from_positions(np.arange(self.n_rows))
+
+    def from_positions(self, positions) -> np.ndarray:
+        """
+        Builds a bitmap from row positions, e.g. the result of SearchIndex.search.
+
+        Parameters
+        ----------
+        positions (array-like): Row positions to set
+
+        Returns
+        -------
+        np.ndarray: The packed bitmap
+        """
+        mask = np.zeros(self.n_rows, dtype=bool)
+        mask[positions] = True
+        return np.packbits(mask)
+
+    def facet(self, facet: str, values) -> np.ndarray:
+        """
+        Builds the bitmap of the rows whose facet is any of the values.
+
+        Parameters
+        ----------
+        facet (str): The facet column, e.g. 'Culture'
+        values (iterable): The selected values, unknown values match no rows
+
+        Returns
+        -------
+        np.ndarray: The packed bitmap
+        """
+        bitmaps = [self._value_bitmap(facet, value) for value in values]
+        if not bitmaps:
+            return self.from_positions([])
+        return np.bitwise_or.reduce(bitmaps)
+
+    def _value_bitmap(self, facet: str, value) -> np.ndarray:
+        """ Returns the bitmap of a single facet value, building it on first use """
+        code = self._values[facet].get(value)
+        if code is None:
+            return self.from_positions([])
+        bitmap = self._bitmaps.get((facet, value))
+        if bitmap is None:
+            bitmap = np.packbits(self._codes[facet] == code)
+            self._bitmaps.put((facet, value), bitmap)
+        return bitmap
+
+    def year_range(self, start, end) -> np.ndarray:
+        """
+        Builds the bitmap of the rows with start <= year <= end.
+
+        Parameters
+        ----------
+        start (int): First year of the range
+        end (int): Last year of the range
+
+        Returns
+        -------
+        np.ndarray: The packed bitmap
+        """
+        first = np.searchsorted(self._sorted_years, start, side='left')
+        last = np.searchsorted(self._sorted_years, end, side='right')
+        return self.from_positions(self._year_order[first:last])
+
+    def select(self, bitmaps) -> np.ndarray:
+        """
+        Combines bitmaps with a bitwise AND.
+
+        Parameters
+        ----------
+        bitmaps (list): Packed bitmaps, an empty list selects every row
+
+        Returns
+        -------
+        np.ndarray: Sorted positions of the rows set in every bitmap
+        """
+        if not bitmaps:
+            return np.arange(self.n_rows)
+        combined = np.bitwise_and.reduce(bitmaps)
+        return np.flatnonzero(np.unpackbits(combined, count=self.n_rows))
@@ -6,17 +6,29 @@ Tests
     test_check_europeana_response
     test_fetch
     test_filter_objects
+    test_stream_fetch
+    test_stream_fetch_is_lazy
+    test_fetch_changed_ids
+    test_resolve_chunks_share_session
+    test_run_against_mock_server
 """
+import os
+import random
 import unittest
-from unittest.mock import Mock, patch
+from unittest.mock import AsyncMock, MagicMock, Mock, patch
 
 import asyncio
 import aiohttp
+from benchmarks.mock_server import MockServer, MockSettings
+from data_aquisition import async_utils # pylint: disable=import-error
 from data_aquisition.async_utils import ( # pylint: disable=import-error
     check_europeana_response,
     fetch,
-    filter_objects
+    fetch_changed_ids,
+    filter_objects,
+    stream_fetch
 )
+from data_aquisition.rate_limit import RateLimiter # pylint: disable=import-error
 import pandas as pd
 
 class TestAsyncUtils(unittest.TestCase):
@@ -132,6 +144,106 @@ class TestAsyncUtils(unittest.TestCase):
             result = filter_objects(met_data, "MET")
             self.assertEqual(len(result), 2)
             self.assertTrue('image_url' in result.columns)
+
+    @patch('data_aquisition.async_utils.fetch')
+    def test_stream_fetch(self, mock_fetch):
+        """
+        Test that stream_fetch yields a result for every url
+        """
+        async def fake_fetch(session, url, flag, **kwargs): # pylint: disable=unused-argument
+            await asyncio.sleep(0)
+            return "" if url.endswith("bad") else url
+        mock_fetch.side_effect = fake_fetch
+
+        async def collect():
+            urls = [f"https://example.com/{i}" for i in range(50)] + ["https://example.com/bad"]
+            return {url: result
+                    async for url, result in stream_fetch(None, urls, "MET", workers=4)}
+
+        results = asyncio.run(collect())
+        self.assertEqual(len(results), 51)
+        self.assertEqual(results["https://example.com/7"], "https://example.com/7")
+        self.assertEqual(results["https://example.com/bad"], "")
+
+    @patch('data_aquisition.async_utils.fetch')
+    def test_stream_fetch_is_lazy(self, mock_fetch):
+        """
+        Test that stream_fetch only pulls a bounded number of urls ahead of the consumer
+        """
+        async def fake_fetch(session, url, flag, **kwargs): # pylint: disable=unused-argument
+            return url
+        mock_fetch.side_effect = fake_fetch
+        pulled = []
+
+        def url_source():
+            for i in range(100000):
+                pulled.append(i)
+                yield f"https://example.com/{i}"
+
+        async def take_first():
+            stream = stream_fetch(None, url_source(), "MET", workers=2, queue_size=2)
+            first = await stream.__anext__() # pylint: disable=unnecessary-dunder-call
+            await stream.aclose()
+            return first
+
+        asyncio.run(take_first())
+        # workers + both queues + the url being handed over, nowhere near 100000
+        self.assertLess(len(pulled), 10)
             
+    def test_fetch_changed_ids(self):
+        """
+        Test that changed object ids are requested by date and returned as strings
+        """
+        response = MagicMock()
+        response.status = 200
+
+        async def json():
+            return {"total": 2, "objectIDs": [34, 35]}
+        response.json = json
+        session = MagicMock()
+        session.get.return_value.__aenter__.return_value = response
+
+        ids = asyncio.run(fetch_changed_ids("2024-01-01", session=session))
+        self.assertEqual(ids, ["34", "35"])
+        _, kwargs = session.get.call_args
+        self.assertEqual(kwargs['params'], {'metadataDate': '2024-01-01'})
+
+    @patch('data_aquisition.async_utils.resolve', new_callable=AsyncMock)
+    def test_resolve_chunks_share_session(self, mock_resolve):
+        """
+        Test that every chunk is resolved over the same session and rate limiter
+        """
+        mock_resolve.side_effect = lambda url_dict, flag, **kwargs: {
+            obj_id: f"{obj_id}.jpg" for obj_id in url_dict.values()}
+        chunks = [{'url1': '1', 'url2': '2'}, {'url3': '3'}]
+        done = []
+        async_utils.resolve_objects_chunked(
+            iter(chunks), "MET", lambda chunk, results: done.append((chunk, results)))
+
+        self.assertEqual(done, [(chunks[0], {'1': '1.jpg', '2': '2.jpg'}),
+                                (chunks[1], {'3': '3.jpg'})])
+        (_, first), (_, second) = mock_resolve.call_args_list
+        self.assertIs(first['session'], second['session'])
+        self.assertIs(first['limiter'], second['limiter'])
+
+    def test_run_against_mock_server(self):
+        """
+        Test that run resolves every object from a server that answers with 500s and 429s
+        """
+        settings = MockSettings(latency=0.001, jitter=0, error_rate=0.2, throttle_rate=0.1,
+                                retry_after=0.01, no_image_rate=0.25)
+        met_data = pd.DataFrame({'Object ID': [str(i) for i in range(100)]})
+        limiter = RateLimiter(host_limits={}, default_limits=(1000, 20))
+        with MockServer(settings) as server, \
+                patch.dict(os.environ, {'MET_OBJECTS_URL': server.met_objects_url}):
+            result = asyncio.run(async_utils.run(met_data, "MET", limiter=limiter, workers=20))
+
+        # the mock gives the same objects an image every time
+        with_image = [obj_id for obj_id in met_data['Object ID']
+                      if random.Random(obj_id).random() >= settings.no_image_rate]
+        self.assertEqual(result['Object ID'].tolist(), with_image)
+        self.assertEqual(result['image_url'].iloc[0],
+                         f"http://127.0.0.1:{server.port}/images/{with_image[0]}.jpg")
+
 if __name__ == '__main__':
     unittest.main()
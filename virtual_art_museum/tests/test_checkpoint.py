@@ -0,0 +1,53 @@
+"""
+Module for testing the checkpoint module
+
+Tests
+----------
+    test_chunked
+    test_append_and_load
+    test_load_skips_truncated_line
+"""
+import os
+import tempfile
+import unittest
+
+from data_aquisition.checkpoint import ResultJournal, chunked # pylint: disable=import-error
+
+class TestCheckpoint(unittest.TestCase):
+    """
+    Test the checkpoint module
+    """
+    def setUp(self):
+        """ Creates a journal in a temporary directory """
+        self.tmp_dir = tempfile.TemporaryDirectory() # pylint: disable=consider-using-with
+        self.path = os.path.join(self.tmp_dir.name, 'journal.jsonl')
+        self.journal = ResultJournal(self.path)
+
+    def tearDown(self):
+        """ Removes the temporary directory """
+        self.tmp_dir.cleanup()
+
+    def test_chunked(self):
+        """ Chunks are consecutive and the last one holds the remainder """
+        self.assertEqual(list(chunked([1, 2, 3, 4, 5], 2)), [[1, 2], [3, 4], [5]])
+        self.assertEqual(list(chunked([], 2)), [])
+        with self.assertRaises(ValueError):
+            list(chunked([1], 0))
+
+    def test_append_and_load(self):
+        """ Records from every chunk are loaded, later records win """
+        self.assertEqual(self.journal.load(), {})
+        self.journal.append({'1': 'url1', '2': ''})
+        self.journal.append({'3': 'url3', '2': 'url2'})
+        self.assertEqual(self.journal.load(), {'1': 'url1', '2': 'url2', '3': 'url3'})
+
+    def test_load_skips_truncated_line(self):
+        """ A line cut off by a crash is ignored and does not swallow the next record """
+        self.journal.append({'1': 'url1'})
+        with open(self.path, "a", encoding="utf-8") as file:
+            file.write('{"id": "2", "image')
+        self.journal.append({'3': 'url3'})
+        self.assertEqual(self.journal.load(), {'1': 'url1', '3': 'url3'})
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,115 @@
+"""
+Unit tests for collection.py
+
+Tests
+----------
+    test_query
+    test_rows_across_datasets
+    test_rows_from_csv
+    test_pages
+    test_query_results_are_shared
+"""
+import unittest
+import os
+import sys
+import tempfile
+from unittest.mock import patch
+
+import pandas as pd
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from collection import Collection # pylint: disable=import-error
+from data_aquisition.storage import save_dataset # pylint: disable=import-error
+
+class TestCollection(unittest.TestCase):
+    """ Test the Collection class """
+    def setUp(self):
+        """ Writes a MET and a Europeana dataset to disk """
+        self.tmp_dir = tempfile.TemporaryDirectory() # pylint: disable=consider-using-with
+        met = pd.DataFrame({
+            'Title': [f'MET Vase {i}' for i in range(60)],
+            'Culture': ['French', 'Italian'] * 30,
+            'Year': [1800 + i for i in range(60)],
+            'Repository': ['MET'] * 60,
+            'image_url': [f'met_url{i}' for i in range(60)]
+        })
+        europeana = pd.DataFrame({
+            'Title': [f'Euro Portrait {i}' for i in range(40)],
+            'Culture': ['Italian'] * 40,
+            'Year': [1900 + i for i in range(40)],
+            'Repository': ['Europeana'] * 40,
+            'image_url': [f'euro_url{i}' for i in range(40)]
+        })
+        met_path = os.path.join(self.tmp_dir.name, 'met.feather')
+        europeana_path = os.path.join(self.tmp_dir.name, 'europeana.parquet')
+        save_dataset(met, met_path)
+        save_dataset(europeana, europeana_path)
+        self.collection = Collection([met_path, europeana_path],
+                                     columns=['Title', 'Year', 'image_url'], random_state=0)
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def test_query(self):
+        """ Filters combine over both datasets """
+        self.assertEqual(len(self.collection), 100)
+        self.assertEqual(len(self.collection.query()), 100)
+        self.assertEqual(len(self.collection.query(search='vase')), 60)
+        self.assertEqual(len(self.collection.query(culture=['Italian'])), 70)
+        self.assertEqual(len(self.collection.query(culture=['Italian'], datasource='MET')), 30)
+        self.assertEqual(len(self.collection.query(years=(1850, 1909))), 20)
+        self.assertEqual(len(self.collection.query(search='portrait 3', years=(1930, 1939))), 10)
+        self.assertEqual(len(self.collection.query(search='portrait 35')), 1)
+
+    def test_rows_across_datasets(self):
+        """ Rows are read from the right dataset, in the order asked for """
+        rows = self.collection.rows([65, 3, 99])
+        self.assertEqual(rows['Title'].tolist(),
+                         ['Euro Portrait 5', 'MET Vase 3', 'Euro Portrait 39'])
+        self.assertEqual(rows.index.tolist(), [65, 3, 99])
+        self.assertEqual(list(rows.columns), ['Title', 'Year', 'image_url'])
+        self.assertEqual(len(self.collection.rows([])), 0)
+
+    def test_rows_from_csv(self):
+        """ CSV rows are loaded once, not parsed again for every page """
+        csv_path = os.path.join(self.tmp_dir.name, 'met.csv')
+        save_dataset(pd.DataFrame({'Title': [f'Vase {i}' for i in range(10)],
+                                   'Culture': ['French'] * 10, 'Year': range(10),
+                                   'Repository': ['MET'] * 10}), csv_path)
+        collection = Collection([csv_path], columns=['Title'])
+        with patch('collection.take_rows') as mock_take_rows:
+            rows = collection.rows([7, 2])
+        mock_take_rows.assert_not_called()
+        self.assertEqual(rows['Title'].tolist(), ['Vase 7', 'Vase 2'])
+
+    def test_pages(self):
+        """ Pages follow the shuffled display order until the results run out """
+        results = self.collection.query()
+        self.assertNotEqual(results.tolist(), sorted(results.tolist()))
+
+        first, offset = self.collection.page(results, 0, 48)
+        self.assertEqual(first.index.tolist(), results[:48].tolist())
+        self.assertEqual(offset, 48)
+        _, offset = self.collection.page(results, offset, 48)
+        last, offset = self.collection.page(results, offset, 48)
+        self.assertEqual(len(last), 4)
+        self.assertIsNone(offset)
+
+    def test_query_results_are_shared(self):
+        """ Each distinct set of filters is run once and kept as a small read-only bitmap """
+        first = self.collection.query(search='Vase ', culture=['Italian', 'French'])
+        second = self.collection.query(search='vase', culture=['French', 'Italian'])
+        self.assertEqual(first.tolist(), second.tolist())
+        self.assertEqual(len(self.collection._results), 1) # pylint: disable=protected-access
+
+        bitmap = next(iter(self.collection._results.values())) # pylint: disable=protected-access
+        self.assertEqual(bitmap.nbytes, 13) # 100 rows, a bit each
+        self.assertFalse(bitmap.flags.writeable)
+
+        small = Collection(self.collection.paths, random_state=0, cache_size=2)
+        for year in range(1800, 1805):
+            small.query(years=(year, year))
+        self.assertEqual(len(small._results), 2) # pylint: disable=protected-access
+
+if __name__ == '__main__':
+    unittest.main()
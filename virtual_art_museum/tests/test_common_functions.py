@@ -6,6 +6,8 @@ Tests
 ----------
     print_example_rows
     century_mapping
+    map_centuries
+    map_distinct
     image_processing_europeana
     blend_datasources
     reorder_columns
@@ -14,12 +16,15 @@ import io
 import sys
 import unittest
 
+import numpy as np
 import pandas as pd
 
 from data_aquisition.common_functions import (
     blend_datasources,
     century_mapping,
     image_processing_europeana,
+    map_centuries,
+    map_distinct,
     print_example_rows,
     reorder_columns
 )
@@ -82,6 +87,32 @@ class TestCommonFunctions(unittest.TestCase):
         self.assertEqual(century_mapping(101), "2nd century AD")
         self.assertEqual(century_mapping(2020), "Unknown")
         self.assertEqual(century_mapping(900000000), "Unknown")
+        self.assertEqual(century_mapping(" 250 "), "3rd century AD")
+        self.assertEqual(century_mapping("c. 1850"), "Unknown")
+
+    def test_map_centuries(self):
+        """ Test map_centuries gives the same result as century_mapping """
+        years = pd.Series([1850, -500, 101, 1, 250, -1, 0, 2015, 2020, 900000000, 1850,
+                           -150049, 2001, -201], index=range(10, 24), name='Year')
+        expected = years.apply(century_mapping)
+        pd.testing.assert_series_equal(map_centuries(years), expected)
+
+        mixed = pd.Series(['1850', 'Unknown', None, 101, 1850.7, np.nan, ' 12 ', '1850'])
+        pd.testing.assert_series_equal(map_centuries(mixed), mixed.apply(century_mapping))
+
+    def test_map_distinct(self):
+        """ Test map_distinct transforms each distinct value once and keeps the index """
+        column = pd.Series(['a', 'b', np.nan, 'a'], index=[3, 2, 1, 0], name='col')
+        seen = []
+
+        def transform(values):
+            seen.append(len(values))
+            return values.str.upper().fillna('missing')
+
+        result = map_distinct(column, transform)
+        self.assertEqual(seen, [3])
+        pd.testing.assert_series_equal(
+            result, pd.Series(['A', 'B', 'missing', 'A'], index=[3, 2, 1, 0], name='col'))
 
     def test_image_processing_europeana(self):
         """ Test image_processing_europeana function """
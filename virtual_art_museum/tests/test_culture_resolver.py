@@ -0,0 +1,59 @@
+"""
+Module for testing the culture_resolver module
+
+Tests
+----------
+    test_resolution_order
+    test_derived_countries
+    test_resolves_each_country_once
+"""
+import unittest
+from unittest.mock import patch
+
+from data_aquisition.culture_resolver import ( # pylint: disable=import-error
+    CultureResolver,
+    guess_country
+)
+
+class TestCultureResolver(unittest.TestCase):
+    """
+    Test the CultureResolver class
+    """
+    def setUp(self):
+        self.resolver = CultureResolver(['Roman', 'Japanese', 'Greek, ancient', ' Coptic',
+                                         'Scottish', 'French'])
+
+    def test_resolution_order(self):
+        """ Exact country, then a known country inside it, then a culture inside it """
+        resolve = self.resolver.resolve
+        self.assertEqual(resolve('France'), 'French')
+        self.assertEqual(resolve(' Italy '), 'Italian')
+        self.assertEqual(resolve('Kingdom of the Netherlands'), 'Dutch')
+        self.assertEqual(resolve('ancient roman empire'), 'Roman')
+        self.assertEqual(resolve('Egypt, coptic period'), ' Coptic')
+        self.assertEqual(resolve('FRANCE'), 'Culture unknown')
+        self.assertEqual(resolve('Unknown'), 'Culture unknown')
+        self.assertEqual(resolve(None), 'Culture unknown')
+        self.assertEqual(resolve(float('nan')), 'Culture unknown')
+
+    def test_derived_countries(self):
+        """ Cultures with a country suffix add their guessed country to the table """
+        self.assertEqual(guess_country('Japanese'), 'Japan')
+        self.assertEqual(guess_country('French'), 'Frence')
+        self.assertIsNone(guess_country('Roman'))
+        self.assertEqual(self.resolver.resolve('Japan'), 'Japanese')
+        self.assertEqual(self.resolver.country_to_culture['Scott'], 'Scottish')
+        self.assertNotIn('Rom', self.resolver.country_to_culture)
+        # the country of a derived culture is not added again
+        resolver = CultureResolver(['Britishish'])
+        self.assertNotIn('British', resolver.country_to_culture)
+
+    def test_resolves_each_country_once(self):
+        """ The scans run once per distinct country """
+        with patch.object(self.resolver, '_scan', wraps=self.resolver._scan) as scan: # pylint: disable=protected-access
+            for country in ['Japan', ' Japan', 'Japan ', 'Rome', 'Japan'] * 100:
+                self.resolver.resolve(country)
+        self.assertEqual(scan.call_count, 2)
+
+if __name__ == '__main__':
+    unittest.main()
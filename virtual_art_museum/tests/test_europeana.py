@@ -8,6 +8,8 @@ Tests
     - Test year extraction
     - Test data processing
     - Test data cleaning
+    - Test concurrent harvesting of query terms
+    - Test vectorized year extraction
 
 Note
 -------
@@ -16,6 +18,9 @@ Note
     show that the data processing functionality is working, in contrast to the Met Museum
     test script where we see a bad url filtered out.
 """
+import asyncio
+import threading
+import time
 import unittest
 from unittest.mock import patch
 import os
@@ -24,7 +29,11 @@ import warnings
 
 import pandas as pd
 
-from data_aquisition.europeana import Europeana # pylint: disable=import-error
+from data_aquisition.europeana import ( # pylint: disable=import-error
+    Europeana,
+    extract_years,
+    harvest
+)
 
 class EuropeanaTests(unittest.TestCase):
     """ Tests the Europeana class """
@@ -112,5 +121,55 @@ class EuropeanaTests(unittest.TestCase):
         # Check if repository is correctly set
         self.assertTrue(all(processed_df['repository'] == 'EUROPEANA'))
 
+    @patch('data_aquisition.europeana.apis')
+    @patch('data_aquisition.europeana.utils')
+    def test_harvest(self, mock_utils, mock_apis):
+        """Terms are harvested concurrently, each following its own cursor chain"""
+        lock = threading.Lock()
+        state = {'in_flight': 0, 'peak': 0}
+
+        def search(query, cursor, rows, **kwargs): # pylint: disable=unused-argument
+            with lock:
+                state['in_flight'] += 1
+                state['peak'] = max(state['peak'], state['in_flight'])
+            time.sleep(0.1)
+            with lock:
+                state['in_flight'] -= 1
+            page = 0 if cursor == '*' else int(cursor)
+            return {'items': [f'{query}-{page}'] * 2,
+                    'nextCursor': str(page + 1) if page < 2 else None}
+        mock_apis.search.side_effect = search
+        mock_utils.search2df.side_effect = lambda response: pd.DataFrame(
+            {'europeana_id': response['items'][:1]})
+
+        terms = [f'term{i}' for i in range(6)]
+        result = asyncio.run(harvest(terms, concurrency=3, rate=1000, max_results=10))
+
+        # requests overlapped, but never more than concurrency of them
+        self.assertEqual(state['peak'], 3)
+        self.assertEqual(result['europeana_id'].tolist(),
+                         [f'{term}-{page}' for term in terms for page in range(3)])
+
+        # a term stops after max_results
+        result = asyncio.run(harvest(['term'], rate=1000, max_results=4))
+        self.assertEqual(result['europeana_id'].tolist(), ['term-0', 'term-1'])
+
+    def test_extract_years(self):
+        """The vectorized year extraction matches extract_year row by row"""
+        df = pd.DataFrame({
+            'description': ['Created in 1855', 'No date', 'Unknown', 'Dated 12345', 1901.0,
+                            'Circa 1700-1750', 'Nothing'],
+            'title': ['Painting from 1850', 'Map 1600', 'Untitled', 'x', 'y', 'Title 1999',
+                      'Nothing'],
+            'creator': ['Artist (1820-1880)', 'Unknown', 'Anon (1500-1560)', '', '', '',
+                        'Unknown'],
+        }, index=[5, 5, 3, 0, 1, 9, 2])
+        europeana = Europeana.__new__(Europeana)
+        expected = df.apply(europeana.extract_year, axis=1).astype(int)
+
+        years = extract_years(df)
+        pd.testing.assert_series_equal(years, expected)
+        self.assertEqual(years.tolist(), [1855, 1600, 1500, 1234, 1901, 1700, -1])
+
 if __name__ == '__main__':
     unittest.main()
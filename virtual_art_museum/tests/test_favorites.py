@@ -2,23 +2,28 @@
 Unit tests for the favorites module.
 
 This module tests the functionality of favorites.py, ensuring that:
-- Favorites can be loaded and saved correctly.
 - A collage of images can be created from favorites.
+- Favorite images are loaded through the image cache.
+- Collages are only rendered once per favorites list and format.
+- Large collages can be streamed a row at a time, as one image, PDF pages or tiles.
 
 Tests cover both file operations and UI components using mocks.
 """
 
 import unittest
-from unittest.mock import patch, MagicMock, mock_open
-import json
+from unittest.mock import patch, MagicMock
 from io import BytesIO
 import os
+import re
+import tempfile
+import zipfile
 import requests
 from PIL import Image
 
 # Import functions from favorites.py
-from Pages.favorites import load_favorites, save_favorites, create_collage, display_favorites, main
-FAVORITES_CACHE_FILE = "favorites_cache.json"
+from Pages.favorites import (create_collage, display_favorites, load_image_paths, collage_image,
+                             favorites_key, render_collage, stream_collage, main)
+from thumbnails import ThumbnailCache
 
 class TestFavorites(unittest.TestCase):
     """Tests for the favorites module."""
@@ -30,57 +35,6 @@ class TestFavorites(unittest.TestCase):
             {"image_url": "http://example.com/image2.jpg", "Title": "Artwork 2"},
         ]
 
-    @patch('builtins.open')
-    @patch('os.path.exists')  # Add os.path.exists patch
-    def test_load_favorites_empty(self, mock_exists, mock_file):
-        """Test that load_favorites returns an empty list when the cache file is empty"""
-        # Set up os.path.exists to return False
-        mock_exists.return_value = False
-        
-        # Call the function
-        favorites = load_favorites()
-        
-        # Verify results
-        self.assertEqual(favorites, [])
-        
-        # Verify that exists was checked and open was never called
-        mock_exists.assert_called_once_with(FAVORITES_CACHE_FILE)
-        mock_file.assert_not_called()
-    
-    @patch('builtins.open')
-    @patch('os.path.exists')
-    def test_load_favorites_with_data(self, mock_exists, mock_file):
-        """Test that load_favorites correctly loads data from a non-empty cache file"""
-        # Setup test data
-        test_data = [{'image_url': 'test_url', 'Title': 'Test Art'}]
-        
-        # Mock os.path.exists to return True
-        mock_exists.return_value = True
-        
-        # Setup mock to return JSON string directly
-        mock_context = MagicMock()
-        mock_context.read.return_value = json.dumps(test_data)
-        mock_file.return_value.__enter__.return_value = mock_context
-        
-        # Call the function
-        favorites = load_favorites()
-
-        # Verify results
-        self.assertEqual(len(favorites), 1)
-        self.assertEqual(favorites, test_data)
-        
-        # Verify the mocks were called correctly
-        mock_exists.assert_called_once_with(FAVORITES_CACHE_FILE)
-        mock_file.assert_called_once_with(FAVORITES_CACHE_FILE, "r", encoding="utf-8")
-
-    @patch("builtins.open", new_callable=mock_open)
-    @patch("json.dump")
-    def test_save_favorites(self, mock_json_dump, mock_file):
-        """Test that save_favorites correctly writes data to the cache file."""
-        save_favorites(self.test_favorites)
-        mock_file.assert_called_with(FAVORITES_CACHE_FILE, "w", encoding="utf-8")
-        mock_json_dump.assert_called_with(self.test_favorites, mock_file())
-
     @patch("requests.get")
     def test_create_collage(self, mock_get):
         """Test that create_collage generates an image collage from a list of images."""
@@ -93,5 +47,72 @@ class TestFavorites(unittest.TestCase):
         result = create_collage(images, captions)
         self.assertIsInstance(result, BytesIO)
 
+    def test_load_image_paths(self):
+        """Test that load_image_paths fetches each image once and skips failed ones."""
+        buffer = BytesIO()
+        Image.new("RGB", (600, 300)).save(buffer, format="JPEG")
+        session = MagicMock()
+
+        def get(url, timeout=None): # pylint: disable=unused-argument
+            if url.endswith("image2.jpg"):
+                raise requests.ConnectionError("unreachable")
+            return MagicMock(content=buffer.getvalue())
+        session.get.side_effect = get
+
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            cache = ThumbnailCache(tmp_dir, session=session)
+            paths = load_image_paths(self.test_favorites, cache)
+            self.assertTrue(paths[0].startswith(tmp_dir))
+            self.assertIsNone(paths[1])
+            self.assertEqual(collage_image(paths[0]).size, (300, 150))
+
+            load_image_paths(self.test_favorites[:1], cache)
+            self.assertEqual(session.get.call_count, 2)
+
+    def test_render_collage(self):
+        """Test that collages are memoized by favorites and format, in every format."""
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            path = os.path.join(tmp_dir, "image.png")
+            Image.new("RGB", (320, 160)).save(path)
+            key = favorites_key(self.test_favorites)
+            self.assertNotEqual(key, favorites_key(self.test_favorites[::-1]))
+
+            image_formats = ["PNG", "JPEG", "WEBP"]
+            with patch("Pages.favorites.create_collage", wraps=create_collage) as mock_create:
+                for image_format in image_formats:
+                    data = render_collage(key, image_format, (path, None), ("Artwork 1", "2"))
+                    self.assertEqual(Image.open(BytesIO(data)).format, image_format)
+                    render_collage(key, image_format, (path, None), ("Artwork 1", "2"))
+                self.assertEqual(mock_create.call_count, len(image_formats))
+
+    def test_stream_collage(self):
+        """Test that the row by row collage matches create_collage and writes pages / tiles."""
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            paths = []
+            for i in range(7):
+                paths.append(os.path.join(tmp_dir, f"image{i}.png"))
+                Image.new("RGB", (320, 100 + 20 * i), (30 * i, 0, 0)).save(paths[-1])
+            captions = [f"Artwork {i}" for i in range(7)]
+
+            output = BytesIO()
+            stream_collage(paths, captions, output)
+            streamed = Image.open(BytesIO(output.getvalue()))
+            created = Image.open(create_collage([collage_image(p) for p in paths], captions))
+            self.assertEqual(streamed.width, created.width)
+            self.assertEqual(list(streamed.getdata()),
+                             list(created.crop((0, 0, *streamed.size)).getdata()))
+
+            output = BytesIO()
+            stream_collage(paths, captions, output, "PDF")
+            self.assertTrue(output.getvalue().startswith(b"%PDF"))
+            self.assertEqual(re.findall(rb"/Count (\d+)", output.getvalue())[-1], b"3")
+
+            output = BytesIO()
+            stream_collage(paths, captions, output, "ZIP")
+            with zipfile.ZipFile(output) as archive:
+                self.assertEqual(len(archive.namelist()), 3)
+                with archive.open(archive.namelist()[-1]) as tile:
+                    self.assertEqual(Image.open(tile).height, 20 + 300 * 220 // 320 + 40)
+
 if __name__ == "__main__":
     unittest.main()
\ No newline at end of file
@@ -0,0 +1,83 @@
+"""
+Unit tests for favorites_store.py
+
+Tests
+----------
+    test_add_and_remove
+    test_users_are_separate
+    test_concurrent_sessions
+    test_session_user
+"""
+import unittest
+import os
+import sys
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from favorites_store import FavoritesStore, object_id, session_user # pylint: disable=import-error
+
+class TestFavoritesStore(unittest.TestCase):
+    """ Test the FavoritesStore class """
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory() # pylint: disable=consider-using-with
+        self.path = os.path.join(self.tmp_dir.name, 'favorites.sqlite')
+        self.store = FavoritesStore(self.path)
+
+    def tearDown(self):
+        self.store.close()
+        self.tmp_dir.cleanup()
+
+    def test_add_and_remove(self):
+        """ Favorites are added once, listed oldest first and removed one at a time """
+        self.assertTrue(self.store.add('ann', object_id('MET', '1979.1'), 'url1', 'Vase'))
+        self.assertTrue(self.store.add('ann', object_id('Europeana', '/9/x'), 'url2', 'Map'))
+        self.assertFalse(self.store.add('ann', 'MET:1979.1', 'url1', 'Vase'))
+        self.assertTrue(self.store.contains('ann', 'MET:1979.1'))
+        self.assertEqual(self.store.favorites('ann'), [
+            {'object_id': 'MET:1979.1', 'image_url': 'url1', 'Title': 'Vase'},
+            {'object_id': 'Europeana:/9/x', 'image_url': 'url2', 'Title': 'Map'},
+        ])
+
+        self.assertTrue(self.store.remove('ann', 'MET:1979.1'))
+        self.assertFalse(self.store.remove('ann', 'MET:1979.1'))
+        self.assertFalse(self.store.contains('ann', 'MET:1979.1'))
+        self.assertEqual(self.store.count('ann'), 1)
+        self.assertEqual(self.store.clear('ann'), 1)
+        self.assertEqual(self.store.favorites('ann'), [])
+
+    def test_users_are_separate(self):
+        """ Each user only sees and removes their own favorites, also from another connection """
+        self.store.add('ann', 'MET:1', 'url1', 'Vase')
+        self.store.add('bob', 'MET:1', 'url1', 'Vase')
+        self.store.add('bob', 'MET:2', 'url2', 'Bowl')
+        self.store.clear('ann')
+        with FavoritesStore(self.path) as other:
+            self.assertEqual(other.count('ann'), 0)
+            self.assertEqual([f['object_id'] for f in other.favorites('bob')], ['MET:1', 'MET:2'])
+
+    def test_concurrent_sessions(self):
+        """ Sessions adding and removing at the same time do not lose each other's changes """
+        def session(user):
+            for i in range(50):
+                self.store.add(user, f'MET:{i}', f'url{i}', f'Art {i}')
+            for i in range(0, 50, 2):
+                self.store.remove(user, f'MET:{i}')
+            return self.store.count(user)
+
+        users = [f'user{i}' for i in range(8)]
+        with ThreadPoolExecutor(max_workers=8) as executor:
+            self.assertEqual(list(executor.map(session, users)), [25] * 8)
+
+    def test_session_user(self):
+        """ A new session gets a user id, kept in the url, which a reload picks back up """
+        session_state, query_params = {}, {}
+        user = session_user(session_state, query_params)
+        self.assertEqual(session_state['user_id'], user)
+        self.assertEqual(query_params['user'], user)
+        self.assertEqual(session_user({}, query_params), user)
+        self.assertEqual(session_user(session_state, {}), user)
+        self.assertNotEqual(session_user({}, {}), user)
+
+if __name__ == '__main__':
+    unittest.main()
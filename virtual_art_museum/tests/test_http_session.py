@@ -0,0 +1,51 @@
+"""
+Module for testing the http_session module
+
+Tests
+----------
+    test_session_settings
+    test_session_settings_invalid
+    test_create_session
+"""
+import asyncio
+import unittest
+
+from data_aquisition.http_session import ( # pylint: disable=import-error
+    DEFAULT_SETTINGS,
+    create_session,
+    session_settings
+)
+
+class TestHttpSession(unittest.TestCase):
+    """
+    Test the http_session module
+    """
+    def test_session_settings(self):
+        """ Source profiles and overrides are layered over the defaults """
+        self.assertEqual(session_settings(), DEFAULT_SETTINGS)
+        europeana = session_settings('EUROPEANA')
+        self.assertEqual(europeana['limit_per_host'], 8)
+        self.assertEqual(europeana['read_timeout'], DEFAULT_SETTINGS['read_timeout'])
+        self.assertEqual(session_settings('MET', limit=10)['limit'], 10)
+
+    def test_session_settings_invalid(self):
+        """ Unknown sources and settings are rejected """
+        with self.assertRaises(ValueError):
+            session_settings('LOUVRE')
+        with self.assertRaises(ValueError):
+            session_settings('MET', http3=True)
+
+    def test_create_session(self):
+        """ The connector and timeouts are configured from the settings """
+        async def build():
+            async with create_session('EUROPEANA', connect_timeout=3) as session:
+                return session.connector.limit, session.connector.limit_per_host, session.timeout
+
+        limit, limit_per_host, timeout = asyncio.run(build())
+        self.assertEqual(limit, 200)
+        self.assertEqual(limit_per_host, 8)
+        self.assertEqual(timeout.sock_connect, 3)
+        self.assertIsNone(timeout.total)
+
+if __name__ == '__main__':
+    unittest.main()
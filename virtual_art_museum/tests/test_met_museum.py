@@ -5,9 +5,16 @@ that was perfomed on all 400,000+ objects in the Met collection.
 Tests
 -------
     - Test the full pipeline
+    - Test the checkpointed pipeline
+    - Test the incremental sync
     - Test the split_delimited method
     - Test the clean_title method
     - Test the clean_culture method
+    - Test that the vectorized process_data matches the row-by-row version
+    - Test that the sharded process_data matches the serial version
+    - Test that the streaming pipeline matches loading the whole file
+    - Test that the streaming pipeline reads the journal once and shards every chunk
+    - Test that the streaming pipeline replaces old output when nothing is saved
 
 Note
 -------
@@ -19,11 +26,16 @@ import unittest
 import os
 import tracemalloc
 import warnings
-from unittest.mock import patch
+from concurrent.futures import ProcessPoolExecutor
+from unittest.mock import AsyncMock, patch
 
 import pandas as pd
 
-from data_aquisition.met_museum import MetMuseum # pylint: disable=import-error
+from benchmarks.bench_met_process_data import process_data_rowwise
+from benchmarks.synthetic import make_met_objects
+from data_aquisition.checkpoint import ResultJournal # pylint: disable=import-error
+from data_aquisition.met_museum import MetMuseum, stream_pipeline # pylint: disable=import-error
+from data_aquisition.storage import apply_dtypes, load_dataset # pylint: disable=import-error
 
 class MetMuseumTests(unittest.TestCase):
     ''' Tests the MetMuseum class '''
@@ -73,8 +85,9 @@ class MetMuseumTests(unittest.TestCase):
         tracemalloc.stop()
         if os.path.exists('./data/test_met_objects.csv'):
             os.remove('./data/test_met_objects.csv')
-        if os.path.exists('./data/processed_met_objects.csv'):
-            os.remove('./data/processed_met_objects.csv')
+        for path in ('./data/processed_met_objects.csv', './data/processed_met_objects.parquet'):
+            if os.path.exists(path):
+                os.remove(path)
 
     @patch('data_aquisition.met_museum.filter_objects')
     def test_full_pipeline(self, mock_filter_objects):
@@ -95,6 +108,62 @@ class MetMuseumTests(unittest.TestCase):
         self.assertEqual(met.df.loc[0, 'image_url'],
                         'https://images.metmuseum.org/CRDImages/ad/original/204788.jpg')
 
+    @patch('data_aquisition.async_utils.resolve', new_callable=AsyncMock)
+    def test_checkpointed_pipeline(self, mock_resolve):
+        """ Tests that a restarted checkpointed run skips objects already in the journal """
+        journal_path = './data/test_met_journal.jsonl'
+        image_url = 'https://images.metmuseum.org/CRDImages/ad/original/204788.jpg'
+        # the bad row was resolved (without an image) by a previous, interrupted run
+        ResultJournal(journal_path).append({'123456789021394871478891498290': ''})
+        mock_resolve.side_effect = lambda url_dict, flag, **kwargs: {
+            obj_id: image_url for obj_id in url_dict.values()
+        }
+        try:
+            met = MetMuseum('./data/test_met_objects.csv', run_full_pipeline=True,
+                            journal_path=journal_path, chunk_size=1)
+            # only the one remaining object needed a request
+            mock_resolve.assert_called_once()
+            self.assertEqual(len(met.df), 1)
+            self.assertEqual(met.df.iloc[0]['image_url'], image_url)
+            self.assertEqual(len(ResultJournal(journal_path).load()), 2)
+        finally:
+            os.remove(journal_path)
+
+    @patch('data_aquisition.met_museum.resolve_objects')
+    @patch('data_aquisition.met_museum.changed_object_ids')
+    def test_sync(self, mock_changed_ids, mock_resolve_objects):
+        """ Tests that a sync only resolves changed objects and merges them into the dataset """
+        dataset_path = './data/test_met_synced.csv'
+        state_path = f"{dataset_path}.sync.json"
+        previous = pd.DataFrame({'Object ID': ['34', '35', '36'],
+                                 'Title': ['Old', 'Kept', 'Lost'],
+                                 'image_url': ['old.jpg', 'kept.jpg', 'lost.jpg']})
+        previous.to_csv(dataset_path, index=False)
+        with open(state_path, "w", encoding="utf-8") as file:
+            file.write('{"last_sync": "2024-01-01"}')
+
+        mock_changed_ids.return_value = ['34', '36', '99']
+        mock_resolve_objects.return_value = {'34': 'new.jpg'}
+        try:
+            met = MetMuseum('./data/test_met_objects.csv', run_full_pipeline=False)
+            met.df.loc[self.test_size, 'Object ID'] = '36' # reuse the bad row as object 36
+            met.df.loc[self.test_size, 'Title'] = 'Lost'
+            mock_resolve_objects.return_value['36'] = '' # object 36 no longer has an image
+            merged = met.sync(dataset_path)
+
+            mock_changed_ids.assert_called_once_with('2024-01-01')
+            # only the changed objects that are in the dump were requested
+            url_dict = mock_resolve_objects.call_args[0][0]
+            self.assertEqual(sorted(url_dict.values()), ['34', '36'])
+
+            urls = dict(zip(merged['Object ID'], merged['image_url']))
+            self.assertEqual(urls, {'34': 'new.jpg', '35': 'kept.jpg'})
+            self.assertEqual(len(pd.read_csv(dataset_path)), 2)
+        finally:
+            for path in (dataset_path, state_path):
+                if os.path.exists(path):
+                    os.remove(path)
+
     def test_split_delimited(self):
         """ Tests the split_delimited method """
         met = MetMuseum('./data/test_met_objects.csv', run_full_pipeline=False)
@@ -130,6 +199,107 @@ class MetMuseumTests(unittest.TestCase):
         self.assertEqual(met.df.loc[0, 'Year'], 1847)
         self.assertEqual(met.df.loc[0, 'Description'], 'Description unknown')
 
+    def test_vectorized_cleaning(self):
+        """ Tests the column methods against the per-cell methods they replace """
+        met = MetMuseum('./data/test_met_objects.csv', run_full_pipeline=False)
+        cells = pd.Series([" a | b|c ", "no delimiter", None, 5, "|", "probably Greek, ancient",
+                           "POSSIBLY  French", "possiblyx", ""])
+        pd.testing.assert_series_equal(met.split_delimited_column(cells),
+                                       cells.apply(met.split_delimited))
+        pd.testing.assert_series_equal(met.clean_culture_column(cells),
+                                       cells.apply(met.clean_culture))
+
+    def test_process_data_matches_rowwise(self):
+        """ Tests that the vectorized process_data gives the same output as the row-by-row one """
+        raw = make_met_objects(2000, seed=1)
+        expected = process_data_rowwise(MetMuseum(raw))
+        result = MetMuseum(raw).process_data()
+        # the row-wise .loc assignment upcast Year to object, the values are the same
+        pd.testing.assert_frame_equal(result, expected.astype({'Year': 'int64'}))
+
+    def test_sharded_process_data(self):
+        """ Tests that cleaning in worker processes gives the same output as one process """
+        raw = make_met_objects(2000, seed=2)
+        raw.index = raw.index + 100 # the original index is kept
+        expected = MetMuseum(raw).process_data()
+        result = MetMuseum(raw).process_data(workers=3, shard_rows=300)
+        pd.testing.assert_frame_equal(result, expected)
+
+    @patch('data_aquisition.met_museum.filter_objects')
+    def test_stream_pipeline(self, mock_filter_objects):
+        """ Tests that streaming the file in chunks gives the same objects as loading it whole """
+        raw = make_met_objects(1000, seed=3)
+        raw['Dimensions'] = 'H. 10 in.' # a column the pipeline never reads
+        raw.to_csv('./data/test_met_objects.csv', index=False)
+        # every other object has an image
+        mock_filter_objects.side_effect = lambda df, flag, cache_path=None: df.iloc[::2].assign(
+            image_url=lambda rows: 'https://images.metmuseum.org/' + rows['Object ID'])
+
+        expected = MetMuseum('./data/test_met_objects.csv', run_full_pipeline=True,
+                             save_name='./data/processed_met_objects.csv').df
+        n_saved = stream_pipeline('./data/test_met_objects.csv',
+                                  './data/processed_met_objects.parquet', chunk_rows=300)
+        self.assertEqual(n_saved, len(expected))
+        self.assertEqual(mock_filter_objects.call_count, 1 + 4)
+        self.assertNotIn('Dimensions', mock_filter_objects.call_args[0][0].columns)
+        pd.testing.assert_frame_equal(load_dataset('./data/processed_met_objects.parquet'),
+                                      apply_dtypes(expected.reset_index(drop=True)))
+
+    @patch('data_aquisition.async_utils.resolve', new_callable=AsyncMock)
+    def test_stream_pipeline_journal(self, mock_resolve):
+        """ Tests that the journal is loaded once and one pool shards the larger chunks """
+        journal_path = './data/test_met_journal.jsonl'
+        raw = make_met_objects(600, seed=4)
+        raw.to_csv('./data/test_met_objects.csv', index=False)
+        # the first half was resolved by a previous run
+        journal = ResultJournal(journal_path)
+        journal.append({obj_id: 'https://images.metmuseum.org/' + obj_id
+                        for obj_id in raw['Object ID'][:300]})
+        mock_resolve.side_effect = lambda url_dict, flag, **kwargs: {
+            obj_id: 'https://images.metmuseum.org/' + obj_id for obj_id in url_dict.values()
+        }
+        load = ResultJournal.load
+        try:
+            # chunks of 250, 250 and 100 rows, the last is below the shard floor
+            with patch.object(ResultJournal, 'load', autospec=True,
+                              side_effect=load) as mock_load, \
+                 patch('data_aquisition.met_museum.MIN_SHARD_ROWS', 150), \
+                 patch('data_aquisition.met_museum.ProcessPoolExecutor',
+                       side_effect=ProcessPoolExecutor) as mock_pool, \
+                 patch.object(MetMuseum, '_process_sharded', autospec=True,
+                              side_effect=MetMuseum._process_sharded) as mock_sharded: # pylint: disable=protected-access
+                n_saved = stream_pipeline('./data/test_met_objects.csv',
+                                          './data/processed_met_objects.parquet', chunk_rows=250,
+                                          workers=2, journal_path=journal_path)
+            self.assertEqual(n_saved, 600)
+            mock_load.assert_called_once()
+            requested = [obj_id for call in mock_resolve.call_args_list
+                         for obj_id in call[0][0].values()]
+            self.assertEqual(sorted(requested), sorted(raw['Object ID'][300:]))
+            mock_pool.assert_called_once()
+            (_, _, rows, first), (_, _, _, second) = [call[0] for call in
+                                                      mock_sharded.call_args_list]
+            self.assertEqual(rows, 150)
+            self.assertIsInstance(first, ProcessPoolExecutor)
+            self.assertIs(first, second)
+            self.assertEqual(len(journal.load()), 600)
+        finally:
+            os.remove(journal_path)
+
+    @patch('data_aquisition.met_museum.filter_objects')
+    def test_stream_pipeline_no_objects(self, mock_filter_objects):
+        """ Tests that a stream without objects to save still replaces the previous output """
+        make_met_objects(100, seed=5).to_csv('./data/test_met_objects.csv', index=False)
+        save_path = './data/processed_met_objects.parquet'
+        MetMuseum('./data/test_met_objects.csv').filter_and_save(save_path, process_data=False)
+        mock_filter_objects.side_effect = lambda df, flag, cache_path=None: df.iloc[:0].assign(
+            image_url='')
+
+        self.assertEqual(stream_pipeline('./data/test_met_objects.csv', save_path), 0)
+        saved = load_dataset(save_path)
+        self.assertEqual(len(saved), 0)
+        self.assertIn('Century', saved.columns)
+
     def test_filter_and_save(self):
         """ Tests the filter_and_save method """
         met = MetMuseum('./data/test_met_objects.csv', run_full_pipeline=False)
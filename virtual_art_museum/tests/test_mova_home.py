@@ -8,20 +8,21 @@ This module contains tests for the MoVA homepage functionality including:
     - Filter reset functionality
 """
 import unittest
-from unittest.mock import patch
 import os
 import sys
+import tempfile
 
 import pandas as pd
 import streamlit as st
 
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 from mova_home import ( # pylint: disable=import-error
-    load_blended_cached,
+    load_collection,
     initialize_session_state,
     filter_data,
     reset_filters
 )
+from data_aquisition.storage import save_dataset # pylint: disable=import-error
 
 base_dir = os.path.dirname(os.path.abspath(__file__))
 
@@ -39,50 +40,51 @@ class TestMoVAHome(unittest.TestCase):
             'Repository': ['MET', 'Europeana', 'MET'],
             'image_url': ['url1', 'url2', 'url3']
         })
-
-    @patch('pandas.read_csv')
-    def test_load_blended_cached(self, mock_read_csv):
-        """Test data loading with stratified sampling (70% MET, 30% Europeana)"""
-        # Create mock data for both MET and Europeana
-        met_data = pd.DataFrame({
-            'Title': [f'MET Art {i}' for i in range(7)],
-            'Culture': ['French'] * 7,
-            'Year': [1800 + i * 10 for i in range(7)],
-            'Repository': ['MET'] * 7,
-            'image_url': [f'met_url{i}' for i in range(7)]
-        })
-
-        europeana_data = pd.DataFrame({
-            'Title': [f'Euro Art {i}' for i in range(3)],
-            'Culture': ['Italian'] * 3,
-            'Year': [1900 + i * 10 for i in range(3)],
-            'Repository': ['Europeana'] * 3,
-            'image_url': [f'euro_url{i}' for i in range(3)]
-        })
-
-        # Configure mock to return different data for each call
-        mock_read_csv.side_effect = [met_data, europeana_data]
-
-        # Test with sample_size=10 to match our test data proportions (7 MET, 3 Europeana)
-        result = load_blended_cached('fake_met_path', 'fake_europeana_path', sample_size=10)
-
-        # Verify the results
-        self.assertIsInstance(result, pd.DataFrame)
-        self.assertEqual(len(result), 10)
-
-        # Check repository proportions
-        repo_counts = result['Repository'].value_counts()
-        self.assertEqual(repo_counts['MET'], 7)  # 70%
-        self.assertEqual(repo_counts['Europeana'], 3)  # 30%
-
-        # Verify both paths were read
-        mock_read_csv.assert_called()
-        self.assertEqual(mock_read_csv.call_count, 2)
+        self.tmp_dir = tempfile.TemporaryDirectory() # pylint: disable=consider-using-with
+        met_path = os.path.join(self.tmp_dir.name, 'met.feather')
+        europeana_path = os.path.join(self.tmp_dir.name, 'europeana.parquet')
+        save_dataset(self.test_data[self.test_data['Repository'] == 'MET'], met_path)
+        save_dataset(self.test_data[self.test_data['Repository'] == 'Europeana'], europeana_path)
+        self.collection = load_collection(met_path, europeana_path)
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def test_load_collection(self):
+        """Test that the whole collection is served from both sources"""
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            met_path = os.path.join(tmp_dir, 'met.csv')
+            europeana_path = os.path.join(tmp_dir, 'europeana.csv')
+            met_data = pd.DataFrame({
+                'Title': [f'MET Art {i}' for i in range(70)],
+                'Culture': ['French'] * 70,
+                'Year': [1800 + i for i in range(70)],
+                'Repository': ['MET'] * 70,
+                'image_url': [f'met_url{i}' for i in range(70)]
+            })
+            save_dataset(met_data, met_path)
+            # a columnar sibling of the csv is preferred
+            save_dataset(self.test_data.iloc[[1]], europeana_path.replace('.csv', '.feather'))
+
+            collection = load_collection(met_path, europeana_path)
+            self.assertEqual(len(collection), 71)
+            repo_counts = collection.facet_data['Repository'].value_counts()
+            self.assertEqual(repo_counts['MET'], 70)
+            self.assertEqual(repo_counts['Europeana'], 1)
+            # the csv is converted to Feather once, later loads map it
+            self.assertTrue(os.path.exists(met_path.replace('.csv', '.feather')))
+            self.assertTrue(collection.paths[0].endswith('.feather'))
+
+            # Only the rows asked for are read, with the app columns
+            rows = collection.rows(collection.query(search='art 5'))
+            expected = ['MET Art 5'] + [f'MET Art {i}' for i in range(50, 60)]
+            self.assertEqual(sorted(rows['Title']), expected)
+            self.assertIn('image_url', rows.columns)
 
     def test_initialize_session_state(self):
         """Test session state initialization"""
         # Clear existing session state
-        for key in ['search', 'culture', 'years', 'datasource', 'favorites']:
+        for key in ['search', 'culture', 'years', 'datasource']:
             if key in st.session_state:
                 del st.session_state[key]
 
@@ -92,29 +94,27 @@ class TestMoVAHome(unittest.TestCase):
         self.assertEqual(st.session_state.culture, [])
         self.assertEqual(st.session_state.years, (1800, 2025))
         self.assertIsNone(st.session_state.datasource)
-        self.assertEqual(st.session_state.favorites, [])
 
     def test_filter_data(self):
         """Test data filtering"""
+        def titles(search, culture, years, datasource):
+            positions = filter_data(self.collection, search, culture, years, datasource)
+            return sorted(self.collection.rows(positions)['Title'])
+
         # Test search filter
-        filtered = filter_data(self.test_data, 'Art 1', [], (1700, 2025), None)
-        self.assertEqual(len(filtered), 1)
+        self.assertEqual(titles('Art 1', [], (1700, 2025), None), ['Art 1'])
 
         # Test culture filter
-        filtered = filter_data(self.test_data, '', ['French'], (1700, 2025), None)
-        self.assertEqual(len(filtered), 2)
+        self.assertEqual(titles('', ['French'], (1700, 2025), None), ['Art 1', 'Art 3'])
 
         # Test year filter
-        filtered = filter_data(self.test_data, '', [], (1800, 1900), None)
-        self.assertEqual(len(filtered), 2)
+        self.assertEqual(titles('', [], (1800, 1900), None), ['Art 1', 'Art 2'])
 
         # Test repository filter
-        filtered = filter_data(self.test_data, '', [], (1700, 2025), 'MET')
-        self.assertEqual(len(filtered), 2)
+        self.assertEqual(titles('', [], (1700, 2025), 'MET'), ['Art 1', 'Art 3'])
 
         # Test combined filters
-        filtered = filter_data(self.test_data, 'Art', ['French'], (1800, 1900), 'MET')
-        self.assertEqual(len(filtered), 1)
+        self.assertEqual(titles('Art', ['French'], (1800, 1900), 'MET'), ['Art 1'])
 
     def test_reset_filters(self):
         """Test filter reset"""
@@ -0,0 +1,126 @@
+"""
+Module for testing the rate_limit module and the retry logic in fetch
+
+Tests
+----------
+    test_backoff_delay
+    test_parse_retry_after
+    test_token_bucket
+    test_adaptive_concurrency
+    test_rate_limiter_per_host
+    test_fetch_retries_throttled_request
+    test_fetch_gives_up
+"""
+import asyncio
+import unittest
+from unittest.mock import MagicMock, patch
+
+from data_aquisition.async_utils import fetch # pylint: disable=import-error
+from data_aquisition.rate_limit import ( # pylint: disable=import-error
+    AdaptiveConcurrency,
+    RateLimiter,
+    TokenBucket,
+    backoff_delay,
+    parse_retry_after
+)
+
+def mock_response(status, headers=None, json_data=None):
+    """ Builds a mocked aiohttp response """
+    response = MagicMock()
+    response.status = status
+    response.headers = headers or {}
+
+    async def json():
+        return json_data
+    response.json = json
+    return response
+
+def mock_session(responses):
+    """ Builds a mocked aiohttp session that returns the responses in order """
+    session = MagicMock()
+    contexts = []
+    for response in responses:
+        context = MagicMock()
+        context.__aenter__.return_value = response
+        contexts.append(context)
+    session.get.side_effect = contexts
+    return session
+
+class TestRateLimit(unittest.TestCase):
+    """
+    Test the rate_limit module
+    """
+    def test_backoff_delay(self):
+        """ Delays grow exponentially and never exceed the cap """
+        for attempt in range(10):
+            delay = backoff_delay(attempt, base=1, cap=8)
+            self.assertGreaterEqual(delay, 0)
+            self.assertLessEqual(delay, min(8, 2 ** attempt))
+
+    def test_parse_retry_after(self):
+        """ Both seconds and HTTP dates are understood """
+        self.assertEqual(parse_retry_after("3"), 3.0)
+        self.assertIsNone(parse_retry_after(None))
+        self.assertIsNone(parse_retry_after("soon"))
+        # a date in the past means retry right away
+        self.assertEqual(parse_retry_after("Wed, 21 Oct 2015 07:28:00 GMT"), 0.0)
+
+    def test_token_bucket(self):
+        """ The bucket allows a burst of capacity tokens, then paces at rate """
+        bucket = TokenBucket(rate=10, capacity=2)
+        now = bucket.updated
+        self.assertEqual(bucket.reserve(now), 0)
+        self.assertEqual(bucket.reserve(now), 0)
+        self.assertAlmostEqual(bucket.reserve(now), 0.1)
+        self.assertAlmostEqual(bucket.reserve(now), 0.2)
+
+    def test_adaptive_concurrency(self):
+        """ The limit grows additively on success and halves when throttled """
+        async def exercise():
+            limit = AdaptiveConcurrency(maximum=100, initial=10)
+            for _ in range(10):
+                await limit.acquire()
+            self.assertEqual(limit.in_flight, 10)
+            for _ in range(10):
+                await limit.release()
+            grown = limit.limit
+            await limit.acquire()
+            await limit.release(throttled=True)
+            return grown, limit.limit
+
+        grown, throttled = asyncio.run(exercise())
+        self.assertAlmostEqual(grown, 11, delta=0.1)
+        self.assertAlmostEqual(throttled, grown / 2)
+
+    def test_rate_limiter_per_host(self):
+        """ Each host gets its own limits """
+        limiter = RateLimiter(host_limits={'a.com': (10, 40)}, default_limits=(5, 8))
+        self.assertEqual(limiter.concurrency('https://a.com/1'), 20)
+        self.assertEqual(limiter.concurrency('https://b.com/1'), 4)
+
+    @patch('data_aquisition.async_utils.backoff_delay', return_value=0)
+    def test_fetch_retries_throttled_request(self, _):
+        """ A 429 is retried, honoring Retry-After, and the host backs off """
+        session = mock_session([
+            mock_response(429, headers={'Retry-After': '0'}),
+            mock_response(200, json_data={'primaryImage': 'http://example.com/image.jpg'})
+        ])
+        limiter = RateLimiter()
+        url = "https://collectionapi.metmuseum.org/public/collection/v1/objects/34"
+        before = limiter.concurrency(url)
+
+        result = asyncio.run(fetch(session, url, "MET", limiter=limiter))
+        self.assertEqual(result, 'http://example.com/image.jpg')
+        self.assertEqual(session.get.call_count, 2)
+        self.assertLess(limiter.concurrency(url), before)
+
+    @patch('data_aquisition.async_utils.backoff_delay', return_value=0)
+    def test_fetch_gives_up(self, _):
+        """ fetch returns None, not an empty string, when every attempt fails """
+        session = mock_session([mock_response(503) for _ in range(3)])
+        result = asyncio.run(fetch(session, "https://example.com/1", "EUROPEANA", max_retries=2))
+        self.assertIsNone(result)
+        self.assertEqual(session.get.call_count, 3)
+
+if __name__ == '__main__':
+    unittest.main()
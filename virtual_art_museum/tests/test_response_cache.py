@@ -0,0 +1,109 @@
+"""
+Module for testing the response_cache module and its use inside fetch
+
+Tests
+----------
+    test_put_and_get
+    test_backends_implement_the_interface
+    test_is_fresh
+    test_evict_expired
+    test_conditional_headers
+    test_fetch_uses_fresh_entry
+    test_fetch_revalidates_stale_entry
+"""
+import asyncio
+import os
+import tempfile
+import time
+import unittest
+from unittest.mock import MagicMock
+
+from data_aquisition.async_utils import fetch # pylint: disable=import-error
+from data_aquisition.response_cache import ( # pylint: disable=import-error
+    CacheEntry,
+    ResponseCache,
+    SQLiteResponseCache
+)
+
+class TestResponseCache(unittest.TestCase):
+    """
+    Test the response_cache module
+    """
+    def setUp(self):
+        """ Creates a cache in a temporary directory """
+        self.tmp_dir = tempfile.TemporaryDirectory() # pylint: disable=consider-using-with
+        self.cache = SQLiteResponseCache(os.path.join(self.tmp_dir.name, 'cache.sqlite'),
+                                         ttl=60, max_age=120)
+        self.url = "https://collectionapi.metmuseum.org/public/collection/v1/objects/34"
+
+    def tearDown(self):
+        """ Closes the cache and removes the temporary directory """
+        self.cache.close()
+        self.tmp_dir.cleanup()
+
+    def test_put_and_get(self):
+        """ Stored results and validators are returned by get """
+        self.assertIsNone(self.cache.get(self.url))
+        self.cache.put(self.url, "http://example.com/image.jpg", etag='"abc"')
+        entry = self.cache.get(self.url)
+        self.assertEqual(entry.result, "http://example.com/image.jpg")
+        self.assertEqual(entry.etag, '"abc"')
+        self.assertIsNone(entry.last_modified)
+        self.assertEqual(len(self.cache), 1)
+
+    def test_backends_implement_the_interface(self):
+        """ The base class only describes the interface and cannot be created """
+        self.assertIsInstance(self.cache, ResponseCache)
+        with self.assertRaises(TypeError):
+            ResponseCache() # pylint: disable=abstract-class-instantiated
+
+    def test_is_fresh(self):
+        """ Entries are fresh until the ttl has passed """
+        entry = CacheEntry("url", None, None, time.time())
+        self.assertTrue(self.cache.is_fresh(entry))
+        self.assertFalse(self.cache.is_fresh(entry, now=entry.fetched_at + 61))
+
+    def test_evict_expired(self):
+        """ Entries older than max_age are removed """
+        self.cache.put(self.url, "old")
+        self.cache.put("https://example.com/new", "new")
+        # age the first entry past max_age
+        self.cache._conn.execute('UPDATE responses SET fetched_at = ? WHERE url = ?', # pylint: disable=protected-access
+                                 (time.time() - 500, self.url))
+        self.assertEqual(self.cache.evict_expired(), 1)
+        self.assertIsNone(self.cache.get(self.url))
+        self.assertIsNotNone(self.cache.get("https://example.com/new"))
+
+    def test_conditional_headers(self):
+        """ Validators are turned into conditional request headers """
+        entry = CacheEntry("url", '"abc"', "Wed, 21 Oct 2015 07:28:00 GMT", 0)
+        headers = SQLiteResponseCache.conditional_headers(entry)
+        self.assertEqual(headers['If-None-Match'], '"abc"')
+        self.assertEqual(headers['If-Modified-Since'], "Wed, 21 Oct 2015 07:28:00 GMT")
+        self.assertEqual(SQLiteResponseCache.conditional_headers(None), {})
+
+    def test_fetch_uses_fresh_entry(self):
+        """ A fresh entry is returned without sending a request """
+        self.cache.put(self.url, "http://example.com/image.jpg")
+        session = MagicMock()
+        result = asyncio.run(fetch(session, self.url, "MET", cache=self.cache))
+        self.assertEqual(result, "http://example.com/image.jpg")
+        session.get.assert_not_called()
+
+    def test_fetch_revalidates_stale_entry(self):
+        """ A stale entry is revalidated and reused on a 304 response """
+        self.cache.put(self.url, "http://example.com/image.jpg", etag='"abc"')
+        self.cache.ttl = 0 # everything is stale
+
+        response = MagicMock()
+        response.status = 304
+        session = MagicMock()
+        session.get.return_value.__aenter__.return_value = response
+
+        result = asyncio.run(fetch(session, self.url, "MET", cache=self.cache))
+        self.assertEqual(result, "http://example.com/image.jpg")
+        _, kwargs = session.get.call_args
+        self.assertEqual(kwargs['headers'], {'If-None-Match': '"abc"'})
+
+if __name__ == '__main__':
+    unittest.main()
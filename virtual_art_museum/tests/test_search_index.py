@@ -0,0 +1,92 @@
+"""
+Unit tests for search_index.py
+
+Tests
+----------
+    test_tokenize
+    test_prefix_search
+    test_words_match_within_one_cell
+    test_empty_queries
+    test_facets
+    test_facet_bitmaps_are_bounded
+    test_year_range
+"""
+import unittest
+import os
+import sys
+
+import pandas as pd
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from search_index import FacetIndex, SearchIndex, tokenize # pylint: disable=import-error
+
+class TestSearchIndex(unittest.TestCase):
+    """ Test the SearchIndex class """
+    def setUp(self):
+        """ Set up Test Data """
+        self.data = pd.DataFrame({
+            'Title': ['Portrait of a Woman', 'Art 2', 'Art 1'],
+            'Culture': pd.Categorical(['French', 'Italian', 'French']),
+            'Year': [1800, 1900, 2000],
+        }, index=[10, 5, 7])
+        self.index = SearchIndex(self.data)
+
+    def test_tokenize(self):
+        """ Text is lowercased and split into words """
+        self.assertEqual(tokenize("Portrait of a Woman, 1850!"),
+                         ['portrait', 'of', 'a', 'woman', '1850'])
+        self.assertEqual(tokenize(1800), ['1800'])
+
+    def test_prefix_search(self):
+        """ Every word of a query is matched as a prefix, case insensitive """
+        self.assertEqual(self.index.search('PORTR').tolist(), [0])
+        self.assertEqual(self.index.search('fre').tolist(), [0, 2])
+        self.assertEqual(self.index.search('19').tolist(), [1])
+        self.assertEqual(self.index.search('woman portrait').tolist(), [0])
+        self.assertEqual(self.index.search('trait').tolist(), [])
+
+    def test_words_match_within_one_cell(self):
+        """ All words of a query have to occur in the same cell """
+        self.assertEqual(self.index.search('art 1').tolist(), [2])
+        self.assertEqual(self.index.search('art french').tolist(), [])
+
+    def test_empty_queries(self):
+        """ A query without words matches every row, an empty dataset matches none """
+        self.assertEqual(self.index.search('?!').tolist(), [0, 1, 2])
+        self.assertEqual(len(SearchIndex(self.data.iloc[:0]).search('art')), 0)
+        self.assertEqual(len(self.index), 3)
+
+    def test_facets(self):
+        """ Facet bitmaps select rows by value and combine with AND """
+        facets = FacetIndex(self.data.assign(Repository=['MET', 'Europeana', 'Europeana']))
+        french = facets.facet('Culture', ['French'])
+        self.assertEqual(facets.select([french]).tolist(), [0, 2])
+        self.assertEqual(facets.select([facets.facet('Culture', ['French', 'Italian'])]).tolist(),
+                         [0, 1, 2])
+        europeana = facets.facet('Repository', ['Europeana'])
+        self.assertEqual(facets.select([french, europeana]).tolist(), [2])
+        self.assertEqual(facets.select([facets.facet('Culture', ['Greek'])]).tolist(), [])
+        search = facets.from_positions(self.index.search('art'))
+        self.assertEqual(facets.select([search, europeana]).tolist(), [1, 2])
+        self.assertEqual(facets.select([]).tolist(), [0, 1, 2])
+
+    def test_facet_bitmaps_are_bounded(self):
+        """ Only the most recently used facet value bitmaps are kept """
+        facets = FacetIndex(self.data.assign(Repository=['MET', 'Europeana', 'Europeana']),
+                            cache_size=2)
+        for culture in ['French', 'Italian', 'French', 'Greek']:
+            facets.facet('Culture', [culture])
+        facets.facet('Repository', ['MET'])
+        self.assertEqual(list(facets._bitmaps), # pylint: disable=protected-access
+                         [('Culture', 'French'), ('Repository', 'MET')])
+        self.assertEqual(facets.select([facets.facet('Culture', ['Italian'])]).tolist(), [1])
+
+    def test_year_range(self):
+        """ Year ranges are inclusive on both ends """
+        facets = FacetIndex(self.data.assign(Repository='MET'))
+        self.assertEqual(facets.select([facets.year_range(1800, 1900)]).tolist(), [0, 1])
+        self.assertEqual(facets.select([facets.year_range(1901, 1999)]).tolist(), [])
+        self.assertEqual(facets.select([facets.year_range(2000, 2025)]).tolist(), [2])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,148 @@
+"""
+Module for testing the storage module
+
+Tests
+----------
+    test_parquet_round_trip
+    test_column_projection
+    test_resolve_dataset_path
+    test_convert_dataset
+    test_take_rows
+    test_memory_map_dataset
+    test_read_csv_chunks
+    test_read_csv_chunks_multiline_cells
+    test_dataset_writer
+"""
+import os
+import tempfile
+import unittest
+
+import pandas as pd
+
+from data_aquisition.storage import ( # pylint: disable=import-error
+    DatasetWriter,
+    apply_dtypes,
+    convert_dataset,
+    count_rows,
+    load_dataset,
+    memory_map_dataset,
+    read_csv_chunks,
+    resolve_dataset_path,
+    save_dataset,
+    take_rows
+)
+
+class TestStorage(unittest.TestCase):
+    """
+    Test the storage module
+    """
+    def setUp(self):
+        """ Creates a small dataset and a temporary directory """
+        self.tmp_dir = tempfile.TemporaryDirectory() # pylint: disable=consider-using-with
+        self.df = pd.DataFrame({
+            'Title': ['Art 1', 'Art 2', 'Art 3'],
+            'Culture': ['French', 'Italian', 'French'],
+            'Year': ['1800', '1900', '2000'],
+            'Repository': ['MET', 'Europeana', 'MET'],
+            'image_url': ['url1', 'url2', 'url3']
+        })
+
+    def tearDown(self):
+        """ Removes the temporary directory """
+        self.tmp_dir.cleanup()
+
+    def path(self, name):
+        """ Returns a path inside the temporary directory """
+        return os.path.join(self.tmp_dir.name, name)
+
+    def test_parquet_round_trip(self):
+        """ Parquet and Feather files keep the explicit dtypes """
+        for name in ('data.parquet', 'data.feather'):
+            save_dataset(self.df, self.path(name))
+            loaded = load_dataset(self.path(name))
+            self.assertEqual(loaded['Culture'].dtype, 'category')
+            self.assertEqual(loaded['Repository'].dtype, 'category')
+            self.assertEqual(loaded['Year'].dtype, 'int64')
+            self.assertEqual(loaded['Title'].tolist(), self.df['Title'].tolist())
+
+    def test_column_projection(self):
+        """ Only the requested columns are loaded, unknown columns are ignored """
+        save_dataset(self.df, self.path('data.parquet'))
+        save_dataset(self.df, self.path('data.csv'))
+        for name in ('data.parquet', 'data.csv'):
+            loaded = load_dataset(self.path(name), columns=['Title', 'Year', 'Dimensions'])
+            self.assertEqual(sorted(loaded.columns), ['Title', 'Year'])
+
+    def test_resolve_dataset_path(self):
+        """ A CSV path resolves to its columnar sibling once it exists """
+        csv_path = self.path('data.csv')
+        self.assertEqual(resolve_dataset_path(csv_path), csv_path)
+        save_dataset(self.df, self.path('data.parquet'))
+        self.assertEqual(resolve_dataset_path(csv_path), self.path('data.parquet'))
+
+    def test_convert_dataset(self):
+        """ Converting a CSV writes a Parquet file with the same rows """
+        save_dataset(self.df, self.path('data.csv'))
+        converted = convert_dataset(self.path('data.csv'))
+        self.assertTrue(converted.endswith('.parquet'))
+        self.assertEqual(len(load_dataset(converted)), 3)
+
+    def test_take_rows(self):
+        """ The same rows are read from every format """
+        for name in ('data.parquet', 'data.feather', 'data.csv'):
+            save_dataset(self.df, self.path(name))
+            rows = take_rows(self.path(name), [2, 0], columns=['Title'])
+            self.assertEqual(rows['Title'].tolist(), ['Art 1', 'Art 3'])
+            self.assertEqual(count_rows(self.path(name)), 3)
+
+    def test_memory_map_dataset(self):
+        """ Feather datasets are mapped, not read, and unknown columns are ignored """
+        save_dataset(self.df, self.path('data.feather'))
+        table = memory_map_dataset(self.path('data.feather'), columns=['Title', 'Missing'])
+        self.assertEqual(table.schema.names, ['Title'])
+        self.assertEqual(table.num_rows, 3)
+        self.assertEqual(table.take([1])['Title'].to_pylist(), ['Art 2'])
+
+    def test_read_csv_chunks(self):
+        """ Chunks hold the requested columns as strings and add up to pd.read_csv """
+        df = pd.concat([self.df] * 5, ignore_index=True)
+        df.loc[[1, 7], 'Culture'] = ''
+        df.to_csv(self.path('data.csv'), index=False)
+        chunks = list(read_csv_chunks(self.path('data.csv'), ['Title', 'Culture', 'Dimensions'],
+                                      chunk_rows=4))
+        self.assertEqual([len(chunk) for chunk in chunks], [4, 4, 4, 3])
+
+        streamed = pd.concat(chunks)
+        expected = pd.read_csv(self.path('data.csv'), dtype='str', usecols=['Title', 'Culture'])
+        pd.testing.assert_frame_equal(streamed.isna(), expected.isna())
+        pd.testing.assert_frame_equal(streamed.fillna(''), expected.fillna(''))
+
+    def test_read_csv_chunks_multiline_cells(self):
+        """ Quoted cells spanning lines are read whole, also across parser blocks """
+        df = pd.DataFrame({
+            'Title': [f"Art {i}" for i in range(200)],
+            'Dimensions': [f"H. {i} in.\r\nW. {i} cm" for i in range(200)],
+        })
+        df.to_csv(self.path('data.csv'), index=False)
+        chunks = list(read_csv_chunks(self.path('data.csv'), chunk_rows=64, block_size=128))
+        pd.testing.assert_frame_equal(pd.concat(chunks),
+                                      pd.read_csv(self.path('data.csv'), dtype='str'))
+
+    def test_dataset_writer(self):
+        """ Chunks written one at a time load back as the whole dataset """
+        for name in ('data.parquet', 'data.feather', 'data.csv'):
+            with DatasetWriter(self.path(name)) as writer:
+                writer.write(self.df.iloc[:2])
+                writer.write(self.df.iloc[2:])
+            self.assertEqual(writer.rows, 3)
+            pd.testing.assert_frame_equal(load_dataset(self.path(name)), apply_dtypes(self.df))
+
+            # without chunks the previous file is replaced by an empty one with the columns
+            with DatasetWriter(self.path(name), template=self.df) as writer:
+                pass
+            empty = load_dataset(self.path(name))
+            self.assertEqual(len(empty), 0)
+            self.assertEqual(list(empty.columns), list(self.df.columns))
+
+if __name__ == '__main__':
+    unittest.main()
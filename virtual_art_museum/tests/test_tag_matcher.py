@@ -0,0 +1,57 @@
+"""
+Module for testing the tag_matcher module
+
+Tests
+----------
+    test_matches_substring_search
+    test_overlapping_tags
+    test_word_boundary
+    test_find_many_parallel
+"""
+import random
+import unittest
+
+from data_aquisition.tag_matcher import TagMatcher # pylint: disable=import-error
+
+class TestTagMatcher(unittest.TestCase):
+    """
+    Test the TagMatcher class
+    """
+    def test_matches_substring_search(self):
+        """ The automaton finds exactly the tags a substring test finds, in vocabulary order """
+        rng = random.Random(0)
+        for _ in range(200):
+            tags = [''.join(rng.choice('abA ') for _ in range(rng.randint(0, 4)))
+                    for _ in range(15)]
+            matcher = TagMatcher(tags)
+            for _ in range(10):
+                text = ''.join(rng.choice('abAB c') for _ in range(rng.randint(0, 30)))
+                expected = [tag for tag in tags if tag and tag.lower() in text.lower()]
+                self.assertEqual(matcher.find(text), expected)
+
+    def test_overlapping_tags(self):
+        """ Tags inside other tags and repeated tags are all reported """
+        matcher = TagMatcher(['Women', 'Men', ' men', 'he', 'she', 'hers', None, ''])
+        self.assertEqual(matcher.find("Portrait of two women"), ['Women', 'Men'])
+        self.assertEqual(matcher.find("ushers and men"), ['Men', ' men', 'he', 'she', 'hers'])
+        self.assertEqual(matcher.find(float('nan')), [])
+
+    def test_word_boundary(self):
+        """ With word_boundary, tags no longer match inside other words """
+        matcher = TagMatcher(['Art', 'Men', 'pop art', 'Birds'], word_boundary=True)
+        self.assertEqual(matcher.find("A party for women"), [])
+        self.assertEqual(matcher.find("Pop art, men and birds."),
+                         ['Art', 'Men', 'pop art', 'Birds'])
+        self.assertEqual(matcher.find("art"), ['Art'])
+        self.assertEqual(TagMatcher(['Art']).find("A party"), ['Art'])
+
+    def test_find_many_parallel(self):
+        """ Scanning in worker processes gives the same result as scanning in order """
+        matcher = TagMatcher(['Landscapes', 'Flowers', 'Men'])
+        texts = ["flowers in a landscapes", "women", "nothing"] * 20
+        serial = matcher.find_many(texts)
+        self.assertEqual(serial[:3], [['Landscapes', 'Flowers'], ['Men'], []])
+        self.assertEqual(matcher.find_many(texts, workers=2, chunk_size=7), serial)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,174 @@
+"""
+Unit tests for thumbnails.py
+
+Tests
+----------
+    test_store_resizes_to_every_width
+    test_content_addressed
+    test_fetch_many_fetches_once
+    test_failed_fetch_falls_back_to_source
+    test_urls_fill_in_the_background
+    test_evict_oldest
+    test_remembered_urls_are_bounded
+"""
+import unittest
+import os
+import sys
+import tempfile
+import threading
+from concurrent.futures import wait
+from io import BytesIO
+from unittest.mock import MagicMock, patch
+
+import requests
+from PIL import Image
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from thumbnails import ThumbnailCache # pylint: disable=import-error
+
+def encode_image(width: int, height: int, color=(200, 50, 50)) -> bytes:
+    """ Encodes a solid color JPEG """
+    buffer = BytesIO()
+    Image.new("RGB", (width, height), color).save(buffer, format="JPEG")
+    return buffer.getvalue()
+
+class TestThumbnailCache(unittest.TestCase):
+    """ Test the ThumbnailCache class """
+    def setUp(self):
+        """ Creates a cache whose session serves generated images """
+        self.tmp_dir = tempfile.TemporaryDirectory() # pylint: disable=consider-using-with
+        self.images = {
+            'http://example.com/big.jpg': encode_image(2000, 1000),
+            'http://example.com/small.jpg': encode_image(200, 100, (0, 0, 255)),
+            'http://mirror.example.com/big.jpg': encode_image(2000, 1000),
+        }
+        self.session = MagicMock()
+        self.session.get.side_effect = self.get
+        self.cache = ThumbnailCache(self.tmp_dir.name, base_url='static', widths=(320, 640),
+                                    session=self.session)
+
+    def tearDown(self):
+        self.cache.close()
+        self.tmp_dir.cleanup()
+
+    def get(self, url, timeout=None): # pylint: disable=unused-argument
+        """ Stands in for requests.Session.get """
+        if url not in self.images:
+            raise requests.ConnectionError(f"no route to {url}")
+        response = MagicMock()
+        response.content = self.images[url]
+        return response
+
+    def test_store_resizes_to_every_width(self):
+        """ Thumbnails are made at each width, keeping the aspect ratio, never upscaled """
+        content = self.cache.fetch('http://example.com/big.jpg')
+        for width in (320, 640):
+            with Image.open(self.cache.path(content, width)) as image:
+                self.assertEqual(image.format, 'WEBP')
+                self.assertEqual(image.size, (width, width // 2))
+
+        small = self.cache.fetch('http://example.com/small.jpg')
+        with Image.open(self.cache.path(small, 640)) as image:
+            self.assertEqual(image.size, (200, 100))
+
+        jpeg_cache = ThumbnailCache(self.tmp_dir.name, widths=(320,), image_format='JPEG',
+                                    session=self.session)
+        with Image.open(jpeg_cache.file('http://example.com/big.jpg', 100)) as image:
+            self.assertEqual((image.format, image.size), ('JPEG', (320, 160)))
+
+    def test_content_addressed(self):
+        """ The same image under two urls is stored once """
+        first = self.cache.fetch('http://example.com/big.jpg')
+        second = self.cache.fetch('http://mirror.example.com/big.jpg')
+        self.assertEqual(first, second)
+        thumbnails = [name for name in os.listdir(self.tmp_dir.name) if name.endswith('.webp')]
+        self.assertEqual(len(thumbnails), 2)
+        # a width that is written again is replaced, it does not add to the cache size
+        wider = ThumbnailCache(self.tmp_dir.name, widths=(320, 1280), session=self.session)
+        wider.fetch('http://example.com/big.jpg')
+        wider.close()
+        self.assertEqual(wider._bytes, # pylint: disable=protected-access
+                         sum(os.path.getsize(wider.path(first, width)) for width in (320, 1280)))
+        self.assertEqual(self.cache.url('http://example.com/big.jpg', 300),
+                         f"static/{first}_320.webp")
+        self.assertEqual(self.cache.url('http://example.com/big.jpg', 500),
+                         f"static/{first}_640.webp")
+
+    def test_fetch_many_fetches_once(self):
+        """ Cached urls are not fetched again, also by a new cache over the same directory """
+        urls = list(self.images) * 2
+        contents = self.cache.fetch_many(urls, workers=4)
+        self.assertEqual(set(contents), set(self.images))
+        self.assertEqual(self.session.get.call_count, 3)
+
+        reopened = ThumbnailCache(self.tmp_dir.name, base_url='static', widths=(320, 640),
+                                  session=self.session)
+        self.assertEqual(reopened.fetch_many(urls), contents)
+        self.assertEqual(self.session.get.call_count, 3)
+
+    def test_failed_fetch_falls_back_to_source(self):
+        """ Urls that cannot be fetched or decoded are shown from the source """
+        self.images['http://example.com/broken.jpg'] = b'not an image'
+        urls = ['http://example.com/missing.jpg', 'http://example.com/broken.jpg',
+                'http://example.com/small.jpg']
+        srcs = self.cache.urls(urls, 320, wait=True)
+        self.assertEqual(srcs[:2], urls[:2])
+        self.assertTrue(srcs[2].startswith('static/'))
+        self.assertEqual(self.cache.file(urls[0], 320), urls[0])
+        # failures are not retried straight away
+        self.assertEqual(self.session.get.call_count, 3)
+
+    def test_urls_fill_in_the_background(self):
+        """ Missing thumbnails do not hold up the page, they are served once made """
+        release = threading.Event()
+        self.session.get.side_effect = lambda url, timeout=None: (release.wait(10),
+                                                                  self.get(url))[1]
+        urls = ['http://example.com/big.jpg', 'http://example.com/small.jpg']
+        self.assertEqual(self.cache.urls(urls, 320), urls)
+        # a second rerun before the fetches finish does not start them again
+        futures = self.cache.prefetch(urls)
+        self.assertEqual(len(futures), 2)
+
+        release.set()
+        wait(futures)
+        self.assertEqual(self.session.get.call_count, 2)
+        self.assertTrue(all(src.startswith('static/') for src in self.cache.urls(urls, 320)))
+        self.assertEqual(self.cache.prefetch(urls), [])
+
+    def test_evict_oldest(self):
+        """ Beyond max_bytes the oldest thumbnails are deleted and their urls fetched again """
+        big = self.cache.fetch('http://example.com/big.jpg')
+        for width in (320, 640):
+            os.utime(self.cache.path(big, width), (0, 0))
+        size = sum(os.path.getsize(self.cache.path(big, width)) for width in (320, 640))
+        capped = ThumbnailCache(self.tmp_dir.name, base_url='static', widths=(320, 640),
+                                session=self.session, max_bytes=size + 1)
+        try:
+            small = capped.fetch('http://example.com/small.jpg')
+            self.assertFalse(os.path.exists(self.cache.path(big, 320)))
+            self.assertTrue(os.path.exists(capped.path(small, 320)))
+            self.assertIsNone(capped.content_of('http://example.com/big.jpg'))
+            # its url records are deleted with it, the small image's are kept
+            self.assertFalse(os.path.exists(
+                capped._url_path('http://example.com/big.jpg'))) # pylint: disable=protected-access
+            self.assertTrue(os.path.exists(
+                capped._url_path('http://example.com/small.jpg'))) # pylint: disable=protected-access
+            # the other cache finds its thumbnails gone too
+            self.assertEqual(self.cache.url('http://example.com/big.jpg', 320, fetch=False),
+                             'http://example.com/big.jpg')
+            self.assertEqual(capped.fetch('http://example.com/big.jpg'), big)
+        finally:
+            capped.close()
+
+    def test_remembered_urls_are_bounded(self):
+        """ Only the most recently used urls are kept in memory """
+        with patch('thumbnails.MAX_URL_ENTRIES', 2):
+            for i in range(4):
+                self.cache.fetch(f'http://example.com/missing{i}.jpg')
+            self.cache.fetch_many(self.images)
+        self.assertEqual(list(self.cache._failed), # pylint: disable=protected-access
+                         ['http://example.com/missing2.jpg', 'http://example.com/missing3.jpg'])
+        self.assertEqual(len(self.cache._local), 2) # pylint: disable=protected-access
+
+if __name__ == '__main__':
+    unittest.main()
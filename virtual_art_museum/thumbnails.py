@@ -0,0 +1,466 @@
+"""
+===============================================
+Thumbnails
+===============================================
+
+This module contains the thumbnail cache behind the gallery and popup images.
+
+The gallery used to put the raw image_url of every artwork in an <img> tag. MET
+primaryImage urls point at the full resolution originals, often several megabytes,
+so every browser downloaded each original just to draw a quarter width tile. The
+app now fetches each source image once, resizes it to a few standard widths and
+saves the thumbnails to a directory Streamlit serves as static files. The gallery
+and popup reference the thumbnails, which are tens of kilobytes.
+
+The cache is content addressed: a thumbnail is named after the SHA-256 of the
+source image bytes, so the same image found under several urls (Europeana providers
+often mirror each other) is stored once. A small file per url records which
+content it resolved to, so a cached url is served without touching the network or
+decoding anything, and a file per content lists the urls recorded for it, so
+evicting an image finds its url records without scanning them all.
+
+The gallery never waits on a download: urls missing from the cache are shown from
+their source while a background pool makes their thumbnails, which the next rerun
+serves. The directory is capped at max_bytes, the oldest thumbnails are deleted
+first, and the urls remembered in memory are kept in a bounded LRU.
+
+Static serving must be enabled (server.enableStaticServing in .streamlit/config.toml),
+files under static/ next to the app are then served at app/static/.
+
+References
+----------
+    https://docs.streamlit.io/develop/concepts/configuration/serving-static-files
+
+Classes
+----------
+    ThumbnailCache: Fetches, resizes and stores thumbnails on disk
+
+Authors
+----------
+    Madison Sanchez-Forman and Mya Strayer
+"""
+import hashlib
+import os
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+
+import requests
+from PIL import Image
+
+base_dir = os.path.dirname(os.path.abspath(__file__))
+
+THUMBNAIL_DIR = os.path.join(base_dir, "static", "thumbnails")
+THUMBNAIL_URL = "app/static/thumbnails" # where Streamlit serves THUMBNAIL_DIR
+THUMBNAIL_WIDTHS = (320, 640, 1280)     # gallery tile, high DPI tile, popup
+FORMATS = {'WEBP': '.webp', 'JPEG': '.jpg'}
+QUALITY = 80
+FETCH_TIMEOUT = 10
+FETCH_WORKERS = 16
+RETRY_AFTER = 5 * 60 # seconds before a url that failed is fetched again
+MAX_CACHE_BYTES = 2 << 30  # size of the thumbnail directory, the oldest are deleted beyond it
+EVICT_TO = 0.9             # eviction frees space down to this share of max_bytes
+MAX_URL_ENTRIES = 100000   # urls remembered in memory, as resolved or as failed
+
+def _digest(data) -> str:
+    """ Hex SHA-256 of a str or bytes """
+    if isinstance(data, str):
+        data = data.encode('utf-8')
+    return hashlib.sha256(data).hexdigest()
+
+def _remember(entries: OrderedDict, url: str, value) -> None:
+    """ Records url as the most recently used entry, dropping the least recently used """
+    entries[url] = value
+    entries.move_to_end(url)
+    while len(entries) > MAX_URL_ENTRIES:
+        entries.popitem(last=False)
+
+def _write_atomic(path: str, data: bytes) -> None:
+    """ Writes a file through a temporary file, so readers never see half of it """
+    handle, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path))
+    try:
+        with os.fdopen(handle, 'wb') as file:
+            file.write(data)
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.remove(tmp_path)
+        raise
+
+class ThumbnailCache: # pylint: disable=too-many-instance-attributes
+    """
+    Content addressed on-disk cache of resized images.
+
+    Every source image is fetched once and saved at each of the widths, images
+    narrower than a width are saved at their own size. Safe to share between the
+    sessions of the app, as every file is written atomically.
+
+    Parameters
+    ----------
+    cache_dir : str, optional
+        directory the thumbnails are written to, by default THUMBNAIL_DIR
+    base_url : str, optional
+        url cache_dir is served at, by default THUMBNAIL_URL
+    widths : tuple of int, optional
+        the widths thumbnails are made at, by default THUMBNAIL_WIDTHS
+    image_format : str, optional
+        'WEBP' or 'JPEG', by default 'WEBP'
+    session : requests.Session, optional
+        session used to fetch source images, by default a pooled one is created
+    max_bytes : int, optional
+        size the thumbnails in cache_dir are kept under, by default MAX_CACHE_BYTES
+    """
+    def __init__(self, cache_dir=THUMBNAIL_DIR, base_url=THUMBNAIL_URL, widths=THUMBNAIL_WIDTHS, # pylint: disable=too-many-arguments
+                 image_format='WEBP', session=None, max_bytes=MAX_CACHE_BYTES):
+        if image_format not in FORMATS:
+            raise ValueError(f"image_format must be one of {list(FORMATS)}, got {image_format}")
+        self.cache_dir = cache_dir
+        self.base_url = base_url
+        self.widths = tuple(sorted(widths))
+        self.image_format = image_format
+        self.extension = FORMATS[image_format]
+        # url records are kept per format and set of widths, whose thumbnails they promise
+        self._url_dir = os.path.join(
+            cache_dir, "urls", "_".join([image_format] + [str(width) for width in self.widths]))
+        # content -> the url records resolving to it, one url digest per line
+        self._refs_dir = os.path.join(self._url_dir, "by_content")
+        os.makedirs(self._refs_dir, exist_ok=True)
+
+        if session is None:
+            session = requests.Session()
+            adapter = requests.adapters.HTTPAdapter(pool_connections=FETCH_WORKERS,
+                                                    pool_maxsize=FETCH_WORKERS)
+            session.mount('http://', adapter)
+            session.mount('https://', adapter)
+        self.session = session
+        self._local = OrderedDict()  # url -> content digest, saves a file read per cached url
+        self._failed = OrderedDict() # url -> time of the last failed fetch, so reruns skip it
+        self._pending = {}           # url -> future of its background fetch
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=FETCH_WORKERS,
+                                            thread_name_prefix='thumbnails')
+
+        self.max_bytes = max_bytes
+        self._evict_lock = threading.Lock()
+        self._bytes = sum(size for _, size, _ in self._thumbnail_files())
+
+    def width_for(self, width: int) -> int:
+        """ Returns the smallest standard width at least as wide as width """
+        for standard in self.widths:
+            if standard >= width:
+                return standard
+        return self.widths[-1]
+
+    def filename(self, content: str, width: int) -> str:
+        """ Name of the thumbnail of a source image at a standard width """
+        return f"{content}_{width}{self.extension}"
+
+    def path(self, content: str, width: int) -> str:
+        """ Path of the thumbnail of a source image at a standard width """
+        return os.path.join(self.cache_dir, self.filename(content, width))
+
+    def _url_path(self, url: str) -> str:
+        """ Path of the file recording which content url resolved to """
+        return os.path.join(self._url_dir, _digest(url))
+
+    def content_of(self, url: str):
+        """
+        Looks up the source image of a url in the cache.
+
+        Parameters
+        ----------
+        url (str): The source image url
+
+        Returns
+        -------
+        str: The content digest of the image, None if url was never fetched or its
+             thumbnails were evicted
+        """
+        with self._lock:
+            content = self._local.get(url)
+            if content is not None:
+                self._local.move_to_end(url)
+        if content is None:
+            try:
+                with open(self._url_path(url), "r", encoding="utf-8") as file:
+                    content = file.read().strip()
+            except OSError:
+                return None
+            with self._lock:
+                _remember(self._local, url, content)
+        if not os.path.exists(self.path(content, self.widths[0])):
+            with self._lock:
+                self._local.pop(url, None)
+            return None
+        return content
+
+    def store(self, url: str, data: bytes) -> str:
+        """
+        Resizes a source image to every width and records url as resolving to it.
+
+        Parameters
+        ----------
+        url (str): The url the image was fetched from
+        data (bytes): The encoded source image
+
+        Returns
+        -------
+        str: The content digest of the image
+        """
+        content = _digest(data)
+        if not all(os.path.exists(self.path(content, width)) for width in self.widths):
+            with Image.open(BytesIO(data)) as image:
+                # let JPEG decode straight at a reduced scale, the big saving on MET originals
+                image.draft('RGB', (self.widths[-1], self.widths[-1] * image.height // image.width))
+                image = image.convert('RGB')
+                # resize largest first, each width is made from the previous one
+                for width in reversed(self.widths):
+                    if image.width > width:
+                        height = max(1, round(image.height * width / image.width))
+                        image = image.resize((width, height), Image.Resampling.LANCZOS)
+                    buffer = BytesIO()
+                    image.save(buffer, format=self.image_format, quality=QUALITY)
+                    path = self.path(content, width)
+                    # a width written before (e.g. by another session) is replaced, not added
+                    replaced = os.path.getsize(path) if os.path.exists(path) else 0
+                    _write_atomic(path, buffer.getvalue())
+                    with self._lock:
+                        self._bytes += buffer.tell() - replaced
+        _write_atomic(self._url_path(url), content.encode('utf-8'))
+        with open(os.path.join(self._refs_dir, content), "a", encoding="utf-8") as file:
+            file.write(_digest(url) + "\n")
+        with self._lock:
+            _remember(self._local, url, content)
+            over = self._bytes > self.max_bytes
+        if over:
+            self.evict()
+        return content
+
+    def fetch(self, url: str):
+        """
+        Makes sure the thumbnails of a url are cached, fetching the image if needed.
+
+        Parameters
+        ----------
+        url (str): The source image url
+
+        Returns
+        -------
+        str: The content digest of the image, None if it could not be fetched or decoded
+        """
+        content = self.content_of(url)
+        if content is not None:
+            return content
+        with self._lock:
+            failed_at = self._failed.get(url)
+        if failed_at is not None and time.time() - failed_at < RETRY_AFTER:
+            return None
+        try:
+            response = self.session.get(url, timeout=FETCH_TIMEOUT)
+            response.raise_for_status()
+            return self.store(url, response.content)
+        except (requests.RequestException, OSError, ValueError) as e:
+            print(f"Failed to make thumbnail for {url}: {e}")
+            with self._lock:
+                _remember(self._failed, url, time.time())
+            return None
+
+    def fetch_many(self, urls, workers: int = FETCH_WORKERS) -> dict:
+        """
+        Fetches the images of many urls concurrently, skipping cached ones.
+
+        Parameters
+        ----------
+        urls (iterable of str): The source image urls
+        workers (int): Number of threads fetching at once
+
+        Returns
+        -------
+        dict: url -> content digest, None for urls that failed
+        """
+        urls = list(dict.fromkeys(url for url in urls if isinstance(url, str) and url))
+        contents = {url: self.content_of(url) for url in urls}
+        missing = [url for url, content in contents.items() if content is None]
+        if missing:
+            with ThreadPoolExecutor(max_workers=max(1, min(workers, len(missing)))) as executor:
+                contents.update(zip(missing, executor.map(self.fetch, missing)))
+        return contents
+
+    def prefetch(self, urls) -> list:
+        """
+        Starts fetching the images of urls in the background, skipping cached ones.
+
+        Parameters
+        ----------
+        urls (iterable of str): The source image urls
+
+        Returns
+        -------
+        list: The futures of the fetches, one per url that was not cached yet
+        """
+        futures = []
+        for url in dict.fromkeys(url for url in urls if isinstance(url, str) and url):
+            if self.content_of(url) is not None:
+                continue
+            with self._lock:
+                # a url already being fetched, e.g. for another session, is not fetched twice
+                future = self._pending.get(url)
+                if future is None:
+                    future = self._executor.submit(self._fetch_pending, url)
+                    self._pending[url] = future
+            futures.append(future)
+        return futures
+
+    def _fetch_pending(self, url: str):
+        """ Runs a background fetch, then forgets it was pending """
+        try:
+            return self.fetch(url)
+        finally:
+            with self._lock:
+                self._pending.pop(url, None)
+
+    def close(self) -> None:
+        """ Waits for the background fetches and stops the pool """
+        self._executor.shutdown(wait=True)
+
+    def _thumbnail_files(self) -> list:
+        """ (modification time, size, content) of the thumbnails in cache_dir this cache makes """
+        names = {str(width) + self.extension for width in self.widths}
+        files = []
+        with os.scandir(self.cache_dir) as entries:
+            for entry in entries:
+                content, _, name = entry.name.rpartition('_')
+                if name in names and entry.is_file():
+                    stat = entry.stat()
+                    files.append((stat.st_mtime, stat.st_size, content))
+        return files
+
+    def evict(self) -> int:
+        """
+        Deletes the oldest thumbnails until cache_dir is back under max_bytes.
+
+        Space is freed down to EVICT_TO of max_bytes, so eviction runs once per many
+        stores. Every width of an image is deleted together, along with the url
+        records that resolved to it, and urls of evicted images are fetched again.
+
+        Returns
+        -------
+        int: Number of source images whose thumbnails were deleted
+        """
+        if not self._evict_lock.acquire(blocking=False): # pylint: disable=consider-using-with
+            return 0 # another thread is already evicting
+        try:
+            files = self._thumbnail_files()
+            total = sum(size for _, size, _ in files)
+            # an image is as old as its newest thumbnail
+            images = {}
+            for mtime, size, content in files:
+                newest, image_size = images.get(content, (0, 0))
+                images[content] = (max(newest, mtime), image_size + size)
+            evicted = set()
+            for content, (_, size) in sorted(images.items(), key=lambda item: item[1][0]):
+                if total <= self.max_bytes * EVICT_TO:
+                    break
+                for width in self.widths:
+                    try:
+                        os.remove(self.path(content, width))
+                    except OSError:
+                        pass
+                total -= size
+                evicted.add(content)
+            self._forget(evicted)
+            with self._lock:
+                self._bytes = total
+            return len(evicted)
+        finally:
+            self._evict_lock.release()
+
+    def _forget(self, contents: set) -> None:
+        """ Deletes the url records, on disk and in memory, that resolve to contents """
+        if not contents:
+            return
+        for content in contents:
+            refs = os.path.join(self._refs_dir, content)
+            try:
+                with open(refs, "r", encoding="utf-8") as file:
+                    digests = file.read().split()
+                os.remove(refs)
+            except OSError:
+                continue
+            for digest in digests:
+                record = os.path.join(self._url_dir, digest)
+                try:
+                    with open(record, "r", encoding="utf-8") as file:
+                        # the url may have been stored again since, with other content
+                        if file.read().strip() == content:
+                            os.remove(record)
+                except OSError:
+                    pass
+        with self._lock:
+            for url in [url for url, content in self._local.items() if content in contents]:
+                del self._local[url]
+
+    def file(self, url: str, width: int, fetch: bool = True) -> str:
+        """
+        Returns the path of a thumbnail, e.g. for st.image, which reads local files.
+
+        Parameters
+        ----------
+        url (str): The source image url
+        width (int): Width the image is shown at, rounded up to a standard width
+        fetch (bool): Fetch the image if it is not cached yet
+
+        Returns
+        -------
+        str: The thumbnail path, or the source url if no thumbnail could be made
+        """
+        content = self.fetch(url) if fetch else self.content_of(url)
+        if content is None:
+            return url
+        return self.path(content, self.width_for(width))
+
+    def url(self, url: str, width: int, fetch: bool = True) -> str:
+        """
+        Returns the url of a thumbnail to show instead of a source image.
+
+        Parameters
+        ----------
+        url (str): The source image url
+        width (int): Width the image is shown at, rounded up to a standard width
+        fetch (bool): Fetch the image if it is not cached yet
+
+        Returns
+        -------
+        str: The thumbnail url, or the source url if no thumbnail could be made
+        """
+        content = self.fetch(url) if fetch else self.content_of(url)
+        if content is None:
+            return url
+        return f"{self.base_url}/{self.filename(content, self.width_for(width))}"
+
+    def urls(self, urls, width: int, wait: bool = False) -> list:
+        """
+        Returns thumbnail urls for a list of source urls.
+
+        Missing thumbnails are made in the background, so a page renders straight
+        away with the source urls in their place and the next rerun shows them.
+
+        Parameters
+        ----------
+        urls (list of str): The source image urls, e.g. one gallery page
+        width (int): Width the images are shown at
+        wait (bool): Fetch missing images concurrently and wait for them instead
+
+        Returns
+        -------
+        list: One url per source url, the source url where there is no thumbnail yet
+        """
+        urls = list(urls)
+        if wait:
+            self.fetch_many(urls)
+        else:
+            self.prefetch(urls)
+        return [self.url(url, width, fetch=False) if isinstance(url, str) else url
+                for url in urls]